@@ -1,17 +1,244 @@
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
 import httpx
-from typing import Dict, Any, List, Tuple, Optional
+import importlib.util
+import json
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Callable, List, Tuple, Optional
+
+# Connection pool settings used when ollama.http_pool doesn't override them
+DEFAULT_HTTP_POOL = {
+    "max_connections": 20,
+    "max_keepalive_connections": 10,
+    "keepalive_expiry": 60,
+    "connect_timeout": 10,
+    "http2": False
+}
+
+# Shared HTTP client for all Ollama calls, created on first use
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _http_pool_settings() -> Dict[str, Any]:
+    """HTTP pool settings from ``ollama.http_pool`` in the config, with defaults"""
+    pool_config = {}
+    try:
+        from app.core.config import settings
+        pool_config = settings.config["ollama"].get("http_pool", {})
+    except Exception:
+        pass
+    return {**DEFAULT_HTTP_POOL, **pool_config}
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get the shared keep-alive client, creating it on first use"""
+    global _http_client
+
+    if _http_client is None or _http_client.is_closed:
+        pool = _http_pool_settings()
+
+        # HTTP/2 needs the optional h2 package and is only negotiated over TLS
+        http2 = bool(pool["http2"]) and importlib.util.find_spec("h2") is not None
+
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=pool["max_connections"],
+                max_keepalive_connections=pool["max_keepalive_connections"],
+                keepalive_expiry=pool["keepalive_expiry"]
+            ),
+            timeout=httpx.Timeout(None, connect=pool["connect_timeout"]),
+            http2=http2
+        )
+
+    return _http_client
+
+
+def _request_timeout(seconds: float) -> httpx.Timeout:
+    """Per-request timeout that keeps the pool's connect timeout
+
+    A bare number passed as ``timeout=`` would replace the client's whole
+    timeout, connect phase included.
+    """
+    return httpx.Timeout(seconds, connect=_http_pool_settings()["connect_timeout"])
+
+
+async def close_http_client():
+    """Close the shared client and its pooled connections"""
+    global _http_client
+
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+@asynccontextmanager
+async def lifespan(server: FastMCP):
+    """Close pooled Ollama connections when the server shuts down"""
+    try:
+        yield {}
+    finally:
+        await close_http_client()
+
 
 # Initialize MCP server
-mcp = FastMCP(name="OMOP LLM MCP Server")
+mcp = FastMCP(name="OMOP LLM MCP Server", lifespan=lifespan)
+
+
+class SQLStatementDetector:
+    """Incrementally finds the first complete SQL statement in streamed LLM output
+
+    Feed tokens as they arrive; ``feed`` returns True once a statement is
+    complete, i.e. a semicolon outside quotes, comments and parentheses, or
+    the closing fence of a markdown code block. Prose before an opening
+    fence is discarded. Two characters are held back on each feed so
+    multi-character markers split across tokens (```, --, /*) are seen whole.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._start = 0
+        self._end: Optional[int] = None
+        self._fenced = False
+        self._quote: Optional[str] = None
+        self._comment: Optional[str] = None
+        self._depth = 0
+        self._has_sql = False
+
+    @property
+    def complete(self) -> bool:
+        """Whether a complete statement has been seen"""
+        return self._end is not None
+
+    @property
+    def statement(self) -> str:
+        """The statement found so far, without surrounding fences or whitespace"""
+        end = self._end if self._end is not None else len(self.text)
+        statement = self.text[self._start:end].strip()
+        if statement.endswith("```"):
+            statement = statement[:-3].rstrip()
+        return statement
+
+    def feed(self, token: str) -> bool:
+        """Add a token and report whether the statement is complete"""
+        self.text += token
+        self._scan(len(self.text) - 2, final=False)
+        return self.complete
+
+    def finish(self) -> str:
+        """Scan any held-back text at the end of generation and return the statement"""
+        self._scan(len(self.text), final=True)
+        return self.statement
+
+    def _scan(self, limit: int, final: bool):
+        text = self.text
+        while self._pos < limit and self._end is None:
+            i = self._pos
+            ch = text[i]
+
+            # Fences win over quote state, since prose like "Here's" opens a quote
+            if text.startswith("```", i):
+                if self._fenced:
+                    self._end = i
+                    return
+
+                newline = text.find("\n", i + 3)
+                if newline == -1:
+                    if not final:
+                        return  # Wait for the rest of the language tag line
+                    newline = len(text) - 1
+                self._fenced = True
+                self._start = newline + 1
+                self._quote = self._comment = None
+                self._depth = 0
+                self._has_sql = False
+                self._pos = newline + 1
+                continue
+
+            if self._comment == "--":
+                if ch == "\n":
+                    self._comment = None
+            elif self._comment == "/*":
+                if text.startswith("*/", i):
+                    self._comment = None
+                    i += 1
+            elif self._quote:
+                if ch == self._quote:
+                    self._quote = None
+            elif text.startswith("--", i):
+                self._comment = "--"
+                i += 1
+            elif text.startswith("/*", i):
+                self._comment = "/*"
+                i += 1
+            elif ch == ";":
+                if self._depth == 0 and self._has_sql:
+                    self._end = i + 1
+            elif not ch.isspace():
+                self._has_sql = True
+                if ch in ("'", '"'):
+                    self._quote = ch
+                elif ch == "(":
+                    self._depth += 1
+                elif ch == ")":
+                    self._depth = max(0, self._depth - 1)
+
+            self._pos = i + 1
+
+
+async def _stream_completion(api_url: str, request: Dict[str, Any], timeout: float,
+                             ctx: Optional[Context] = None,
+                             stop: Optional[Callable[[str], bool]] = None) -> str:
+    """Run an Ollama generation in streaming mode, relaying tokens as they arrive
+
+    Ollama streams NDJSON objects, each carrying the next piece of text in
+    ``response``. Every non-empty piece is forwarded as an MCP progress
+    message when a request context is available. If ``stop`` returns True
+    for a token, the response is closed straight away, which makes Ollama
+    abort the rest of the generation.
+
+    Returns:
+        The generated text up to the point generation finished or was stopped
+    """
+    parts: List[str] = []
+    client = get_http_client()
+
+    async with client.stream("POST", api_url, json={**request, "stream": True},
+                             timeout=_request_timeout(timeout)) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+
+            chunk = json.loads(line)
+            if "error" in chunk:
+                raise Exception(chunk["error"])
+
+            token = chunk.get("response", "")
+            if token:
+                parts.append(token)
+                if ctx is not None:
+                    await ctx.report_progress(len(parts), message=token)
+                if stop is not None and stop(token):
+                    break
+
+            if chunk.get("done"):
+                break
+
+    return "".join(parts)
 
 
 # Get configuration
 def get_config():
     from app.core.config import settings
+    api_url = settings.config["ollama"]["api_url"]
     return {
-        "api_url": settings.config["ollama"]["api_url"],
-        "default_model": settings.config["ollama"]["default_model"]
+        "api_url": api_url,
+        "embeddings_url": settings.config["ollama"].get(
+            "embeddings_url", api_url.rsplit("/", 1)[0] + "/embeddings"
+        ),
+        "default_model": settings.config["ollama"]["default_model"],
+        "embedding_model": settings.config["ollama"].get("embedding_model", "nomic-embed-text"),
+        "early_stop_sql": settings.config["ollama"].get("early_stop_sql", True)
     }
 
 
@@ -19,8 +246,8 @@ def get_config():
     name="Generate_SQL",
     description="Generate SQL from natural language using an LLM"
 )
-async def generate_sql(prompt: str, schema: str, model_name: str = None, system_prompt: str = None) -> Tuple[
-    str, float]:
+async def generate_sql(prompt: str, schema: str, model_name: str = None, system_prompt: str = None,
+                       stream: bool = False, ctx: Context = None) -> Tuple[str, float]:
     """Generate SQL from natural language using Ollama
 
     Args:
@@ -28,6 +255,8 @@ async def generate_sql(prompt: str, schema: str, model_name: str = None, system_
         schema: Database schema information
         model_name: Optional model name override
         system_prompt: Optional system prompt override
+        stream: Relay generated tokens as progress messages while generating
+        ctx: MCP request context used to send progress messages
 
     Returns:
         Tuple of (generated SQL query, confidence score)
@@ -69,27 +298,36 @@ Follow these important guidelines for OMOP CDM:
     }
 
     try:
-        # Use httpx for async HTTP requests
-        async with httpx.AsyncClient() as client:
-            response = await client.post(config["api_url"], json=ollama_request, timeout=240)
+        if config["early_stop_sql"]:
+            # Stop the model as soon as it has emitted one complete statement
+            detector = SQLStatementDetector()
+            await _stream_completion(config["api_url"], ollama_request, 240, ctx if stream else None,
+                                     stop=detector.feed)
+            sql_query = detector.finish()
+        elif stream:
+            sql_query = (await _stream_completion(config["api_url"], ollama_request, 240, ctx)).strip()
+        else:
+            # Reuse the shared keep-alive client
+            client = get_http_client()
+            response = await client.post(config["api_url"], json=ollama_request, timeout=_request_timeout(240))
             response.raise_for_status()
 
             # Extract the generated response
             result = response.json()
             sql_query = result["response"].strip()
 
-            # Clean up the SQL (in case it's wrapped in markdown code blocks)
-            if sql_query.startswith("```") and sql_query.endswith("```"):
-                # Extract SQL from markdown code block
-                sql_query = sql_query.split("```")[1]
-                if sql_query.startswith("sql"):
-                    sql_query = sql_query[3:].strip()
+        # Clean up the SQL (in case it's wrapped in markdown code blocks)
+        if sql_query.startswith("```") and sql_query.endswith("```"):
+            # Extract SQL from markdown code block
+            sql_query = sql_query.split("```")[1]
+            if sql_query.startswith("sql"):
+                sql_query = sql_query[3:].strip()
 
-            # Default confidence value
-            confidence = 0.9
+        # Default confidence value
+        confidence = 0.9
 
-            # Return tuple
-            return sql_query, confidence
+        # Return tuple
+        return sql_query, confidence
 
     except Exception as e:
         raise Exception(f"Failed to generate SQL: {str(e)}")
@@ -130,10 +368,10 @@ Explain in 2-3 sentences what clinical question this query answers and how it us
     }
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(config["api_url"], json=explanation_request, timeout=120)
-            response.raise_for_status()
-            return response.json()["response"].strip()
+        client = get_http_client()
+        response = await client.post(config["api_url"], json=explanation_request, timeout=_request_timeout(120))
+        response.raise_for_status()
+        return response.json()["response"].strip()
     except Exception as e:
         return f"Error generating explanation: {str(e)}"
 
@@ -142,13 +380,16 @@ Explain in 2-3 sentences what clinical question this query answers and how it us
     name="Generate_Answer",
     description="Generate a natural language answer based on query, SQL, and results"
 )
-async def generate_answer(question: str, sql_query: str, results: str) -> str:
+async def generate_answer(question: str, sql_query: str, results: str, stream: bool = False,
+                          ctx: Context = None) -> str:
     """Generate a natural language answer to the original question
 
     Args:
         question: Original natural language question
         sql_query: SQL query that was executed
         results: Results from the query execution (CSV format)
+        stream: Relay answer tokens as progress messages while generating
+        ctx: MCP request context used to send progress messages
 
     Returns:
         Natural language answer
@@ -182,14 +423,47 @@ Explain the insights from the data in a way that would be understandable to heal
     }
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(config["api_url"], json=answer_request, timeout=240)
-            response.raise_for_status()
-            return response.json()["response"].strip()
+        if stream:
+            return (await _stream_completion(config["api_url"], answer_request, 240, ctx)).strip()
+
+        client = get_http_client()
+        response = await client.post(config["api_url"], json=answer_request, timeout=_request_timeout(240))
+        response.raise_for_status()
+        return response.json()["response"].strip()
     except Exception as e:
         return f"Error generating answer: {str(e)}"
 
 
+@mcp.tool(
+    name="Generate_Embedding",
+    description="Generate an embedding vector for a piece of text"
+)
+async def generate_embedding(text: str, model_name: str = None) -> List[float]:
+    """Generate an embedding vector using Ollama
+
+    Args:
+        text: Text to embed
+        model_name: Optional embedding model override
+
+    Returns:
+        Embedding vector
+    """
+    config = get_config()
+
+    embedding_request = {
+        "model": model_name or config["embedding_model"],
+        "prompt": text
+    }
+
+    try:
+        client = get_http_client()
+        response = await client.post(config["embeddings_url"], json=embedding_request, timeout=_request_timeout(30))
+        response.raise_for_status()
+        return response.json()["embedding"]
+    except Exception as e:
+        raise Exception(f"Failed to generate embedding: {str(e)}")
+
+
 @mcp.tool(
     name="List_Available_Models",
     description="List available LLM models from Ollama"
@@ -201,10 +475,10 @@ async def list_available_models() -> List[Dict[str, Any]]:
         List of available models
     """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get("http://localhost:11434/api/tags", timeout=10)
-            response.raise_for_status()
-            return response.json().get("models", [])
+        client = get_http_client()
+        response = await client.get("http://localhost:11434/api/tags", timeout=_request_timeout(10))
+        response.raise_for_status()
+        return response.json().get("models", [])
     except Exception as e:
         raise Exception(f"Error listing models: {str(e)}")
 
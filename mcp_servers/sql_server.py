@@ -1,96 +1,862 @@
-from mcp.server.fastmcp import FastMCP
-from typing import Dict, Any, List, Tuple, Optional
+from mcp.server.fastmcp import Context, FastMCP
+from typing import Dict, Any, List, Tuple, Optional, Union
+import asyncio
+import base64
+import datetime
+import decimal
+import hashlib
 import json
+import math
+import os
+import re
+import tempfile
+import threading
 import time
-from sqlalchemy import create_engine, text
+from collections import OrderedDict
+from sqlalchemy import create_engine, make_url, text
+from sqlalchemy.ext.asyncio import create_async_engine
 
 # Initialize MCP server
 mcp = FastMCP(name="OMOP SQL MCP Server")
 
-# Internal state
-_db_engines = {}
+# Internal state: pooled engines keyed by connection string, least recently used first
+_db_engines: "OrderedDict[str, Any]" = OrderedDict()
+_db_engines_lock = threading.Lock()
+
+# Async engines keyed by the original connection string; None marks "no async driver"
+_async_engines: "OrderedDict[str, Any]" = OrderedDict()
+
+# Per-connection limits on concurrently running queries
+_query_slots: Dict[str, asyncio.Semaphore] = {}
+
+# Pool settings used when database.engine doesn't override them
+DEFAULT_ENGINE_SETTINGS = {
+    "max_engines": 8,
+    "pool_size": 5,
+    "max_overflow": 10,
+    "pool_pre_ping": True,
+    "pool_recycle": 1800,
+    "async_execution": True,
+    "max_concurrent_queries": 10
+}
+
+# Async drivers for dialects that have one; others run in worker threads
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite"
+}
+
+# Dialects whose default pools don't accept pool_size/max_overflow
+EMBEDDED_DIALECTS = ("duckdb", "sqlite")
+
+# Result formats supported by Execute_SQL_Query
+OUTPUT_FORMATS = ("csv", "json", "arrow", "arrow_file")
+
+# arrow_file results older than this are deleted, overridable under database.result_file_ttl
+DEFAULT_RESULT_FILE_TTL = 3600
+RESULT_FILE_PREFIX = "omcp_result_"
+RESULT_SWEEP_INTERVAL = 60
+_last_result_sweep = 0.0
+
+# EXPLAIN prefixes for dialects whose plans carry row/cost estimates
+EXPLAIN_STATEMENTS = {
+    "postgresql": "EXPLAIN (FORMAT JSON) ",
+    "duckdb": "EXPLAIN (FORMAT JSON) "
+}
+
+# Cardinality estimate in the text extra info of older DuckDB JSON plans: "EC: 1234"
+_DUCKDB_ESTIMATE = re.compile(r"EC:\s*([\d,]+)")
+
+# Statements that make a query unsafe to hand to EXPLAIN or to run read-only
+_WRITE_KEYWORDS = re.compile(
+    r"\b(insert|update|delete|merge|drop|alter|create|truncate|grant|revoke|copy|call|into|lock|vacuum)\b"
+)
 
+# Python value types mapped to portable column type names (bool before int)
+_COLUMN_TYPES = [
+    (bool, "boolean"),
+    (int, "integer"),
+    ((float, decimal.Decimal), "float"),
+    (datetime.datetime, "datetime"),
+    (datetime.date, "date"),
+    (datetime.time, "time"),
+    ((bytes, bytearray, memoryview), "binary"),
+]
+
+# Rendered schema prompt, invalidated when the schema file changes
+_schema_cache: Dict[str, Any] = {"file_key": None, "hash": None, "text": None}
+_schema_cache_stats = {"hits": 0, "misses": 0}
+
+
+def _engine_settings() -> Dict[str, Any]:
+    """Engine pool settings from ``database.engine`` in the config, with defaults"""
+    engine_config = {}
+    try:
+        from app.core.config import settings
+        engine_config = settings.config.get("database", {}).get("engine", {})
+    except Exception:
+        pass
+    return {**DEFAULT_ENGINE_SETTINGS, **engine_config}
+
+
+def _create_pooled_engine(connection_string: str, engine_config: Dict[str, Any]):
+    """Create an engine with the configured pool settings"""
+    options = {
+        "pool_pre_ping": engine_config["pool_pre_ping"],
+        "pool_recycle": engine_config["pool_recycle"]
+    }
+
+    # Embedded databases use single-connection pools that reject sizing options
+    if not connection_string.startswith(EMBEDDED_DIALECTS):
+        options["pool_size"] = engine_config["pool_size"]
+        options["max_overflow"] = engine_config["max_overflow"]
+
+    return create_engine(connection_string, **options)
 
-def get_db_engine(connection_id: Optional[str] = None, connection_string: Optional[str] = None):
-    """Get or create a database engine"""
-    global _db_engines
 
+def _resolve_connection_string(connection_id: Optional[str] = None, connection_string: Optional[str] = None) -> str:
+    """Resolve a connection ID from the config, unless a direct string is given"""
     if connection_string:
-        # Create a temporary engine for one-time use
-        return create_engine(connection_string)
+        return connection_string
 
-    # Use a connection from the config
     conn_id = connection_id or "default"
+    try:
+        from app.core.config import settings
+        return settings.get_db_connection_string(conn_id)
+    except Exception as e:
+        raise Exception(f"Failed to create engine for {conn_id}: {e}")
+
+
+def get_db_engine(connection_id: Optional[str] = None, connection_string: Optional[str] = None):
+    """Get or create a pooled database engine
+
+    Engines are kept in a registry keyed by connection string, so ad-hoc
+    connection strings reuse warm connections just like configured ones.
+    The registry holds at most ``max_engines`` engines and disposes the
+    least recently used one when full.
+    """
+    conn_string = _resolve_connection_string(connection_id, connection_string)
 
-    if conn_id not in _db_engines:
+    with _db_engines_lock:
+        engine = _db_engines.get(conn_string)
+        if engine is not None:
+            _db_engines.move_to_end(conn_string)
+            return engine
+
+        engine_config = _engine_settings()
+        engine = _create_pooled_engine(conn_string, engine_config)
+        _db_engines[conn_string] = engine
+
+        while len(_db_engines) > engine_config["max_engines"]:
+            _, evicted = _db_engines.popitem(last=False)
+            evicted.dispose()
+
+    return engine
+
+
+def _discard_engine(connection_string: str):
+    """Remove an engine from the registry and close its pool"""
+    with _db_engines_lock:
+        engine = _db_engines.pop(connection_string, None)
+    if engine is not None:
+        engine.dispose()
+
+
+def _async_engine_args(connection_string: str) -> Optional[Tuple[Any, Dict[str, Any]]]:
+    """Translate a sync connection string into an async driver URL and connect args
+
+    asyncpg doesn't understand libpq's ``options=-c key=value`` parameter, so
+    those settings are passed as ``server_settings`` instead.
+
+    Returns:
+        ``(url, connect_args)``, or None if the dialect has no async driver
+    """
+    url = make_url(connection_string)
+    async_driver = ASYNC_DRIVERS.get(url.drivername)
+    if async_driver is None:
+        return None
+
+    connect_args: Dict[str, Any] = {}
+    options = url.query.get("options")
+    if async_driver == "postgresql+asyncpg" and options:
+        server_settings = {}
+        for option in options.split("-c"):
+            key, _, value = option.strip().partition("=")
+            if key:
+                server_settings[key] = value
+        connect_args["server_settings"] = server_settings
+        url = url.difference_update_query(["options"])
+
+    return url.set(drivername=async_driver), connect_args
+
+
+async def get_async_db_engine(connection_string: str):
+    """Get or create a pooled async engine for a connection string
+
+    Uses the same pool settings and ``max_engines`` bound as the sync
+    registry. Returns None when async execution is disabled or the dialect
+    (e.g. DuckDB) or its driver isn't available, in which case callers fall
+    back to running the sync engine in a worker thread.
+    """
+    if connection_string in _async_engines:
+        _async_engines.move_to_end(connection_string)
+        return _async_engines[connection_string]
+
+    engine_config = _engine_settings()
+    engine = None
+    if engine_config["async_execution"]:
+        engine_args = _async_engine_args(connection_string)
+        if engine_args is not None:
+            url, connect_args = engine_args
+            options = {
+                "pool_pre_ping": engine_config["pool_pre_ping"],
+                "pool_recycle": engine_config["pool_recycle"],
+                "connect_args": connect_args
+            }
+            if not url.drivername.startswith(EMBEDDED_DIALECTS):
+                options["pool_size"] = engine_config["pool_size"]
+                options["max_overflow"] = engine_config["max_overflow"]
+            try:
+                engine = create_async_engine(url, **options)
+            except ImportError:
+                # Driver not installed; remember that and use the thread path
+                engine = None
+
+    _async_engines[connection_string] = engine
+    while len(_async_engines) > engine_config["max_engines"]:
+        _, evicted = _async_engines.popitem(last=False)
+        if evicted is not None:
+            await evicted.dispose()
+
+    return engine
+
+
+def _query_slot(connection_string: str) -> asyncio.Semaphore:
+    """Semaphore bounding how many queries run at once on one connection"""
+    slot = _query_slots.get(connection_string)
+    if slot is None:
+        slot = _query_slots[connection_string] = asyncio.Semaphore(_engine_settings()["max_concurrent_queries"])
+    return slot
+
+
+def _format_csv_rows(rows) -> str:
+    """Format rows as newline-terminated CSV lines"""
+    return "".join(
+        ",".join([str(val) if val is not None else "" for val in row]) + "\n"
+        for row in rows
+    )
+
+
+def _column_type(values: List[Any]) -> str:
+    """Infer a portable type name from a column's first non-null value"""
+    sample = next((v for v in values if v is not None), None)
+    for python_type, type_name in _COLUMN_TYPES:
+        if isinstance(sample, python_type):
+            return type_name
+    return "string"
+
+
+def _json_value(value: Any) -> Any:
+    """Convert a database value into a JSON-serializable one"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+    return str(value)
+
+
+def _fetch_columns(result, chunk_size: int = 10000) -> List[List[Any]]:
+    """Fetch a result column by column, one partition at a time"""
+    columns: List[List[Any]] = [[] for _ in result.keys()]
+    for rows in result.partitions(chunk_size):
+        for column, values in zip(columns, zip(*rows)):
+            column.extend(values)
+    return columns
+
+
+def _format_json_columns(names: List[str], columns: List[List[Any]], execution_time: float) -> Dict[str, Any]:
+    """Build the column-oriented JSON result"""
+    return {
+        "format": "json",
+        "execution_time": round(execution_time, 3),
+        "row_count": len(columns[0]) if columns else 0,
+        "columns": [
+            {"name": name, "type": _column_type(values), "values": [_json_value(v) for v in values]}
+            for name, values in zip(names, columns)
+        ]
+    }
+
+
+def _result_file_ttl() -> float:
+    """Seconds an arrow_file result is kept, from ``database.result_file_ttl``"""
+    try:
+        from app.core.config import settings
+        return settings.config.get("database", {}).get("result_file_ttl", DEFAULT_RESULT_FILE_TTL)
+    except Exception:
+        return DEFAULT_RESULT_FILE_TTL
+
+
+def _sweep_result_files(directory: str, ttl: float):
+    """Delete expired arrow_file results, at most once per RESULT_SWEEP_INTERVAL"""
+    global _last_result_sweep
+    now = time.time()
+    if now - _last_result_sweep < RESULT_SWEEP_INTERVAL:
+        return
+    _last_result_sweep = now
+
+    for entry in os.scandir(directory):
+        if entry.name.startswith(RESULT_FILE_PREFIX) and entry.name.endswith(".arrow"):
+            try:
+                if entry.stat().st_mtime < now - ttl:
+                    os.remove(entry.path)
+            except OSError:
+                pass  # Already removed by its consumer or another replica
+
+
+def _format_arrow(names: List[str], columns: List[List[Any]], execution_time: float,
+                  output_format: str) -> Dict[str, Any]:
+    """Serialize columns as Arrow IPC, inline as base64 or in a shared file"""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise Exception(f"output_format '{output_format}' requires pyarrow to be installed")
+
+    # from_arrays keeps duplicate names (e.g. person_id from both sides of a join)
+    table = pa.Table.from_arrays([pa.array(values) for values in columns], names=names)
+    result = {
+        "format": output_format,
+        "execution_time": round(execution_time, 3),
+        "row_count": table.num_rows
+    }
+
+    if output_format == "arrow_file":
+        # Consumers may delete the file once read; otherwise it expires after the TTL
+        directory = os.environ.get("OMCP_RESULT_DIR") or tempfile.gettempdir()
+        ttl = _result_file_ttl()
+        _sweep_result_files(directory, ttl)
+        fd, path = tempfile.mkstemp(prefix=RESULT_FILE_PREFIX, suffix=".arrow", dir=directory)
+        with os.fdopen(fd, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        result["path"] = path
+        result["expires_in"] = ttl
+    else:
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        result["encoding"] = "base64"
+        result["data"] = base64.b64encode(sink.getvalue().to_pybytes()).decode("ascii")
+
+    return result
+
+
+def _collect_result(result, output_format: str) -> Tuple[List[str], Any]:
+    """Read a result as CSV rows (for csv) or as columns (for the other formats)"""
+    column_names = list(result.keys())
+    if output_format == "rows":
+        # Internal: raw rows for callers that parse the result themselves
+        return column_names, [tuple(row) for row in result]
+    if output_format == "csv":
+        # Convert rows to CSV, joining once rather than concatenating per row
+        return column_names, _format_csv_rows([column_names]) + _format_csv_rows(result)
+    return column_names, _fetch_columns(result)
+
+
+def _transaction_setup(dialect_name: str, read_only: bool, timeout: Optional[float]) -> List[str]:
+    """Statements that scope read-only mode and a statement timeout to the current transaction"""
+    statements = []
+    if dialect_name == "postgresql":
+        # SET TRANSACTION must come first in the implicitly begun transaction
+        if read_only:
+            statements.append("SET TRANSACTION READ ONLY")
+        if timeout:
+            statements.append(f"SET LOCAL statement_timeout = {max(1, int(timeout * 1000))}")
+    return statements
+
+
+def _interrupt(handle: Dict[str, Any]):
+    """Interrupt the statement running on a worker thread's connection (DuckDB, SQLite)"""
+    driver_connection = handle.get("connection")
+    interrupt = getattr(driver_connection, "interrupt", None)
+    if interrupt is not None:
         try:
-            from app.core.config import settings
-            conn_string = settings.get_db_connection_string(conn_id)
-            _db_engines[conn_id] = create_engine(conn_string)
-        except Exception as e:
-            raise Exception(f"Failed to create engine for {conn_id}: {e}")
+            interrupt()
+        except Exception:
+            pass
 
-    return _db_engines[conn_id]
+
+def _execute_sync(connection_string: str, query: str, output_format: str, read_only: bool,
+                  timeout: Optional[float], handle: Dict[str, Any]) -> Tuple[List[str], Any]:
+    """Run a query on the pooled sync engine; used in a worker thread
+
+    The driver connection is published in ``handle`` so the caller can
+    interrupt the statement when the deadline passes or the call is cancelled.
+    """
+    engine = get_db_engine(connection_string=connection_string)
+
+    with engine.connect() as connection:
+        handle["connection"] = connection.connection.driver_connection
+        for statement in _transaction_setup(connection.dialect.name, read_only, timeout):
+            connection.execute(text(statement))
+
+        return _collect_result(connection.execute(text(query)), output_format)
+
+
+async def _execute_async(engine, query: str, output_format: str, read_only: bool,
+                         timeout: Optional[float]) -> Tuple[List[str], Any]:
+    """Run a query on a pooled async engine"""
+    async with engine.connect() as connection:
+        for statement in _transaction_setup(connection.dialect.name, read_only, timeout):
+            await connection.execute(text(statement))
+
+        result = await connection.execute(text(query))
+
+    # The result is already buffered; format it off the event loop
+    return await asyncio.to_thread(_collect_result, result, output_format)
+
+
+async def _execute_in_thread(connection_string: str, query: str, output_format: str, read_only: bool,
+                             timeout: Optional[float]) -> Tuple[List[str], Any]:
+    """Run a query in a worker thread, interrupting it if the caller stops waiting"""
+    handle: Dict[str, Any] = {}
+    try:
+        return await asyncio.to_thread(_execute_sync, connection_string, query, output_format, read_only,
+                                       timeout, handle)
+    except asyncio.CancelledError:
+        # Cancelling the await doesn't stop the thread; stop the statement itself
+        _interrupt(handle)
+        raise
 
 
 @mcp.tool(
     name="Execute_SQL_Query",
     description="Execute a SQL query against an OMOP database and return results"
 )
-def execute_query(query: str, connection_id: str = None, connection_string: str = None) -> str:
-    """Execute a SQL query and return results in CSV format
+async def execute_query(query: str, connection_id: str = None, connection_string: str = None,
+                        output_format: str = "csv", read_only: bool = False,
+                        timeout: float = None) -> Union[str, Dict[str, Any]]:
+    """Execute a SQL query and return results
+
+    Queries run on an async engine where the dialect has an async driver
+    (asyncpg for PostgreSQL) and in a worker thread otherwise (DuckDB), so
+    one server process serves many queries at once. At most
+    ``database.engine.max_concurrent_queries`` run concurrently per
+    connection; further calls wait for a slot.
 
     Args:
         query: SQL query to execute
         connection_id: Optional ID for predefined connection
         connection_string: Optional direct connection string
+        output_format: "csv" (default), "json" for typed column-oriented JSON,
+            "arrow" for base64 Arrow IPC, or "arrow_file" for an Arrow IPC
+            file on this host whose path is returned; files are deleted
+            after ``database.result_file_ttl`` seconds
+        read_only: Refuse anything but a single read-only SELECT, and on
+            PostgreSQL run it inside a read-only transaction; the
+            transaction is always rolled back
+        timeout: Optional deadline in seconds, including time spent waiting
+            for a slot. PostgreSQL enforces it as ``statement_timeout``;
+            DuckDB queries are interrupted. Cancelling the call stops the
+            query the same way.
 
     Returns:
-        Results as CSV string
+        Results as CSV string, or a dict for the other formats
     """
     start_time = time.time()
 
+    async def run() -> Tuple[List[str], Any]:
+        async with _query_slot(conn_string):
+            remaining = timeout - (time.time() - start_time) if timeout else None
+            engine = await get_async_db_engine(conn_string)
+            if engine is not None:
+                return await _execute_async(engine, query, output_format, read_only, remaining)
+            return await _execute_in_thread(conn_string, query, output_format, read_only, remaining)
+
     try:
-        engine = get_db_engine(connection_id, connection_string)
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output_format '{output_format}', expected one of {OUTPUT_FORMATS}")
+        if read_only and not _is_read_only_select(query):
+            raise ValueError("read_only queries must be a single read-only SELECT")
+
+        conn_string = _resolve_connection_string(connection_id, connection_string)
+        try:
+            column_names, data = await asyncio.wait_for(run(), timeout=timeout or None)
+        except asyncio.TimeoutError:
+            raise Exception(f"Query exceeded its {timeout}s deadline and was cancelled")
+
+        execution_time = time.time() - start_time
+        if output_format == "csv":
+            return f"# Execution time: {execution_time:.3f} seconds\n{data}"
+        if output_format == "json":
+            return _format_json_columns(column_names, data, execution_time)
+        return await asyncio.to_thread(_format_arrow, column_names, data, execution_time, output_format)
+
+    except Exception as e:
+        return f"Error executing query: {str(e)}"
+
+
+@mcp.tool(
+    name="Stream_SQL_Query",
+    description="Execute a SQL query and stream results as CSV chunks via progress messages"
+)
+async def stream_query(query: str, connection_id: str = None, connection_string: str = None,
+                       chunk_size: int = 1000, timeout: float = None, ctx: Context = None) -> str:
+    """Execute a SQL query and stream results in CSV chunks
+
+    Uses a server-side cursor so at most ``chunk_size`` rows are held in
+    memory at a time. The header line and each chunk of rows are sent as
+    progress messages; the return value only reports totals.
+
+    Args:
+        query: SQL query to execute
+        connection_id: Optional ID for predefined connection
+        connection_string: Optional direct connection string
+        chunk_size: Number of rows per chunk
+        timeout: Optional deadline in seconds for the whole stream
+        ctx: MCP request context used to send progress messages
 
-        with engine.connect() as connection:
-            result = connection.execute(text(query))
-            column_names = result.keys()
+    Returns:
+        Execution summary as CSV comment lines
+    """
+    start_time = time.time()
+    row_count = 0
+    handle: Dict[str, Any] = {}
+
+    async def in_thread(func, *args):
+        """Run one blocking database step in a worker thread
+
+        On cancellation the statement is interrupted and the step is waited
+        for, so the connection is never closed under a running thread.
+        """
+        step = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        try:
+            return await asyncio.shield(step)
+        except asyncio.CancelledError:
+            _interrupt(handle)
+            await asyncio.wait({step})
+            if not step.cancelled():
+                step.exception()  # Typically the interrupt error; nobody is waiting for it
+            raise
+
+    def next_chunk(partitions) -> Tuple[int, Optional[str]]:
+        """Fetch and format the next chunk of rows"""
+        rows = next(partitions, None)
+        return (0, None) if rows is None else (len(rows), _format_csv_rows(rows))
+
+    async def run():
+        nonlocal row_count
+        async with _query_slot(conn_string):
+            # Connecting, fetching and closing all block, so none of it runs on the event loop
+            connect = asyncio.ensure_future(asyncio.to_thread(engine.connect))
+            try:
+                connection = await asyncio.shield(connect)
+            except asyncio.CancelledError:
+                # Don't leak a connection that finishes opening after the stream was abandoned
+                await asyncio.wait({connect})
+                if not connect.cancelled() and connect.exception() is None:
+                    await asyncio.to_thread(connect.result().close)
+                raise
+            handle["connection"] = connection.connection.driver_connection
+            try:
+                for statement in _transaction_setup(connection.dialect.name, False, timeout):
+                    await in_thread(connection.execute, text(statement))
+
+                streaming = connection.execution_options(stream_results=True, yield_per=chunk_size)
+                result = await in_thread(streaming.execute, text(query))
+                await ctx.report_progress(0, message=_format_csv_rows([result.keys()]))
+
+                partitions = result.partitions(chunk_size)
+                while True:
+                    fetched, chunk = await in_thread(next_chunk, partitions)
+                    if chunk is None:
+                        break
+                    row_count += fetched
+                    await ctx.report_progress(row_count, message=chunk)
+            finally:
+                await asyncio.shield(asyncio.to_thread(connection.close))
+
+    try:
+        conn_string = _resolve_connection_string(connection_id, connection_string)
+        engine = get_db_engine(connection_string=conn_string)
 
-            # Convert rows to CSV
-            csv_data = ",".join(column_names) + "\n"
-            for row in result:
-                csv_data += ",".join([str(val) if val is not None else "" for val in row]) + "\n"
+        try:
+            await asyncio.wait_for(run(), timeout=timeout or None)
+        except asyncio.TimeoutError:
+            raise Exception(f"Query exceeded its {timeout}s deadline and was cancelled")
 
-            execution_time = time.time() - start_time
-            return f"# Execution time: {execution_time:.3f} seconds\n{csv_data}"
+        execution_time = time.time() - start_time
+        return f"# Execution time: {execution_time:.3f} seconds\n# Rows: {row_count}\n"
 
     except Exception as e:
         return f"Error executing query: {str(e)}"
 
 
+def _is_read_only_select(query: str) -> bool:
+    """Check whether SQL is a single SELECT (or WITH ... SELECT) without writes"""
+    # Drop comments and string literals so their contents can't mislead the checks
+    stripped = re.sub(r"--[^\n]*|/\*.*?\*/|'(?:[^']|'')*'", " ", query, flags=re.DOTALL).strip().lower()
+    stripped = stripped.rstrip(";").strip()
+
+    if ";" in stripped or not re.match(r"(select|with)\b", stripped):
+        return False
+    return not _WRITE_KEYWORDS.search(stripped)
+
+
+def _postgres_plan_estimate(plan: Any) -> Dict[str, Any]:
+    """Extract estimates from ``EXPLAIN (FORMAT JSON)`` output"""
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    root = plan[0]["Plan"]
+
+    peak_rows = 0
+    nodes = [root]
+    while nodes:
+        node = nodes.pop()
+        peak_rows = max(peak_rows, node.get("Plan Rows", 0))
+        nodes.extend(node.get("Plans", []))
+
+    return {
+        "estimated_rows": peak_rows,
+        "result_rows": root.get("Plan Rows"),
+        "estimated_cost": root.get("Total Cost")
+    }
+
+
+def _duckdb_node_estimate(node: Dict[str, Any]) -> Optional[int]:
+    """A DuckDB plan node's own cardinality estimate, if it reports one"""
+    extra_info = node.get("extra_info") or {}
+    if isinstance(extra_info, dict):
+        value = str(extra_info.get("Estimated Cardinality", "")).lstrip("~").replace(",", "")
+        return int(value) if value.isdigit() else None
+    match = _DUCKDB_ESTIMATE.search(str(extra_info))
+    return int(match.group(1).replace(",", "")) if match else None
+
+
+def _duckdb_plan_estimate(plan: Any) -> Dict[str, Any]:
+    """Extract cardinality estimates from DuckDB's ``EXPLAIN (FORMAT JSON)`` output
+
+    DuckDB reports no cost, only per-operator cardinalities, and leaves them
+    out on joins without an equality condition (``CROSS_PRODUCT``, nested
+    loop joins). Those are estimated as the product of their inputs; if an
+    input has no estimate either, the peak is reported as unknown rather
+    than understated. The topmost operator with an estimate stands in for
+    the result size.
+    """
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    estimates: List[Optional[int]] = []  # Top-down
+    unknown = False
+
+    def visit(node: Dict[str, Any]) -> Optional[int]:
+        nonlocal unknown
+        index = len(estimates)
+        estimates.append(None)
+        inputs = [visit(child) for child in node.get("children", [])]
+
+        rows = _duckdb_node_estimate(node)
+        if rows is None and len(inputs) > 1:
+            if None in inputs:
+                unknown = True
+            elif "JOIN" in node.get("name", "") or "CROSS_PRODUCT" in node.get("name", ""):
+                rows = math.prod(inputs)
+            else:
+                rows = sum(inputs)  # Unions and other operators that concatenate their inputs
+        estimates[index] = rows
+        return rows
+
+    for root in plan:
+        visit(root)
+
+    known = [rows for rows in estimates if rows is not None]
+    return {
+        "estimated_rows": None if unknown or not known else max(known),
+        "result_rows": known[0] if known else None,
+        "estimated_cost": None
+    }
+
+
+@mcp.tool(
+    name="Estimate_Query_Cost",
+    description="Estimate a SQL query's row counts and cost with EXPLAIN, without running it"
+)
+async def estimate_query_cost(query: str, connection_id: str = None, connection_string: str = None,
+                              timeout: float = None) -> Union[str, Dict[str, Any]]:
+    """Run EXPLAIN on a query and report the planner's estimates
+
+    Args:
+        query: SQL query to estimate
+        connection_id: Optional ID for predefined connection
+        connection_string: Optional direct connection string
+        timeout: Optional deadline in seconds for the EXPLAIN
+
+    Returns:
+        Dict with ``estimated_rows`` (largest row count of any plan node, a
+        proxy for work done), ``result_rows`` and ``estimated_cost``
+        (PostgreSQL only); estimates are None where the dialect provides
+        none. An error string if the query can't be planned or isn't a
+        single read-only SELECT, which is never handed to EXPLAIN.
+    """
+    if not _is_read_only_select(query):
+        return "Error estimating query cost: only a single read-only SELECT can be estimated"
+
+    try:
+        conn_string = _resolve_connection_string(connection_id, connection_string)
+        dialect = make_url(conn_string).get_backend_name()
+        explain = EXPLAIN_STATEMENTS.get(dialect)
+        if explain is None:
+            return {"dialect": dialect, "supported": False, "estimated_rows": None, "result_rows": None,
+                    "estimated_cost": None}
+
+        statement = explain + query.strip().rstrip(";")
+        async with _query_slot(conn_string):
+            engine = await get_async_db_engine(conn_string)
+            if engine is not None:
+                work = _execute_async(engine, statement, "rows", True, timeout)
+            else:
+                work = _execute_in_thread(conn_string, statement, "rows", True, timeout)
+            try:
+                _, rows = await asyncio.wait_for(work, timeout=timeout or None)
+            except asyncio.TimeoutError:
+                raise Exception(f"EXPLAIN exceeded its {timeout}s deadline and was cancelled")
+
+        if dialect == "postgresql":
+            estimate = _postgres_plan_estimate(rows[0][0])
+        else:
+            estimate = _duckdb_plan_estimate(rows[0][-1])
+        return {"dialect": dialect, "supported": True, **estimate}
+
+    except Exception as e:
+        return f"Error estimating query cost: {str(e)}"
+
+
 @mcp.tool(
     name="Test_Connection",
     description="Test if a database connection is valid"
 )
-def test_connection(connection_string: str) -> bool:
+async def test_connection(connection_string: str) -> bool:
     """Test if a connection string is valid
 
+    Runs in a worker thread so a slow or unreachable database doesn't hold
+    up queries running concurrently.
+
     Args:
         connection_string: Database connection string to test
 
     Returns:
         True if connection is valid, False otherwise
     """
-    try:
-        engine = create_engine(connection_string)
+    def check():
+        engine = get_db_engine(connection_string=connection_string)
         with engine.connect() as conn:
             conn.execute(text("SELECT 1"))
+
+    try:
+        await asyncio.to_thread(check)
         return True
     except Exception as e:
+        # Don't let broken connection strings occupy the registry
+        _discard_engine(connection_string)
         return False
 
 
+def _format_column(col: Dict[str, Any]) -> str:
+    """Format a single column line for the schema prompt"""
+    col_desc = f"  - {col['name']} ({col.get('data_type', col.get('type', ''))})"
+    if col.get("description"):
+        col_desc += f": {col['description']}"
+    return col_desc
+
+
+def _format_relationship(relation: Dict[str, Any]) -> List[str]:
+    """Format a relationship as one or more ``source -> target`` lines"""
+    if "source_column" in relation:
+        join_columns = {relation["source_column"]: relation["target_column"]}
+    else:
+        join_columns = relation.get("join_columns", {})
+
+    return [
+        f"- {relation['source_table']}.{source_col} -> {relation['target_table']}.{target_col}"
+        for source_col, target_col in join_columns.items()
+    ]
+
+
+def _render_schema(schema_data: Dict[str, Any]) -> str:
+    """Render parsed schema JSON into the prompt text"""
+    # Collect lines and join once instead of growing a string
+    lines = ["OMOP CDM Database Schema:", ""]
+
+    # Add main tables first
+    core_tables = ["person", "visit_occurrence", "condition_occurrence", "drug_exposure", "measurement",
+                   "observation"]
+    tables_by_name = {t["name"]: t for t in schema_data["tables"]}
+
+    # First add core tables for better context
+    lines.append("Core Tables:")
+    for table_name in core_tables:
+        table = tables_by_name.get(table_name)
+        if table:
+            lines.append(f"Table: {table['name']} - {table.get('description', '')}")
+            lines.extend(_format_column(col) for col in table["columns"])
+            lines.append("")
+
+    # Then add other tables
+    lines.append("Other Tables:")
+    for table in schema_data["tables"]:
+        if table["name"] not in core_tables:
+            lines.append(f"Table: {table['name']} - {table.get('description', '')}")
+
+            # Add only key columns for non-core tables
+            key_columns = [c for c in table["columns"] if
+                           c.get("is_key", False) or "_id" in c["name"] or "concept_id" in c["name"]]
+            lines.extend(_format_column(col) for col in key_columns)
+            lines.append(f"  - plus {len(table['columns']) - len(key_columns)} more columns")
+            lines.append("")
+
+    # Add common relationships
+    lines.append("")
+    lines.append("Key Relationships:")
+    for relation in schema_data.get("relationships", []):
+        lines.extend(_format_relationship(relation))
+
+    return "\n".join(lines) + "\n"
+
+
+def _load_rendered_schema() -> str:
+    """Return the rendered schema, re-rendering only when the schema file changes
+
+    A changed mtime or size triggers a re-read, but the file is only
+    re-parsed and re-rendered if its content hash actually differs.
+    """
+    from app.core.config import settings
+    schema_path = settings.get_omop_schema_path()
+
+    stat = os.stat(schema_path)
+    file_key = (schema_path, stat.st_mtime_ns, stat.st_size)
+    if _schema_cache["text"] is not None and _schema_cache["file_key"] == file_key:
+        _schema_cache_stats["hits"] += 1
+        return _schema_cache["text"]
+
+    with open(schema_path, "rb") as f:
+        raw = f.read()
+    schema_hash = hashlib.sha256(raw).hexdigest()
+
+    if _schema_cache["text"] is not None and _schema_cache["hash"] == schema_hash:
+        # Touched but unchanged; keep the rendered text
+        _schema_cache["file_key"] = file_key
+        _schema_cache_stats["hits"] += 1
+        return _schema_cache["text"]
+
+    _schema_cache_stats["misses"] += 1
+    schema_text = _render_schema(json.loads(raw))
+    _schema_cache.update(file_key=file_key, hash=schema_hash, text=schema_text)
+    return schema_text
+
+
 @mcp.tool(
     name="Get_OMOP_Schema",
     description="Get the OMOP CDM schema information for prompting"
@@ -102,60 +868,59 @@ def get_omop_schema() -> str:
         Formatted schema text
     """
     try:
-        from app.core.config import settings
-        schema_path = settings.get_omop_schema_path()
-
-        with open(schema_path, "r") as f:
-            schema_data = json.load(f)
-
-        # Format the schema for the prompt
-        schema_text = "OMOP CDM Database Schema:\n\n"
-
-        # Add main tables first
-        core_tables = ["person", "visit_occurrence", "condition_occurrence", "drug_exposure", "measurement",
-                       "observation"]
-
-        # First add core tables for better context
-        schema_text += "Core Tables:\n"
-        for table_name in core_tables:
-            table = next((t for t in schema_data["tables"] if t["name"] == table_name), None)
-            if table:
-                schema_text += f"Table: {table['name']} - {table.get('description', '')}\n"
-
-                for col in table["columns"]:
-                    col_desc = f"  - {col['name']} ({col['data_type']})"
-                    if col.get("description"):
-                        col_desc += f": {col['description']}"
-                    schema_text += col_desc + "\n"
+        return _load_rendered_schema()
+    except Exception as e:
+        return f"OMOP CDM Schema unavailable: {str(e)}"
 
-                schema_text += "\n"
 
-        # Then add other tables
-        schema_text += "Other Tables:\n"
-        for table in schema_data["tables"]:
-            if table["name"] not in core_tables:
-                schema_text += f"Table: {table['name']} - {table.get('description', '')}\n"
+@mcp.tool(
+    name="Get_Schema_Cache_Stats",
+    description="Get hit/miss counters for the rendered OMOP schema cache"
+)
+def get_schema_cache_stats() -> Dict[str, Any]:
+    """Report schema cache counters
 
-                # Add only key columns for non-core tables
-                key_columns = [c for c in table["columns"] if
-                               c.get("is_key", False) or "_id" in c["name"] or "concept_id" in c["name"]]
-                for col in key_columns:
-                    col_desc = f"  - {col['name']} ({col['data_type']})"
-                    if col.get("description"):
-                        col_desc += f": {col['description']}"
-                    schema_text += col_desc + "\n"
+    Returns:
+        Hit and miss counts plus the hash of the cached schema file
+    """
+    return {
+        "hits": _schema_cache_stats["hits"],
+        "misses": _schema_cache_stats["misses"],
+        "schema_hash": _schema_cache["hash"]
+    }
 
-                schema_text += f"  - plus {len(table['columns']) - len(key_columns)} more columns\n\n"
 
-        # Add common relationships
-        schema_text += "\nKey Relationships:\n"
-        for relation in schema_data.get("relationships", []):
-            schema_text += f"- {relation['source_table']}.{relation['source_column']} -> {relation['target_table']}.{relation['target_column']}\n"
+@mcp.tool(
+    name="Reload_Resources",
+    description="Re-read and pre-render the OMOP schema"
+)
+def reload_resources() -> Dict[str, Any]:
+    """Re-render the schema from disk and swap it into the cache
 
-        return schema_text
+    The new text is rendered before the cache is touched, so a failed
+    reload keeps serving the previous schema.
 
+    Returns:
+        Hash of the loaded schema and whether it changed, or an error
+    """
+    previous_hash = _schema_cache["hash"]
+    try:
+        from app.core.config import settings
+        schema_path = settings.get_omop_schema_path()
+        stat = os.stat(schema_path)
+        with open(schema_path, "rb") as f:
+            raw = f.read()
+        schema_text = _render_schema(json.loads(raw))
     except Exception as e:
-        return f"OMOP CDM Schema unavailable: {str(e)}"
+        return {"error": f"Failed to reload OMOP schema: {str(e)}", "schema_hash": previous_hash}
+
+    schema_hash = hashlib.sha256(raw).hexdigest()
+    _schema_cache.update(
+        file_key=(schema_path, stat.st_mtime_ns, stat.st_size),
+        hash=schema_hash,
+        text=schema_text
+    )
+    return {"schema_hash": schema_hash, "changed": schema_hash != previous_hash}
 
 
 if __name__ == "__main__":
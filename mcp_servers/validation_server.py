@@ -1,21 +1,45 @@
 from mcp.server.fastmcp import FastMCP
+import copy
+import hashlib
 import json
+import os
 import re
+import threading
+import time
 import httpx
-from typing import Dict, Any, List, Tuple, Optional
+from collections import OrderedDict, deque
+from typing import Dict, Any, Iterable, List, Set, Tuple, Optional
+
+# sqlglot is optional; without it validation uses the heuristic rule engine only
+try:
+    import sqlglot
+    from sqlglot import exp
+except ImportError:
+    sqlglot = None
+
+# duckdb is optional; without it the shadow-schema dry run is skipped
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
 
 # Initialize MCP server
 mcp = FastMCP(name="OMOP Validation MCP Server")
 
 
 # Load validation rules
+def _read_validation_rules() -> Dict[str, Any]:
+    """Read the rules file, raising if it's missing or malformed"""
+    from app.core.config import settings
+    rules_path = settings.get_validation_rules_path()
+    with open(rules_path, "r") as f:
+        return json.load(f)
+
+
 def _load_validation_rules() -> Dict[str, Any]:
     """Load validation rules from file"""
     try:
-        from app.core.config import settings
-        rules_path = settings.get_validation_rules_path()
-        with open(rules_path, "r") as f:
-            return json.load(f)
+        return _read_validation_rules()
     except Exception as e:
         return {
             "required_tables": [],
@@ -24,8 +48,598 @@ def _load_validation_rules() -> Dict[str, Any]:
         }
 
 
+def _rules_file_key() -> Optional[Tuple[str, int, int]]:
+    """Path, mtime and size of the rules file, or None if it can't be found"""
+    try:
+        from app.core.config import settings
+        rules_path = settings.get_validation_rules_path()
+        stat = os.stat(rules_path)
+        return rules_path, stat.st_mtime_ns, stat.st_size
+    except Exception:
+        return None
+
+
+# Operations a generated query must never perform, checked with one combined pattern
+PROHIBITED_PATTERN = re.compile(
+    r"\bdrop\s+table\b|\btruncate\s+table\b|\bdelete\s+from\b|\bupdate\s+\w+\s+set\b|\balter\s+table\b"
+)
+
+# Parsed statements (or the parse error) keyed by SQL hash, least recently used first
+PARSE_CACHE_SIZE = 512
+_parse_cache: "OrderedDict[str, Tuple[Optional[list], Optional[str]]]" = OrderedDict()
+
+# Statement types that count as prohibited operations when found anywhere in the AST
+PROHIBITED_NODES = tuple(
+    getattr(exp, name) for name in ("Drop", "TruncateTable", "Delete", "Update", "Alter")
+    if hasattr(exp, name)
+) if sqlglot else ()
+PROHIBITED_COMMANDS = ("drop", "truncate", "delete", "update", "alter")
+
+# Comments, string literals (including dollar-quoted ones) and quoted
+# identifiers, matched left to right so a quote inside a comment or "--"
+# inside a string is never taken for the start of another segment
+_SQL_SEGMENT_PATTERN = re.compile(
+    r"(?P<comment>--[^\n]*|/\*.*?(?:\*/|\Z))"
+    r"|(?P<string>'(?:[^']|'')*(?:'|\Z)|\$(?P<tag>[A-Za-z_]*)\$.*?(?:\$(?P=tag)\$|\Z))"
+    r"|(?P<identifier>\"(?:[^\"]|\"\")*(?:\"|\Z))",
+    re.DOTALL
+)
+# Numeric literals outside strings, replaced when fingerprinting SQL
+_NUMBER_PATTERN = re.compile(r"\b\d+(?:\.\d+)?\b")
+
+# OMOP schema file column types mapped to DuckDB types for the dry-run shadow database
+SHADOW_COLUMN_TYPES = {
+    "INT64": "BIGINT",
+    "STRING": "VARCHAR",
+    "DATE": "DATE",
+    "DATETIME": "TIMESTAMP",
+    "FLOAT64": "DOUBLE"
+}
+SHADOW_SCHEMA = "omop_cdm"
+
+# Needles for the built-in temporal check
+TEMPORAL_TERMS = ("date", "time")
+RANGE_TERMS = ("between", ">", "<")
+
+
+def _normalize_sql(sql: str) -> str:
+    """Lowercase SQL, collapse whitespace and drop spaces around ``=``
+
+    Join conditions are normalized the same way, so ``a.x = b.x``,
+    ``a.x=b.x`` and conditions split across lines all match one needle.
+    """
+    return re.sub(r"\s*=\s*", "=", " ".join(sql.lower().split()))
+
+
+def _mask_literals(sql_query: str, placeholder: str, numbers: bool = False) -> str:
+    """Replace string literals, and optionally numbers, with a placeholder
+
+    Comments and quoted identifiers are kept verbatim, so an apostrophe in a
+    ``--`` comment doesn't swallow the rest of the query as a string.
+    """
+    parts = []
+    position = 0
+    for match in _SQL_SEGMENT_PATTERN.finditer(sql_query):
+        code = sql_query[position:match.start()]
+        parts.append(_NUMBER_PATTERN.sub(placeholder, code) if numbers else code)
+        parts.append(placeholder if match.group("string") is not None else match.group())
+        position = match.end()
+    code = sql_query[position:]
+    parts.append(_NUMBER_PATTERN.sub(placeholder, code) if numbers else code)
+    return "".join(parts)
+
+
+def statement_kinds(sql_query: str) -> Tuple[str, ...]:
+    """Leading keyword of each statement, e.g. ``("select",)`` or ``("select", "delete")``
+
+    Comments and literals are skipped, so neither can hide a statement.
+    """
+    code = _SQL_SEGMENT_PATTERN.sub(" ", sql_query)
+    kinds = []
+    for statement in code.split(";"):
+        match = re.match(r"[\s(]*(\w+)", statement)
+        if match:
+            kinds.append(match.group(1).lower())
+    return tuple(kinds)
+
+
+def sql_fingerprint(sql_query: str) -> str:
+    """Hash SQL with literals replaced, case lowered and whitespace collapsed
+
+    Queries differing only in formatting or literal values share a
+    fingerprint, and so share cached validation verdicts. Comments are kept,
+    and quotes inside them are not treated as literals.
+    """
+    normalized = " ".join(_mask_literals(sql_query, "?", numbers=True).lower().split())
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+class ValidationCache:
+    """LRU cache of validation verdicts with a time-to-live
+
+    Values are deep-copied on the way in and out, so callers can extend a
+    verdict's issues without touching the cached one.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(entry[1])
+
+    def set(self, key: Tuple, value: Dict[str, Any]):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+def _validation_settings() -> Dict[str, Any]:
+    """``validation`` section of the config: engine ("ast" or "heuristic") and SQL dialect"""
+    try:
+        from app.core.config import settings
+        return {"engine": "ast", "dialect": "postgres", **settings.config.get("validation", {})}
+    except Exception:
+        return {"engine": "ast", "dialect": "postgres"}
+
+
+def sql_hash(sql_query: str) -> str:
+    """Hash identifying a SQL string in the parse cache"""
+    return hashlib.sha256(sql_query.encode()).hexdigest()
+
+
+def parse_sql(sql_query: str, dialect: str = "postgres") -> Tuple[Optional[list], Optional[str]]:
+    """Parse SQL once, caching the statements by SQL hash
+
+    Validation, comprehensive validation and repeated checks of the same SQL
+    (e.g. after a refinement round trip) reuse the cached parse.
+
+    Returns:
+        ``(statements, None)`` on success, or ``(None, error)`` if the SQL
+        can't be parsed or sqlglot isn't installed
+    """
+    if sqlglot is None:
+        return None, "sqlglot is not installed"
+
+    key = f"{dialect}:{sql_hash(sql_query)}"
+    cached = _parse_cache.get(key)
+    if cached is not None:
+        _parse_cache.move_to_end(key)
+        return cached
+
+    try:
+        statements = [statement for statement in sqlglot.parse(sql_query, read=dialect) if statement is not None]
+        parsed = (statements, None) if statements else (None, "Empty query")
+    except Exception as e:
+        parsed = (None, str(e).splitlines()[0])
+
+    _parse_cache[key] = parsed
+    while len(_parse_cache) > PARSE_CACHE_SIZE:
+        _parse_cache.popitem(last=False)
+    return parsed
+
+
+def _column_key(column, aliases: Dict[str, str], tables: Set[str]) -> Optional[Tuple[str, str]]:
+    """Resolve a column reference to ``(table, column)`` through table aliases"""
+    qualifier = column.table.lower()
+    if qualifier:
+        return aliases.get(qualifier, qualifier), column.name.lower()
+    if len(tables) == 1:
+        return next(iter(tables)), column.name.lower()
+    return None
+
+
+def analyze_statements(statements: list) -> Dict[str, Any]:
+    """Collect referenced tables, aliases, columns and join predicates from parsed SQL
+
+    Equality predicates between two columns (in ON or WHERE clauses) and
+    ``USING`` joins are resolved to ``(table, column)`` pairs, so a join is
+    recognized however its tables are aliased.
+    """
+    cte_names = {cte.alias_or_name.lower() for statement in statements for cte in statement.find_all(exp.CTE)}
+
+    tables: Set[str] = set()
+    aliases: Dict[str, str] = {}
+    for statement in statements:
+        for table in statement.find_all(exp.Table):
+            name = table.name.lower()
+            if name and name not in cte_names:
+                tables.add(name)
+                aliases[table.alias_or_name.lower()] = name
+
+    predicates: Set[frozenset] = set()
+    for statement in statements:
+        for equality in statement.find_all(exp.EQ):
+            if isinstance(equality.left, exp.Column) and isinstance(equality.right, exp.Column):
+                left = _column_key(equality.left, aliases, tables)
+                right = _column_key(equality.right, aliases, tables)
+                if left and right:
+                    predicates.add(frozenset((left, right)))
+
+        # JOIN ... USING (col) pairs the joined table with every other table having that column name
+        for join in statement.find_all(exp.Join):
+            joined = join.this.name.lower() if isinstance(join.this, exp.Table) else None
+            for using in join.args.get("using") or []:
+                column = using.name.lower()
+                for other in tables - {joined}:
+                    predicates.add(frozenset(((joined, column), (other, column))))
+
+    columns = {column.name.lower() for statement in statements for column in statement.find_all(exp.Column)}
+    has_range = any(statement.find(exp.GT, exp.GTE, exp.LT, exp.LTE, exp.Between) for statement in statements)
+
+    return {
+        "tables": tables,
+        "aliases": aliases,
+        "columns": columns,
+        "predicates": predicates,
+        "has_range_filter": has_range
+    }
+
+
+def _predicate_key(condition: str) -> Optional[frozenset]:
+    """Parse a rule's ``a.x = b.y`` join condition into a predicate key"""
+    statements, _ = parse_sql(condition) if sqlglot else (None, None)
+    if not statements or not isinstance(statements[0], exp.EQ):
+        return None
+    equality = statements[0]
+    if not (isinstance(equality.left, exp.Column) and isinstance(equality.right, exp.Column)):
+        return None
+    return frozenset((
+        (equality.left.table.lower(), equality.left.name.lower()),
+        (equality.right.table.lower(), equality.right.name.lower())
+    ))
+
+
+def _is_prohibited(statements: list) -> bool:
+    """Whether any statement drops, truncates, deletes, updates or alters data"""
+    for statement in statements:
+        if PROHIBITED_NODES and statement.find(*PROHIBITED_NODES):
+            return True
+        # Statements sqlglot only partially understands come back as raw commands
+        if isinstance(statement, exp.Command) and str(statement.this).lower() in PROHIBITED_COMMANDS:
+            return True
+    return False
+
+
+class NeedleAutomaton:
+    """Aho-Corasick automaton reporting which of a fixed set of strings occur in a text
+
+    Built once from all needles; a search is a single pass over the text
+    whose cost doesn't depend on how many needles there are.
+    """
+
+    def __init__(self, needles: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._outputs: List[Set[str]] = [set()]
+
+        for needle in dict.fromkeys(n for n in needles if n):
+            state = 0
+            for char in needle:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._outputs.append(set())
+                    self._goto[state][char] = next_state
+                state = next_state
+            self._outputs[state].add(needle)
+
+        # Breadth-first so each failure link points at an already finished state
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._outputs[next_state] |= self._outputs[self._fail[next_state]]
+
+    def find(self, text: str) -> Set[str]:
+        """Return every needle that occurs anywhere in ``text``"""
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        found: Set[str] = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                found |= outputs[state]
+        return found
+
+
+class CompiledRules:
+    """Validation rules compiled for single-pass matching
+
+    Every table name, trigger word, join condition and keyword the rules
+    refer to goes into one automaton. Rules are indexed by the needle that
+    activates them, so after the scan only rules whose trigger actually
+    occurs in the query are evaluated.
+    """
+
+    def __init__(self, rules: Dict[str, Any], file_key: Optional[Tuple[str, int, int]] = None):
+        self.rules = rules
+        self.file_key = file_key
+        # Content hash; cached verdicts are only reused under the same rules
+        self.version = hashlib.sha256(json.dumps(rules, sort_keys=True).encode()).hexdigest()
+        needles: List[str] = [*TEMPORAL_TERMS, *RANGE_TERMS, "concept_id"]
+
+        # trigger -> [(rule position, required table, message)]
+        self.required_tables: Dict[str, List[Tuple[int, str, str]]] = {}
+        for position, table in enumerate(rules.get("required_tables", [])):
+            trigger, name = table["when"].lower(), table["name"].lower()
+            self.required_tables.setdefault(trigger, []).append(
+                (position, name, f"Missing required table {table['name']} when querying {table['when']}")
+            )
+            needles += [trigger, name]
+
+        # first table -> [(rule position, second table, condition, predicate key, message)]
+        self.required_joins: Dict[str, List[Tuple[int, str, str, Optional[frozenset], str]]] = {}
+        for position, join in enumerate(rules.get("required_joins", [])):
+            table1, table2 = join["table1"].lower(), join["table2"].lower()
+            condition = _normalize_sql(join["condition"])
+            self.required_joins.setdefault(table1, []).append(
+                (position, table2, condition, _predicate_key(join["condition"]),
+                 f"Missing proper join condition between {join['table1']} and {join['table2']}")
+            )
+            needles += [table1, table2, condition]
+
+        # Not every rules file defines concept tables
+        self.concept_tables: Dict[str, List[Tuple[int, str]]] = {}
+        for position, concept_table in enumerate(rules.get("concept_tables", [])):
+            self.concept_tables.setdefault(concept_table.lower(), []).append(
+                (position, f"Warning: Querying {concept_table} without concept_id filter")
+            )
+            needles.append(concept_table.lower())
+
+        self.automaton = NeedleAutomaton(needles)
+
+    def check(self, sql_query: str) -> Tuple[bool, List[str]]:
+        """Apply the rules to a query
+
+        Returns:
+            Whether no rule was violated, and the issues (errors and
+            warnings) in rule order
+        """
+        found = self.automaton.find(_normalize_sql(sql_query))
+        errors: List[Tuple[int, int, str]] = []
+        warnings: List[Tuple[int, str]] = []
+
+        for trigger in found & self.required_tables.keys():
+            for position, name, message in self.required_tables[trigger]:
+                if name not in found:
+                    errors.append((0, position, message))
+
+        for table1 in found & self.required_joins.keys():
+            for position, table2, condition, _, message in self.required_joins[table1]:
+                if table2 in found and condition not in found:
+                    errors.append((1, position, message))
+
+        if "concept_id" not in found:
+            for table in found & self.concept_tables.keys():
+                warnings.extend(self.concept_tables[table])
+
+        issues = [message for _, _, message in sorted(errors)]
+        issues += [message for _, message in sorted(warnings)]
+        if found.intersection(TEMPORAL_TERMS) and not found.intersection(RANGE_TERMS):
+            issues.append("Warning: Temporal query without date range filter")
+
+        return not errors, issues
+
+    def check_ast(self, sql_query: str, analysis: Dict[str, Any]) -> Tuple[bool, List[str]]:
+        """Apply the rules using a parsed query's analysis instead of substrings
+
+        Trigger words still come from the query text (they describe intent,
+        not schema objects), skipping string literals so the verdict depends
+        only on the query's structure. A required table is satisfied by a real table
+        reference or by its key column (e.g. ``person_id``, which every OMOP
+        event table carries). Required joins are matched as resolved
+        predicates, so aliases and operand order don't matter.
+        """
+        found = self.automaton.find(_normalize_sql(_mask_literals(sql_query, "''")))
+        tables = analysis["tables"]
+        errors: List[Tuple[int, int, str]] = []
+        warnings: List[Tuple[int, str]] = []
+
+        for trigger in found & self.required_tables.keys():
+            for position, name, message in self.required_tables[trigger]:
+                if name not in tables and f"{name}_id" not in analysis["columns"]:
+                    errors.append((0, position, message))
+
+        for table1 in tables & self.required_joins.keys():
+            for position, table2, condition, predicate, message in self.required_joins[table1]:
+                if table2 not in tables:
+                    continue
+                joined = predicate in analysis["predicates"] if predicate else condition in found
+                if not joined:
+                    errors.append((1, position, message))
+
+        if not any("concept_id" in column for column in analysis["columns"]):
+            for table in tables & self.concept_tables.keys():
+                warnings.extend(self.concept_tables[table])
+
+        issues = [message for _, _, message in sorted(errors)]
+        issues += [message for _, message in sorted(warnings)]
+        temporal = any(term in column for column in analysis["columns"] for term in TEMPORAL_TERMS)
+        if temporal and not analysis["has_range_filter"]:
+            issues.append("Warning: Temporal query without date range filter")
+
+        return not errors, issues
+
+
+def _dry_run_error_is_fatal(error: Exception) -> bool:
+    """Whether a DuckDB planning error means the query is wrong rather than DuckDB-specific
+
+    Syntax errors, unknown tables or columns and type mismatches fail the
+    query; functions DuckDB lacks may still exist in the target database.
+    """
+    if isinstance(error, (duckdb.ParserException, duckdb.BinderException, duckdb.ConversionException)):
+        return True
+    if isinstance(error, duckdb.CatalogException):
+        return "Function with name" not in str(error)
+    return False
+
+
+class ShadowDatabase:
+    """Empty in-memory DuckDB copy of the OMOP schema for planning queries without data
+
+    Queries are bound and planned with EXPLAIN, which catches syntax errors,
+    unknown tables or columns and type mismatches in well under a
+    millisecond. Only SELECT statements are planned, so the shadow never
+    changes after it is built.
+
+    Args:
+        schema_data: Parsed OMOP schema JSON with ``tables`` and their ``columns``
+    """
+
+    def __init__(self, schema_data: Dict[str, Any]):
+        self.tables = len(schema_data["tables"])
+        self._lock = threading.Lock()
+        self._connection = duckdb.connect(":memory:")
+        self._connection.execute(f'CREATE SCHEMA "{SHADOW_SCHEMA}"')
+        for table in schema_data["tables"]:
+            columns = ", ".join(
+                f'"{column["name"]}" {SHADOW_COLUMN_TYPES.get(column.get("type"), "VARCHAR")}'
+                for column in table["columns"]
+            )
+            self._connection.execute(f'CREATE TABLE "{SHADOW_SCHEMA}"."{table["name"]}" ({columns})')
+        # Generated SQL may or may not qualify tables with the schema
+        self._connection.execute(f"SET search_path = '{SHADOW_SCHEMA}'")
+
+    def dry_run(self, sql: str, dialect: str) -> Dict[str, Any]:
+        """Plan every SELECT in ``sql``, translating it from ``dialect`` first if sqlglot is available
+
+        Returns:
+            ``is_valid`` and a list of issues; errors DuckDB alone would
+            raise are reported as warnings
+        """
+        if sqlglot is not None and dialect != "duckdb":
+            try:
+                sql = ";\n".join(sqlglot.transpile(sql, read=dialect, write="duckdb"))
+            except Exception:
+                pass  # DuckDB reports the syntax error itself
+
+        issues = []
+        with self._lock:
+            try:
+                for statement in self._connection.extract_statements(sql):
+                    if statement.type != duckdb.StatementType.SELECT:
+                        issues.append("Warning: Dry run skipped a non-SELECT statement")
+                        continue
+                    self._connection.execute("EXPLAIN " + statement.query)
+            except duckdb.Error as e:
+                message = str(e).splitlines()[0]
+                if _dry_run_error_is_fatal(e):
+                    return {"is_valid": False, "issues": [f"Dry run failed: {message}"]}
+                issues.append(f"Warning: Dry run could not plan query: {message}")
+
+        return {"is_valid": True, "issues": issues}
+
+
+def _create_shadow_database() -> Optional[ShadowDatabase]:
+    """Build the dry-run shadow from the OMOP schema file
+
+    Returns:
+        The shadow database, or None if duckdb isn't installed or
+        ``validation.dry_run`` is disabled
+
+    Raises:
+        Exception: If the schema file can't be read or parsed
+    """
+    if duckdb is None or not _validation_settings().get("dry_run", {}).get("enabled", True):
+        return None
+    from app.core.config import settings
+    with open(settings.get_omop_schema_path(), "r") as f:
+        return ShadowDatabase(json.load(f))
+
+
 # Initialize validation rules
 VALIDATION_RULES = _load_validation_rules()
+COMPILED_RULES = CompiledRules(VALIDATION_RULES, _rules_file_key())
+
+
+def current_rules() -> CompiledRules:
+    """Compiled rules, recompiled first if the rules file changed since loading
+
+    Callers take the returned object once per validation, so a reload that
+    swaps in a new rule set never changes the rules under a running check.
+    """
+    file_key = _rules_file_key()
+    if file_key is not None and file_key != COMPILED_RULES.file_key:
+        try:
+            reload_rules()
+        except Exception:
+            # Keep the current rules while the file is missing or half-written
+            pass
+    return COMPILED_RULES
+
+
+def reload_rules() -> Tuple[CompiledRules, bool]:
+    """Re-read and compile the rules file, then swap it in
+
+    The new rule set is compiled before anything is replaced, so a missing or
+    half-written file leaves the current rules in place.
+
+    Returns:
+        The active compiled rules and whether they changed
+
+    Raises:
+        Exception: If the rules file can't be read or parsed
+    """
+    global VALIDATION_RULES, COMPILED_RULES
+    file_key = _rules_file_key()
+    rules = _read_validation_rules()
+    compiled = CompiledRules(rules, file_key)
+    changed = compiled.version != COMPILED_RULES.version
+    VALIDATION_RULES, COMPILED_RULES = rules, compiled
+    return compiled, changed
+
+
+def _create_validation_cache() -> Optional[ValidationCache]:
+    """Build the verdict cache from ``validation.cache``, or None if disabled"""
+    cache_config = _validation_settings().get("cache", {})
+    if not cache_config.get("enabled", True):
+        return None
+    return ValidationCache(
+        max_entries=cache_config.get("max_entries", 2048),
+        ttl_seconds=cache_config.get("ttl_seconds", 3600)
+    )
+
+
+# Local and external verdicts keyed by ("local"|"external", ..., SQL fingerprint)
+_validation_cache = _create_validation_cache()
+
+# Built once at startup and swapped whole on reload
+try:
+    _shadow_database = _create_shadow_database()
+except Exception:
+    _shadow_database = None
 
 
 @mcp.tool(
@@ -38,78 +652,90 @@ def validate_query(sql_query: str) -> Dict[str, Any]:
     Args:
         sql_query: SQL query to validate
 
+    With ``validation.engine`` set to "ast" (the default) and sqlglot
+    installed, the query is parsed once and rules are checked against the
+    resolved tables and join predicates. SQL that can't be parsed falls back
+    to the heuristic text checks.
+
+    AST verdicts don't depend on literal values, so they are cached by
+    statement kinds, SQL fingerprint and rules version; repeated validations of the same query
+    (across endpoints, or after refinement) skip parsing entirely.
+
     Returns:
-        Validation result with is_valid flag and list of issues
+        Validation result with is_valid flag, list of issues and an
+        ``analysis`` of what was checked
     """
-    # Initialize validation result
+    rules = current_rules()
+    validation_settings = _validation_settings()
+    if validation_settings["engine"] == "ast" and sqlglot is not None:
+        cache_key = ("local", rules.version, validation_settings["dialect"], statement_kinds(sql_query),
+                     sql_fingerprint(sql_query))
+        cached = _validation_cache.get(cache_key) if _validation_cache else None
+        if cached is not None:
+            cached["analysis"]["sql_hash"] = sql_hash(sql_query)
+            return cached
+
+        statements, parse_error = parse_sql(sql_query, validation_settings["dialect"])
+        if statements is not None:
+            validation_result = _validate_ast(sql_query, statements, rules)
+            if _validation_cache:
+                _validation_cache.set(cache_key, validation_result)
+            return validation_result
+    else:
+        parse_error = None
+
+    validation_result = _validate_heuristic(sql_query, rules)
+    if parse_error:
+        validation_result["issues"].append(f"Warning: Could not parse SQL ({parse_error}); used heuristic checks")
+    return validation_result
+
+
+def _validate_ast(sql_query: str, statements: list, rules: CompiledRules) -> Dict[str, Any]:
+    """Validate parsed SQL; syntax is already known to be sound"""
     validation_result = {
         "is_valid": True,
         "issues": []
     }
 
-    # Convert SQL to lowercase for case-insensitive checks
-    sql_lower = sql_query.lower()
+    if _is_prohibited(statements):
+        validation_result["is_valid"] = False
+        validation_result["issues"].append(
+            "Query contains prohibited operations (DROP, TRUNCATE, DELETE, UPDATE, ALTER)")
+
+    analysis = analyze_statements(statements)
+    rules_valid, rule_issues = rules.check_ast(sql_query, analysis)
+    if not rules_valid:
+        validation_result["is_valid"] = False
+    validation_result["issues"].extend(rule_issues)
+
+    validation_result["analysis"] = {
+        "engine": "ast",
+        "sql_hash": sql_hash(sql_query),
+        "tables": sorted(analysis["tables"]),
+        "aliases": analysis["aliases"]
+    }
+    return validation_result
+
+
+def _validate_heuristic(sql_query: str, rules: CompiledRules) -> Dict[str, Any]:
+    """Validate SQL with text matching, for when it can't be parsed"""
+    # Initialize validation result
+    validation_result = {
+        "is_valid": True,
+        "issues": []
+    }
 
     # Check for prohibited operations
-    prohibited_patterns = [
-        r'\bdrop\s+table\b',
-        r'\btruncate\s+table\b',
-        r'\bdelete\s+from\b',
-        r'\bupdate\s+\w+\s+set\b',
-        r'\balter\s+table\b'
-    ]
-
-    for pattern in prohibited_patterns:
-        if re.search(pattern, sql_lower):
-            validation_result["is_valid"] = False
-            validation_result["issues"].append(
-                "Query contains prohibited operations (DROP, TRUNCATE, DELETE, UPDATE, ALTER)")
-            break
-
-    # Check for required tables
-    required_tables = VALIDATION_RULES.get("required_tables", [])
-    for table in required_tables:
-        trigger = table["when"].lower()
-        table_name = table["name"].lower()
-
-        # Check if the trigger word is in the query but the required table is not
-        if trigger in sql_lower and table_name not in sql_lower:
-            validation_result["is_valid"] = False
-            validation_result["issues"].append(f"Missing required table {table['name']} when querying {table['when']}")
-
-    # Check for required joins
-    required_joins = VALIDATION_RULES.get("required_joins", [])
-    for join in required_joins:
-        table1 = join["table1"].lower()
-        table2 = join["table2"].lower()
-        condition = join["condition"].lower()
-
-        # If both tables are in the query, check for the join condition
-        if table1 in sql_lower and table2 in sql_lower:
-            # Look for different variants of the join condition
-            condition_variants = [
-                condition,
-                condition.replace(" = ", "="),
-                condition.replace("=", " = "),
-                # Add other common variants
-            ]
-
-            if not any(variant in sql_lower for variant in condition_variants):
-                validation_result["is_valid"] = False
-                validation_result["issues"].append(
-                    f"Missing proper join condition between {join['table1']} and {join['table2']}")
-
-    # Check for concept_id filters when using concept tables
-    concept_tables = VALIDATION_RULES.get("concept_tables", [])
-    for concept_table in concept_tables:
-        table_name = concept_table.lower()
-        if table_name in sql_lower and "concept_id" not in sql_lower:
-            validation_result["issues"].append(f"Warning: Querying {concept_table} without concept_id filter")
-
-    # Check for date range filters on temporal queries
-    if any(term in sql_lower for term in ["date", "datetime", "time"]):
-        if not any(term in sql_lower for term in ["between", ">", "<", ">=", "<="]):
-            validation_result["issues"].append("Warning: Temporal query without date range filter")
+    if PROHIBITED_PATTERN.search(sql_query.lower()):
+        validation_result["is_valid"] = False
+        validation_result["issues"].append(
+            "Query contains prohibited operations (DROP, TRUNCATE, DELETE, UPDATE, ALTER)")
+
+    # Check table, join, concept and date-range rules in one pass over the query
+    rules_valid, rule_issues = rules.check(sql_query)
+    if not rules_valid:
+        validation_result["is_valid"] = False
+    validation_result["issues"].extend(rule_issues)
 
     # Check for basic SQL syntax issues (unbalanced parentheses, missing quotes)
     if sql_query.count('(') != sql_query.count(')'):
@@ -123,6 +749,7 @@ def validate_query(sql_query: str) -> Dict[str, Any]:
             validation_result["is_valid"] = False
             validation_result["issues"].append(f"SQL syntax error: Unclosed {quote} quotes")
 
+    validation_result["analysis"] = {"engine": "heuristic"}
     return validation_result
 
 
@@ -136,9 +763,17 @@ async def agent_validation(sql_query: str) -> Dict[str, Any]:
     Args:
         sql_query: SQL query to validate
 
+    Verdicts are cached by statement kinds and SQL fingerprint; failed calls
+    aren't cached.
+
     Returns:
         Validation result from external validator
     """
+    cache_key = ("external", statement_kinds(sql_query), sql_fingerprint(sql_query))
+    cached = _validation_cache.get(cache_key) if _validation_cache else None
+    if cached is not None:
+        return cached
+
     try:
         from app.core.config import settings
         validator_url = settings.config["agents"]["medical_validator"]["url"]
@@ -151,13 +786,17 @@ async def agent_validation(sql_query: str) -> Dict[str, Any]:
                 timeout=timeout
             )
             response.raise_for_status()
-            return response.json()
+            result = response.json()
     except Exception as e:
         return {
             "is_valid": False,
             "issues": [f"External validation failed: {str(e)}"]
         }
 
+    if _validation_cache and isinstance(result, dict):
+        _validation_cache.set(cache_key, result)
+    return result
+
 
 @mcp.tool(
     name="Comprehensive_Validation",
@@ -179,6 +818,13 @@ async def comprehensive_validation(sql_query: str) -> Dict[str, Any]:
     if not local_result["is_valid"]:
         return local_result
 
+    # Neither does a query that can't be planned against the schema
+    dry_run_result = dry_run_query(sql_query)
+    local_result["issues"].extend(dry_run_result["issues"])
+    if not dry_run_result["is_valid"]:
+        local_result["is_valid"] = False
+        return local_result
+
     # If local validation passes, try external validation
     try:
         external_result = await agent_validation(sql_query)
@@ -191,6 +837,80 @@ async def comprehensive_validation(sql_query: str) -> Dict[str, Any]:
     return local_result
 
 
+@mcp.tool(
+    name="Dry_Run_SQL",
+    description="Plan a SQL query with EXPLAIN against an empty in-memory copy of the OMOP schema"
+)
+def dry_run_query(sql_query: str) -> Dict[str, Any]:
+    """Check that a query binds and plans against the OMOP schema, without any data
+
+    Args:
+        sql_query: SQL query to dry-run
+
+    Returns:
+        Validation result with is_valid flag and list of issues; ``supported``
+        is False (and the query passes) when no shadow database is available
+    """
+    shadow = _shadow_database
+    if shadow is None:
+        return {"is_valid": True, "issues": [], "supported": False}
+    return {**shadow.dry_run(sql_query, _validation_settings()["dialect"]), "supported": True}
+
+
+@mcp.tool(
+    name="Get_Validation_Cache_Stats",
+    description="Get hit/miss counters for the validation verdict and parse caches"
+)
+def get_validation_cache_stats() -> Dict[str, Any]:
+    """Report validation cache counters
+
+    Returns:
+        Verdict cache counters (None if disabled), parse cache size and the
+        version hash of the loaded rules
+    """
+    return {
+        "verdicts": _validation_cache.stats() if _validation_cache else None,
+        "parsed_queries": len(_parse_cache),
+        "rules_version": COMPILED_RULES.version
+    }
+
+
+@mcp.tool(
+    name="Reload_Resources",
+    description="Reload validation rules and the dry-run schema from disk and drop cached verdicts"
+)
+def reload_resources() -> Dict[str, Any]:
+    """Swap in a freshly compiled rule set and a rebuilt dry-run shadow database
+
+    Validations already running finish with the rules and shadow they
+    started with; parsed queries stay cached since parsing doesn't depend
+    on the rules.
+
+    Returns:
+        Rules version, whether it changed, how many cached verdicts were
+        dropped and the shadow's table count, or an error if the rules or
+        schema file couldn't be loaded
+    """
+    global _shadow_database
+    try:
+        rules, changed = reload_rules()
+    except Exception as e:
+        return {"error": f"Failed to reload validation rules: {str(e)}", "rules_version": COMPILED_RULES.version}
+
+    dropped = 0
+    if _validation_cache:
+        dropped = _validation_cache.stats()["entries"]
+        _validation_cache.clear()
+
+    result = {"rules_version": rules.version, "changed": changed, "dropped_verdicts": dropped}
+    try:
+        _shadow_database = _create_shadow_database()
+        result["shadow_tables"] = _shadow_database.tables if _shadow_database else None
+    except Exception as e:
+        result["error"] = f"Failed to rebuild dry-run schema: {str(e)}"
+    return result
+
+
 if __name__ == "__main__":
     # Run the server
     mcp.run(transport="stdio")
\ No newline at end of file
@@ -6,7 +6,7 @@ and implementing the A2A protocol for agent-to-agent communication.
 """
 
 from .a2a import A2AProtocol
-from .mcp_client import MCPClient
+from .mcp_client import MCPClient, MCPClientPool
 from .main import MCPOrchestrator
 
-__all__ = ['A2AProtocol', 'MCPClient', 'MCPOrchestrator']
\ No newline at end of file
+__all__ = ['A2AProtocol', 'MCPClient', 'MCPClientPool', 'MCPOrchestrator']
\ No newline at end of file
@@ -0,0 +1,291 @@
+import asyncio
+import hashlib
+import math
+import os
+import re
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+
+logger = logging.getLogger("orchestrator.cache")
+
+
+class SchemaCache:
+    """Caches the rendered OMOP schema prompt fetched from the SQL server
+
+    The cached text is keyed on the schema file's mtime and size, and on its
+    content hash when those change, so edits to the schema file invalidate it
+    without a restart while unchanged schemas are fetched once per process.
+    """
+
+    def __init__(self, schema_path: Optional[str] = None):
+        self.schema_path = schema_path
+        self.hits = 0
+        self.misses = 0
+        self._text: Optional[str] = None
+        self._file_key: Optional[Tuple[int, int]] = None
+        self._hash: Optional[str] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def version(self) -> Optional[str]:
+        """Hash identifying the cached schema, or None before the first load"""
+        return self._hash
+
+    def _file_state(self) -> Tuple[Optional[Tuple[int, int]], Optional[str]]:
+        """Return the schema file's (mtime, size) key and content hash if it's readable"""
+        if not self.schema_path:
+            return None, None
+        try:
+            stat = os.stat(self.schema_path)
+            file_key = (stat.st_mtime_ns, stat.st_size)
+            if file_key == self._file_key:
+                return file_key, self._hash
+            with open(self.schema_path, "rb") as f:
+                return file_key, hashlib.sha256(f.read()).hexdigest()
+        except OSError as e:
+            logger.warning(f"Cannot stat schema file {self.schema_path}: {e}")
+            return None, None
+
+    async def get(self, loader: Callable[[], Awaitable[Optional[str]]]) -> Optional[str]:
+        """Return the cached schema, calling ``loader`` to refresh it when stale
+
+        Args:
+            loader: Coroutine function fetching the rendered schema
+
+        Returns:
+            Rendered schema text, or whatever the loader returned on failure
+        """
+        async with self._lock:
+            file_key, file_hash = self._file_state()
+            if self._text is not None and file_hash is not None and file_hash == self._hash:
+                self._file_key = file_key
+                self.hits += 1
+                return self._text
+
+            self.misses += 1
+            text = await loader()
+
+            # Don't cache failures; the SQL server reports them in-band
+            if not text or text.startswith("OMOP CDM Schema unavailable"):
+                return text
+
+            self._text = text
+            self._file_key = file_key
+            self._hash = file_hash or hashlib.sha256(text.encode()).hexdigest()
+            return text
+
+    def invalidate(self):
+        """Drop the cached schema so the next request reloads it"""
+        self._text = None
+        self._file_key = None
+        self._hash = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Report cache counters"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "schema_hash": self._hash
+        }
+
+
+def normalize_question(question: str) -> str:
+    """Normalize a natural language question for cache keys
+
+    Lowercases, drops punctuation and collapses whitespace so trivially
+    different phrasings ("How many patients have diabetes?" and "how many
+    patients have diabetes") share a key.
+    """
+    words = re.sub(r"[^\w\s]", " ", question.lower()).split()
+    return " ".join(words)
+
+
+def _unit_vector(vector: List[float]) -> List[float]:
+    """Scale a vector to length 1, so cosine similarity becomes a dot product"""
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm else list(vector)
+
+
+class SQLCacheBackend:
+    """Interface for caches of validated NL→SQL results
+
+    Keys are ``(normalized_question, model_name, schema_hash)`` tuples; the
+    model and schema hash together form the scope within which similarity
+    lookups are allowed to match.
+    """
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[Dict[str, Any]]:
+        """Return the cached entry for an exact key, if present and fresh"""
+        raise NotImplementedError
+
+    def find_similar(self, embedding: List[float], scope: Tuple[str, str],
+                     threshold: float) -> Optional[Dict[str, Any]]:
+        """Return the most similar fresh entry within a scope above the threshold"""
+        return None
+
+    def set(self, key: Tuple[str, str, str], value: Dict[str, Any], embedding: Optional[List[float]] = None):
+        """Store an entry, optionally with the question's embedding"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Drop all entries"""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        """Report cache counters"""
+        return {}
+
+
+class InMemorySQLCache(SQLCacheBackend):
+    """In-process NL→SQL cache with TTL expiry and LRU eviction
+
+    Similarity lookups run on the event loop, so they only scan the
+    ``max_similar_entries`` most recently stored embeddings of a scope.
+    Older entries stay reachable by exact key.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, max_similar_entries: int = 256):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_similar_entries = max_similar_entries
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (expires_at, value)
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # scope -> key -> unit-length embedding, oldest first
+        self._embeddings: Dict[Tuple[str, str], "OrderedDict[Tuple[str, str, str], List[float]]"] = {}
+
+    def _is_fresh(self, key, expires_at: float) -> bool:
+        """Check an entry's TTL, dropping it if expired"""
+        if expires_at > time.monotonic():
+            return True
+        self._remove(key)
+        return False
+
+    def _remove(self, key: Tuple[str, str, str]):
+        """Drop an entry and its embedding"""
+        self._entries.pop(key, None)
+        scoped = self._embeddings.get(key[1:])
+        if scoped is not None:
+            scoped.pop(key, None)
+            if not scoped:
+                del self._embeddings[key[1:]]
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None or not self._is_fresh(key, entry[0]):
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def find_similar(self, embedding: List[float], scope: Tuple[str, str],
+                     threshold: float) -> Optional[Dict[str, Any]]:
+        query = _unit_vector(embedding)
+        best_key, best_score = None, threshold
+        for key, cached_embedding in list(self._embeddings.get(scope, {}).items()):
+            if not self._is_fresh(key, self._entries[key][0]):
+                continue
+            score = sum(x * y for x, y in zip(query, cached_embedding))
+            if score >= best_score:
+                best_key, best_score = key, score
+
+        if best_key is None:
+            return None
+
+        self._entries.move_to_end(best_key)
+        self.similar_hits += 1
+        return self._entries[best_key][1]
+
+    def set(self, key: Tuple[str, str, str], value: Dict[str, Any], embedding: Optional[List[float]] = None):
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+        if embedding and key in self._entries and self.max_similar_entries > 0:
+            scoped = self._embeddings.setdefault(key[1:], OrderedDict())
+            scoped[key] = _unit_vector(embedding)
+            while len(scoped) > self.max_similar_entries:
+                scoped.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self._embeddings.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "similarity_entries": sum(len(scoped) for scoped in self._embeddings.values()),
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one shared execution
+
+    The first caller for a key starts the work; callers arriving while it is
+    in flight await the same task and receive the same result (or error).
+    Nothing is kept once the call completes. If every caller waiting on a
+    call goes away, the call itself is cancelled.
+    """
+
+    def __init__(self):
+        # key -> [task, number of callers waiting on it]
+        self._calls: Dict[Any, List[Any]] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def run(self, key: Any, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Run ``func`` unless a call with the same key is already in flight
+
+        Args:
+            key: Hashable identity of the call
+            func: Coroutine function performing the work
+
+        Returns:
+            The shared call's result
+        """
+        entry = self._calls.get(key)
+        if entry is None:
+            self.calls += 1
+            task = asyncio.create_task(func())
+            entry = self._calls[key] = [task, 0]
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.shared += 1
+            logger.debug(f"Joining in-flight call for {key!r}")
+
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not task.done():
+                # Unregister first so a new caller starts fresh instead of joining a dying call
+                self._forget(key, task)
+                task.cancel()
+
+    def _forget(self, key: Any, task: asyncio.Task):
+        """Drop a finished call so later callers start a fresh one"""
+        entry = self._calls.get(key)
+        if entry is not None and entry[0] is task:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "shared": self.shared
+        }
@@ -0,0 +1,30 @@
+import json
+import os
+import logging
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger("orchestrator.config")
+
+# Project root, used to resolve relative paths in the configuration
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Location of the configuration file, overridable for deployments
+CONFIG_PATH = os.environ.get("OMCP_CONFIG", os.path.join(BASE_DIR, "config", "config.json"))
+
+
+def load_config(path: Optional[str] = None) -> Dict[str, Any]:
+    """Load the orchestrator configuration
+
+    Args:
+        path: Optional path overriding CONFIG_PATH
+
+    Returns:
+        Parsed configuration, or an empty dict if it can't be read
+    """
+    config_path = path or CONFIG_PATH
+    try:
+        with open(config_path, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"Could not load configuration from {config_path}: {e}")
+        return {}
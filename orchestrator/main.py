@@ -1,24 +1,91 @@
 import asyncio
+import hashlib
+import json
 import os
-import subprocess
 import logging
-from typing import Dict, Any, List, Optional, Tuple
-from fastapi import FastAPI, Request, HTTPException, status, Depends, APIRouter
+from typing import Dict, Any, AsyncIterator, Awaitable, List, Optional, Tuple
+from fastapi import FastAPI, Request, HTTPException, status, Depends, APIRouter, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
 from .a2a import A2AProtocol
-from .mcp_client import MCPClient
+from .cache import InMemorySQLCache, SchemaCache, SingleFlight, SQLCacheBackend, normalize_question
+from .config import BASE_DIR, load_config
+from .mcp_client import MCPClient, MCPClientPool
+from .pipeline import PipelineAbort, PipelineRun, Stage
+from .summarize import execution_time_of, summarize_result
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("orchestrator")
 
+# Maximum size of a single response line read from an MCP server
+STREAM_LIMIT = 64 * 1024 * 1024
+
+# Per-stage time limits in seconds, overridable under pipeline.timeouts
+DEFAULT_STAGE_TIMEOUTS = {
+    "schema": 30,
+    "generate": 250,
+    "local_validation": 15,
+    "external_validation": 20,
+    "dry_run": 5,
+    "cost_estimate": 15,
+    "validation": 60,
+    "execute": 300,
+    "answer": 250,
+    "insights": 35
+}
+
+# Seconds between checks for a client that has hung up on a long request
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# Extra seconds a result stream may run past its deadline, so the SQL server's own timeout error arrives first
+STREAM_DEADLINE_GRACE = 2.0
+
+# Callers that can open the server-local files behind arrow_file results
+LOCAL_HOSTS = ("127.0.0.1", "::1", "localhost")
+
+# EXPLAIN-based limits applied before generated SQL runs, overridable under database.cost_gate
+DEFAULT_COST_GATE = {
+    "enabled": False,
+    "max_estimated_rows": 100_000_000,
+    "max_estimated_cost": 50_000_000,
+    "action": "reject",  # or "limit" to wrap oversized SELECTs in a LIMIT
+    "auto_limit_rows": 10_000,
+    "on_unknown": "warn"  # or "limit"/"reject" for SQL without a usable estimate
+}
+
+
+def limit_sql(sql_query: str, max_rows: int) -> str:
+    """Wrap a SELECT so it returns at most ``max_rows`` rows"""
+    return f"SELECT * FROM (\n{sql_query.strip().rstrip(';')}\n) AS limited_result LIMIT {int(max_rows)}"
+
+
+# Servers to start when the configuration doesn't list any
+DEFAULT_SERVER_CONFIGS = {
+    "sql": {"script_path": "mcp_servers/sql_server.py"},
+    "ollama": {"script_path": "mcp_servers/ollama_server.py"},
+    "validation": {"script_path": "mcp_servers/validation_server.py"},
+    "agent": {"script_path": "mcp_servers/agent_server.py"}
+}
+
 
 # Define response models
 class Query(BaseModel):
     question: str
     context: Optional[str] = None
+    output_format: Optional[str] = None  # csv (default), json, arrow or arrow_file
+    timeout: Optional[float] = None  # seconds; defaults to pipeline.request_timeout
+
+
+class BatchQuery(BaseModel):
+    questions: List[str]
+    context: Optional[str] = None
+    output_format: Optional[str] = None
+    include_answers: bool = False
+    max_concurrency: Optional[int] = None
+    timeout: Optional[float] = None  # seconds; defaults to batch.timeout, then pipeline.request_timeout
 
 
 class RefinementInfo(BaseModel):
@@ -53,185 +120,984 @@ class ValidationResult(BaseModel):
 class MCPOrchestrator:
     """Orchestrator for multiple MCP servers with A2A protocol"""
 
-    def __init__(self):
-        self.clients: Dict[str, MCPClient] = {}
+    def __init__(self, config: Optional[Dict[str, Any]] = None, sql_cache: Optional[SQLCacheBackend] = None):
+        self.config = config if config is not None else load_config()
+        self.clients: Dict[str, MCPClientPool] = {}
         self.a2a = A2AProtocol()
 
-    async def start_servers(self):
-        """Start all MCP servers"""
-        # Define server configurations - adjust paths based on your project structure
-        server_configs = [
-            {
-                "name": "sql",
-                "script_path": "mcp_servers/sql_server.py"
-            },
-            {
-                "name": "ollama",
-                "script_path": "mcp_servers/ollama_server.py"
-            },
-            {
-                "name": "validation",
-                "script_path": "mcp_servers/validation_server.py"
-            },
-            {
-                "name": "agent",
-                "script_path": "mcp_servers/agent_server.py"
-            }
-        ]
+        mcp_config = self.config.get("mcp", {})
+        self.server_configs: Dict[str, Dict[str, Any]] = mcp_config.get("servers") or DEFAULT_SERVER_CONFIGS
+        self.discovery_timeout = mcp_config.get("orchestrator", {}).get("discovery_timeout", 5)
+        self.startup_task: Optional[asyncio.Task] = None
+
+        database_config = self.config.get("database", {})
+        schema_file = self.config.get("omop_cdm", {}).get("schema_file", "omop_cdm_schema.json")
+        self.schema_cache = SchemaCache(
+            os.path.join(BASE_DIR, database_config.get("schema_directory", "schemas/"), schema_file)
+        )
+
+        # NL→SQL cache; pass a custom SQLCacheBackend to plug in a shared store
+        self.model_name = self.config.get("ollama", {}).get("default_model", "")
+        sql_cache_config = self.config.get("cache", {}).get("sql", {})
+        self.sql_cache_similarity: Dict[str, Any] = sql_cache_config.get("similarity", {})
+        if sql_cache is None and sql_cache_config.get("enabled", False):
+            sql_cache = InMemorySQLCache(
+                max_entries=sql_cache_config.get("max_entries", 1024),
+                ttl_seconds=sql_cache_config.get("ttl_seconds", 3600),
+                max_similar_entries=self.sql_cache_similarity.get("max_entries", 256)
+            )
+        self.sql_cache = sql_cache
 
-        # Start each server
-        for config in server_configs:
-            await self.start_server(config["name"], config["script_path"])
+        # Identical questions arriving together share one pipeline run
+        self.single_flight = (
+            SingleFlight() if self.config.get("cache", {}).get("single_flight", {}).get("enabled", True) else None
+        )
+
+        # Limits on how much of a result is shown to the LLM when answering
+        self.result_summary: Dict[str, Any] = self.config.get("result_summary", {})
+
+        # Opt-in: run read-only SELECTs while external validation is still in flight
+        self.speculative_execution = self.config.get("pipeline", {}).get("speculative_execution", False)
+
+        # End-to-end deadline for a query unless the request sets its own
+        self.request_timeout: float = self.config.get("pipeline", {}).get("request_timeout", 600)
+
+        # Time limits for each pipeline stage
+        self.stage_timeouts: Dict[str, float] = {
+            **DEFAULT_STAGE_TIMEOUTS,
+            **self.config.get("pipeline", {}).get("timeouts", {})
+        }
+
+        # Planner estimates checked before executing generated SQL
+        self.cost_gate: Dict[str, Any] = {**DEFAULT_COST_GATE, **database_config.get("cost_gate", {})}
+
+        # Rows per chunk when streaming query results
+        self.stream_chunk_size = database_config.get("stream_chunk_size", 1000)
+
+        # Hot reload of the schema and validation rules across server replicas
+        reload_config = self.config.get("reload", {})
+        self.reload_timeout: float = reload_config.get("timeout", 30)
+        self.reload_watch_interval: float = reload_config.get("watch_interval", 0)
+        self.reload_paths = [
+            self.schema_cache.schema_path,
+            os.path.join(BASE_DIR, database_config.get("schema_directory", "schemas/"),
+                         self.config.get("omop_cdm", {}).get("validation_rules", "omop_validation_rules.json"))
+        ]
+        self.watch_task: Optional[asyncio.Task] = None
+        self._reload_lock = asyncio.Lock()
 
-    async def start_server(self, name: str, script_path: str):
-        """Start a single MCP server"""
+    async def start_servers(self):
+        """Start all MCP servers configured under ``mcp.servers`` concurrently"""
+        await asyncio.gather(*(
+            self.start_server(
+                name,
+                server_config["script_path"],
+                env_vars=server_config.get("env_vars"),
+                pool_size=server_config.get("pool_size", 1)
+            )
+            for name, server_config in self.server_configs.items()
+        ))
+
+        ready = [name for name, pool in self.clients.items() if pool.ready]
+        logger.info(f"MCP servers ready: {len(ready)}/{len(self.server_configs)} ({', '.join(ready)})")
+
+    async def start_server(self, name: str, script_path: str, env_vars: Optional[Dict[str, str]] = None,
+                           pool_size: int = 1):
+        """Start a pool of replica processes for a single MCP server"""
+        # Make script path absolute based on project root
+        abs_script_path = os.path.join(BASE_DIR, script_path)
+        env = {**os.environ, **(env_vars or {})}
+
+        # Register the pool up front so /health can report it while replicas boot
+        pool = MCPClientPool(name)
+        self.clients[name] = pool
+
+        await asyncio.gather(*(
+            self._start_replica(pool, f"{name}[{replica}]", abs_script_path, env)
+            for replica in range(max(1, pool_size))
+        ))
+
+        if not pool.replicas:
+            logger.error(f"No replicas of MCP server {name} could be started")
+
+    async def _start_replica(self, pool: MCPClientPool, replica_name: str, abs_script_path: str,
+                             env: Dict[str, str]):
+        """Start one server process, run its readiness handshake and add it to the pool"""
         try:
-            # Make script path absolute based on project root
-            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            abs_script_path = os.path.join(base_dir, script_path)
-
-            logger.info(f"Starting MCP server: {name} with script {abs_script_path}")
-
-            # Start the server process
-            process = subprocess.Popen(
-                ["python", abs_script_path],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                bufsize=1,  # Line buffered
-                universal_newlines=False  # Use bytes for stdin/stdout
+            logger.info(f"Starting MCP server: {replica_name} with script {abs_script_path}")
+
+            # Start the server process with non-blocking pipes
+            process = await asyncio.create_subprocess_exec(
+                "python", abs_script_path,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env=env,
+                limit=STREAM_LIMIT  # Query results arrive as a single line
             )
 
             # Create client and start processing
-            client = MCPClient(name, process)
-            self.clients[name] = client
+            client = MCPClient(replica_name, process, discovery_timeout=self.discovery_timeout)
+            pool.add_replica(client)
             await client.start()
 
-            logger.info(f"Started MCP server: {name}")
+            if client.ready:
+                logger.info(f"Started MCP server: {replica_name}")
+            else:
+                logger.warning(f"Started MCP server {replica_name}, but it missed its readiness deadline")
         except Exception as e:
-            logger.error(f"Failed to start MCP server {name}: {e}")
+            logger.error(f"Failed to start MCP server {replica_name}: {e}")
+
+    def readiness(self) -> Dict[str, bool]:
+        """Report whether each configured MCP server has at least one ready replica"""
+        return {
+            name: name in self.clients and self.clients[name].ready
+            for name in self.server_configs
+        }
 
     async def stop_servers(self):
         """Stop all MCP servers"""
+        for task in (self.watch_task, self.startup_task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
         for name, client in self.clients.items():
             await client.stop()
             logger.info(f"Stopped MCP server: {name}")
         self.clients = {}
 
-    async def process_natural_language_query(self, query: str, context: Optional[str] = None) -> Dict[str, Any]:
-        """Process a natural language query using the orchestrated MCP servers"""
+    async def reload_resources(self) -> Dict[str, Any]:
+        """Reload the schema and validation rules in every server replica
+
+        Each replica compiles the new resources before swapping them in, so
+        requests already running finish with the version they started with.
+        Cached SQL was validated against the old rules and schema, so it is
+        dropped along with the orchestrator's schema cache.
+
+        Returns:
+            Per-server lists of replica reload results
+        """
+        async with self._reload_lock:
+            names = [name for name in ("sql", "validation") if name in self.clients]
+            results = await asyncio.gather(*(
+                self.clients[name].broadcast("Reload_Resources", {}, timeout=self.reload_timeout)
+                for name in names
+            ))
+
+            self.schema_cache.invalidate()
+            if self.sql_cache:
+                self.sql_cache.clear()
+
+            logger.info("Reloaded schema and validation rules")
+            return dict(zip(names, results))
+
+    def _watched_file_keys(self) -> List[Optional[Tuple[int, int]]]:
+        """(mtime, size) of each watched file, None for files that can't be read"""
+        keys = []
+        for path in self.reload_paths:
+            try:
+                stat = os.stat(path)
+                keys.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                keys.append(None)
+        return keys
+
+    async def watch_resources(self):
+        """Poll the schema and rules files, reloading servers when either changes"""
+        known = self._watched_file_keys()
+        while True:
+            await asyncio.sleep(self.reload_watch_interval)
+            current = self._watched_file_keys()
+            if current == known:
+                continue
+
+            known = current
+            logger.info("Schema or validation rules changed on disk; reloading")
+            try:
+                await self.reload_resources()
+            except Exception as e:
+                logger.warning(f"Failed to reload resources: {e}")
+
+    async def get_schema(self) -> Optional[str]:
+        """Get the rendered OMOP schema, served from cache while the schema file is unchanged"""
+        return await self.schema_cache.get(lambda: self.clients["sql"].call_tool("Get_OMOP_Schema", {}))
+
+    async def _get_embedding(self, text: str) -> Optional[List[float]]:
+        """Embed a question for similarity lookups, or None if embeddings are unavailable"""
+        if not self.sql_cache_similarity.get("enabled", False):
+            return None
         try:
-            # Step 1: Get schema if context not provided
-            if not context:
-                logger.info("Getting OMOP schema")
-                context = await self.clients["sql"].call_tool("Get_OMOP_Schema", {})
-
-            # Step 2: Generate SQL
-            logger.info(f"Generating SQL for query: {query}")
-            sql_result = await self.clients["ollama"].call_tool("Generate_SQL", {
-                "prompt": query,
-                "schema": context
+            return await self.clients["ollama"].call_tool("Generate_Embedding", {
+                "text": text,
+                "model_name": self.sql_cache_similarity.get("embedding_model")
             })
+        except Exception as e:
+            logger.warning(f"Failed to embed question for cache lookup: {e}")
+            return None
+
+    def summarize_for_answer(self, query_result: Any) -> Any:
+        """Cap and summarize a query result before it's embedded in the answer prompt"""
+        if not self.result_summary.get("enabled", True):
+            return query_result
+
+        return summarize_result(
+            query_result,
+            max_rows=self.result_summary.get("max_rows", 100),
+            sample_rows=self.result_summary.get("sample_rows", 20),
+            top_k=self.result_summary.get("top_k", 5)
+        )
 
-            if not sql_result:
-                raise Exception("Failed to generate SQL")
+    async def generate_validated_sql(self, query: str, context: str) -> Dict[str, Any]:
+        """Generate SQL for a question and validate it, refining if needed
 
-            # Parse SQL result (tuple of SQL query and confidence)
-            sql_query, confidence = sql_result
-            logger.info(f"Generated SQL: {sql_query}")
+        Runs the generate/validate stages of the pipeline. SQL that passed
+        every check is cached keyed on the normalized question, model name
+        and schema hash, so repeated questions skip both generation and
+        validation.
 
-            # Step 3: Validate and refine SQL if needed
-            logger.info("Validating SQL")
-            validation_result = await self.clients["validation"].call_tool("Comprehensive_Validation", {
-                "sql_query": sql_query
-            })
+        Returns:
+            Dict with ``sql``, ``confidence``, ``validation`` and
+            ``refinement_info``, plus ``error`` if validation failed
+        """
+        run = PipelineRun(self._sql_stages(), inputs={"question": query, "schema": context})
+        try:
+            results = await run.execute()
+        except PipelineAbort as e:
+            return e.result
+        return results["validation"]
+
+    def _sql_stages(self) -> List[Stage]:
+        """Stages turning a question and schema into validated SQL
+
+        Local validation, the dry run against the validation server's empty
+        DuckDB copy of the schema, external validation and the EXPLAIN cost
+        estimate run concurrently; a local or dry-run failure cancels the
+        slower checks since their verdicts would be ignored.
+        """
+        timeouts = self.stage_timeouts
+        return [
+            Stage("generate", self._stage_generate, deps=("question", "schema"), timeout=timeouts["generate"]),
+            Stage("local_validation", self._stage_local_validation, deps=("generate",),
+                  timeout=timeouts["local_validation"]),
+            Stage("dry_run", self._stage_dry_run, deps=("generate",), timeout=timeouts["dry_run"], optional=True),
+            Stage("external_validation", self._stage_external_validation, deps=("generate",),
+                  timeout=timeouts["external_validation"], optional=True),
+            Stage("cost_estimate", self._stage_cost_estimate, deps=("generate",),
+                  timeout=timeouts["cost_estimate"], optional=True),
+            Stage("validation", self._stage_validation,
+                  deps=("local_validation", "dry_run", "external_validation", "cost_estimate"),
+                  timeout=timeouts["validation"]),
+        ]
 
-            # Store original SQL for refinement info
-            original_sql = sql_query
-
-            # Attempt refinement if validation failed
-            refinement_attempted = False
-            refinement_successful = False
-
-            if not validation_result["is_valid"]:
-                logger.info("Validation failed, attempting refinement")
-                refinement_attempted = True
-
-                # Call refinement tool if we implemented it
-                if "Refine_SQL" in self.clients["validation"].available_tools:
-                    refined_result = await self.clients["validation"].call_tool("Refine_SQL", {
-                        "sql_query": sql_query,
-                        "issues": validation_result["issues"]
-                    })
-
-                    if refined_result and refined_result.get("is_valid", False):
-                        logger.info("Refinement successful")
-                        sql_query = refined_result["refined_sql"]
-                        validation_result = refined_result
-                        refinement_successful = True
-                    else:
-                        logger.info("Refinement failed")
-
-                # If validation still fails and no refinement, return error
-                if not refinement_successful and not validation_result["is_valid"]:
-                    return {
-                        "error": "SQL validation failed",
-                        "validation": validation_result,
-                        "sql": sql_query,
-                        "refinement_info": {
-                            "original_sql": original_sql,
-                            "was_refined": refinement_attempted
-                        }
-                    }
+    def _query_stages(self) -> List[Stage]:
+        """All stages of the natural language query pipeline
+
+        Agent insights only need the validated SQL, so they run alongside
+        execution and answer generation. With speculative execution enabled,
+        execution starts once local validation, the dry run and the cost gate pass.
+        """
+        timeouts = self.stage_timeouts
+        if self.speculative_execution:
+            execute = Stage("execute", self._stage_speculative_execute,
+                            deps=("local_validation", "dry_run", "cost_estimate"), timeout=timeouts["execute"])
+        else:
+            execute = Stage("execute", self._stage_execute, deps=("validation",), timeout=timeouts["execute"])
+
+        return [
+            Stage("schema", self._stage_schema, deps=("question",), timeout=timeouts["schema"]),
+            *self._sql_stages(),
+            execute,
+            Stage("answer", self._stage_answer, deps=("execute",), timeout=timeouts["answer"]),
+            Stage("insights", self._stage_insights, deps=("validation",), timeout=timeouts["insights"],
+                  optional=True),
+        ]
 
-            # Step 4: Execute SQL
-            logger.info("Executing SQL")
-            query_result = await self.clients["sql"].call_tool("Execute_SQL_Query", {
-                "query": sql_query
-            })
+    async def _stage_schema(self, run: PipelineRun) -> Optional[str]:
+        """Use the caller's context, or the cached OMOP schema"""
+        if run.results.get("context"):
+            return run.results["context"]
+        logger.info("Getting OMOP schema")
+        return await self.get_schema()
+
+    async def _stage_generate(self, run: PipelineRun) -> Dict[str, Any]:
+        """Look the question up in the SQL cache, generating SQL on a miss"""
+        query = run.results["question"]
+        context = run.results["schema"]
+
+        cache_key = None
+        embedding = None
+        if self.sql_cache:
+            schema_hash = hashlib.sha256(context.encode()).hexdigest()
+            cache_key = (normalize_question(query), self.model_name, schema_hash)
+
+            cached = self.sql_cache.get(cache_key)
+            if cached is None:
+                embedding = await self._get_embedding(cache_key[0])
+                if embedding:
+                    cached = self.sql_cache.find_similar(
+                        embedding, cache_key[1:], self.sql_cache_similarity.get("threshold", 0.95)
+                    )
+            if cached is not None:
+                logger.info("Using cached SQL for query")
+                return {"cached": {**cached, "cached": True}}
+
+        logger.info(f"Generating SQL for query: {query}")
+        sql_result = await self.clients["ollama"].call_tool("Generate_SQL", {
+            "prompt": query,
+            "schema": context
+        })
 
-            if not query_result:
-                raise Exception("Failed to execute SQL query")
+        if not sql_result:
+            raise Exception("Failed to generate SQL")
 
-            # Step 5: Generate answer
-            logger.info("Generating answer")
-            answer = await self.clients["ollama"].call_tool("Generate_Answer", {
-                "question": query,
-                "sql_query": sql_query,
-                "results": query_result
-            })
+        # Parse SQL result (tuple of SQL query and confidence)
+        sql_query, confidence = sql_result
+        logger.info(f"Generated SQL: {sql_query}")
 
-            if not answer:
-                raise Exception("Failed to generate answer")
+        return {
+            "cached": None,
+            "sql": sql_query,
+            "confidence": confidence,
+            "cache_key": cache_key,
+            "embedding": embedding
+        }
 
-            # Step 6: Get agent insights (optional)
-            agent_insights = None
-            try:
-                logger.info("Getting agent insights")
-                agent_insights = await self.clients["agent"].call_tool("Get_Agent_Insights", {
-                    "prompt": query,
+    async def _stage_local_validation(self, run: PipelineRun) -> Optional[Dict[str, Any]]:
+        """Validate generated SQL against the local OMOP rules"""
+        generated = run.results["generate"]
+        if generated["cached"]:
+            run.cancel("dry_run")
+            run.cancel("external_validation")
+            run.cancel("cost_estimate")
+            return None
+
+        logger.info("Validating SQL locally")
+        result = await self.clients["validation"].call_tool("Validate_SQL_Query", {
+            "sql_query": generated["sql"]
+        })
+
+        # An external verdict or cost estimate can't rescue a local failure, so don't wait for them
+        if not result["is_valid"]:
+            run.cancel("dry_run")
+            run.cancel("external_validation")
+            run.cancel("cost_estimate")
+        return result
+
+    async def _stage_dry_run(self, run: PipelineRun) -> Optional[Dict[str, Any]]:
+        """Plan generated SQL against an empty DuckDB copy of the OMOP schema (optional)"""
+        generated = run.results["generate"]
+        if generated["cached"] or "Dry_Run_SQL" not in self.clients["validation"].available_tools:
+            return None
+
+        logger.info("Dry-running SQL against the shadow schema")
+        result = await self.clients["validation"].call_tool("Dry_Run_SQL", {
+            "sql_query": generated["sql"]
+        })
+        if not result.get("supported", True):
+            return None
+
+        # Unknown columns or syntax errors won't get past the slower checks either
+        if not result["is_valid"]:
+            run.cancel("external_validation")
+            run.cancel("cost_estimate")
+        return result
+
+    async def _stage_external_validation(self, run: PipelineRun) -> Optional[Dict[str, Any]]:
+        """Validate generated SQL with the external validator agent"""
+        generated = run.results["generate"]
+        if generated["cached"]:
+            return None
+
+        logger.info("Validating SQL externally")
+        return await self.clients["validation"].call_tool("External_Validator", {
+            "sql_query": generated["sql"]
+        })
+
+    async def _stage_cost_estimate(self, run: PipelineRun) -> Optional[Dict[str, Any]]:
+        """Check the generated SQL's EXPLAIN estimates against the cost gate (optional)"""
+        generated = run.results["generate"]
+        if generated["cached"]:
+            return None
+        return await self.check_cost(generated["sql"])
+
+    async def check_cost(self, sql_query: str) -> Optional[Dict[str, Any]]:
+        """Estimate SQL's cost with EXPLAIN on the SQL server and apply the cost gate
+
+        The SQL server only runs EXPLAIN on single read-only SELECTs. Anything
+        else, or SQL the server can't produce estimates for, gets the
+        ``unknown`` verdict rather than passing as cheap.
+
+        Returns:
+            The estimate plus a ``verdict`` of ``ok``, ``limit``, ``reject``
+            or ``unknown`` and the ``exceeded`` limits, or None if the gate
+            is disabled
+        """
+        if not self.cost_gate["enabled"]:
+            return None
+        if "Estimate_Query_Cost" not in self.clients["sql"].available_tools:
+            return self._unknown_cost(sql_query, "the SQL server can't estimate costs")
+
+        logger.info("Estimating SQL cost")
+        estimate = await self.clients["sql"].call_tool("Estimate_Query_Cost", {
+            "query": sql_query,
+            "timeout": self.stage_timeouts["cost_estimate"]
+        })
+        if not isinstance(estimate, dict):
+            logger.warning(f"Cost estimate unavailable: {estimate}")
+            return self._unknown_cost(sql_query, estimate or "no estimate returned")
+        if estimate.get("estimated_rows") is None and estimate.get("estimated_cost") is None:
+            return self._unknown_cost(sql_query, f"no estimates for dialect {estimate.get('dialect')}", estimate)
+
+        exceeded = []
+        max_rows = self.cost_gate.get("max_estimated_rows")
+        max_cost = self.cost_gate.get("max_estimated_cost")
+        if max_rows and (estimate.get("estimated_rows") or 0) > max_rows:
+            exceeded.append(f"~{estimate['estimated_rows']:,} rows (limit {max_rows:,})")
+        if max_cost and (estimate.get("estimated_cost") or 0) > max_cost:
+            exceeded.append(f"cost {estimate['estimated_cost']:,.0f} (limit {max_cost:,.0f})")
+
+        verdict = "ok"
+        if exceeded:
+            # Estimates only exist for SELECTs, which can be wrapped in a LIMIT
+            verdict = "limit" if self.cost_gate.get("action") == "limit" else "reject"
+            logger.info(f"Cost gate verdict {verdict}: {', '.join(exceeded)}")
+
+        return {**estimate, "verdict": verdict, "exceeded": exceeded}
+
+    def _unknown_cost(self, sql_query: str, reason: str,
+                      estimate: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Cost gate result for SQL without a usable estimate, applying ``cost_gate.on_unknown``
+
+        ``limit`` only applies when the SQL server answered with an
+        ``estimate``, which confirms the SQL is a read-only SELECT.
+        """
+        on_unknown = self.cost_gate.get("on_unknown")
+        verdict = "unknown"
+        if on_unknown == "reject":
+            verdict = "reject"
+        elif on_unknown == "limit" and estimate is not None:
+            verdict = "limit"
+        logger.info(f"Cost gate verdict {verdict}: cost unknown ({reason})")
+
+        return {"estimated_rows": None, "result_rows": None, "estimated_cost": None, **(estimate or {}),
+                "verdict": verdict, "exceeded": [], "unknown": reason}
+
+    @staticmethod
+    def _cost_gate_issue(cost_estimate: Dict[str, Any]) -> str:
+        """Describe why the cost gate didn't pass a query as is"""
+        if cost_estimate["exceeded"]:
+            return f"Estimated query cost exceeds limits: {', '.join(cost_estimate['exceeded'])}"
+        return f"Query cost could not be estimated: {cost_estimate['unknown']}"
+
+    async def _stage_validation(self, run: PipelineRun) -> Dict[str, Any]:
+        """Combine validation verdicts, refining the SQL if it was rejected"""
+        generated = run.results["generate"]
+        if generated["cached"]:
+            prepared = generated["cached"]
+            run.emit("sql", {"sql": prepared["sql"], "confidence": prepared["confidence"], "cached": True})
+            return prepared
+
+        sql_query = generated["sql"]
+        local_result = run.results["local_validation"]
+        validation_result = {"is_valid": local_result["is_valid"], "issues": list(local_result["issues"])}
+
+        # A query that can't be planned against the schema fails like a local rule
+        dry_run = run.results.get("dry_run")
+        if validation_result["is_valid"] and dry_run:
+            validation_result["issues"].extend(dry_run["issues"])
+            validation_result["is_valid"] = dry_run["is_valid"]
+
+        # Same rules as Comprehensive_Validation: external only counts if local passed
+        externally_validated = False
+        if validation_result["is_valid"]:
+            external_result = run.results["external_validation"]
+            if external_result is None:
+                validation_result["issues"].append("Warning: External validation unavailable")
+            elif not external_result.get("is_valid", True):
+                validation_result["is_valid"] = False
+                validation_result["issues"].extend(external_result.get("issues", []))
+            else:
+                externally_validated = True
+
+        # Too expensive to run counts as invalid, so refinement gets a chance to fix it
+        cost_estimate = run.results.get("cost_estimate")
+        if cost_estimate is None and self.cost_gate["enabled"]:
+            cost_estimate = self._unknown_cost(sql_query, "the estimate failed or timed out")
+        if validation_result["is_valid"] and cost_estimate and cost_estimate["verdict"] == "reject":
+            validation_result["is_valid"] = False
+            validation_result["issues"].append(self._cost_gate_issue(cost_estimate))
+
+        # Store original SQL for refinement info
+        original_sql = sql_query
+
+        # Attempt refinement if validation failed
+        refinement_attempted = False
+        refinement_successful = False
+
+        if not validation_result["is_valid"]:
+            logger.info("Validation failed, attempting refinement")
+            refinement_attempted = True
+
+            # Call refinement tool if we implemented it
+            if "Refine_SQL" in self.clients["validation"].available_tools:
+                refined_result = await self.clients["validation"].call_tool("Refine_SQL", {
+                    "sql_query": sql_query,
+                    "issues": validation_result["issues"]
+                })
+
+                if refined_result and refined_result.get("is_valid", False):
+                    logger.info("Refinement successful")
+                    sql_query = refined_result["refined_sql"]
+                    validation_result = refined_result
+                    refinement_successful = True
+
+                    # The refined SQL has to pass the cost gate too
+                    cost_estimate = await self.check_cost(sql_query)
+                    if cost_estimate and cost_estimate["verdict"] == "reject":
+                        refinement_successful = False
+                        validation_result = {
+                            **refined_result,
+                            "is_valid": False,
+                            "issues": [*refined_result.get("issues", []), self._cost_gate_issue(cost_estimate)]
+                        }
+                else:
+                    logger.info("Refinement failed")
+
+            # If validation still fails and no refinement, end the pipeline with an error
+            if not refinement_successful and not validation_result["is_valid"]:
+                raise PipelineAbort({
+                    "error": "SQL validation failed",
+                    "validation": validation_result,
+                    "cost_estimate": cost_estimate,
                     "sql": sql_query,
-                    "agent_type": "medical_expert"
+                    "refinement_info": {
+                        "original_sql": original_sql,
+                        "was_refined": refinement_attempted
+                    }
                 })
-            except Exception as e:
-                logger.warning(f"Failed to get agent insights: {e}")
-
-            return {
-                "answer": answer,
-                "sql": sql_query,
-                "confidence": confidence,
-                "validation": validation_result,
-                "results": query_result,
-                "agent_insights": agent_insights,
-                "refinement_info": {
-                    "original_sql": original_sql,
-                    "was_refined": refinement_attempted and refinement_successful
-                }
+
+        if cost_estimate and cost_estimate["verdict"] == "limit":
+            max_rows = self.cost_gate["auto_limit_rows"]
+            sql_query = limit_sql(sql_query, max_rows)
+            reason = (f"estimate exceeded {', '.join(cost_estimate['exceeded'])}" if cost_estimate["exceeded"]
+                      else f"cost could not be estimated ({cost_estimate['unknown']})")
+            validation_result["issues"].append(f"Warning: Result limited to {max_rows:,} rows; {reason}")
+        elif cost_estimate and cost_estimate["verdict"] == "unknown":
+            validation_result["issues"].append(f"Warning: {self._cost_gate_issue(cost_estimate)}")
+
+        prepared = {
+            "sql": sql_query,
+            "confidence": generated["confidence"],
+            "validation": validation_result,
+            "cost_estimate": cost_estimate,
+            "refinement_info": {
+                "original_sql": original_sql,
+                "was_refined": refinement_attempted and refinement_successful
             }
+        }
+
+        # Cache hits skip every check, so only cache SQL that passed all of them: external
+        # validation ran on this exact SQL (not a refinement) and the cost gate had an estimate
+        fully_checked = (
+            externally_validated
+            and not refinement_attempted
+            and not (cost_estimate and cost_estimate.get("unknown"))
+        )
+        if generated["cache_key"] and fully_checked:
+            self.sql_cache.set(generated["cache_key"], prepared, generated["embedding"])
+
+        run.emit("sql", {"sql": sql_query, "confidence": generated["confidence"]})
+        return prepared
+
+    async def _execute_sql(self, run: PipelineRun, sql_query: str, read_only: bool = False) -> Any:
+        """Execute SQL with the run's requested output format"""
+        execute_params = {"query": sql_query}
+        if run.results.get("output_format"):
+            execute_params["output_format"] = run.results["output_format"]
+        if read_only:
+            execute_params["read_only"] = True
+
+        # The SQL server enforces the remaining time as a statement timeout
+        time_left = self._time_left(run.results.get("deadline"))
+        if time_left is not None:
+            execute_params["timeout"] = time_left
+        query_result = await self.clients["sql"].call_tool("Execute_SQL_Query", execute_params, timeout=time_left)
+
+        if not query_result:
+            raise Exception("Failed to execute SQL query")
+        return query_result
+
+    async def _stage_execute(self, run: PipelineRun) -> Any:
+        """Execute the validated SQL"""
+        logger.info("Executing SQL")
+        return await self._execute_sql(run, run.results["validation"]["sql"])
+
+    async def _stage_speculative_execute(self, run: PipelineRun) -> Any:
+        """Start executing as soon as local validation passes, while external validation runs
+
+        Speculative runs are read-only: the SQL server refuses anything but a
+        single SELECT and runs it in a read-only transaction. If validation
+        later rejects the SQL, the pipeline is aborted, which cancels this
+        stage and discards the result. If refinement changed the SQL, or the
+        speculative run failed, the validated query is executed normally.
+        """
+        generated = run.results["generate"]
+        local_result = run.results["local_validation"]
+        dry_run = run.results["dry_run"]
+        cost_estimate = run.results["cost_estimate"]
+
+        speculate = (
+            not generated["cached"]
+            and local_result is not None
+            and local_result["is_valid"]
+            and (dry_run is None or dry_run["is_valid"])
+            and (not self.cost_gate["enabled"] or (cost_estimate is not None and cost_estimate["verdict"] == "ok"))
+        )
+        if not speculate:
+            await run.result_of("validation")
+            return await self._stage_execute(run)
+
+        logger.info("Speculatively executing SQL while validation completes")
+        speculative = asyncio.create_task(self._execute_sql(run, generated["sql"], read_only=True))
+        try:
+            prepared = await run.result_of("validation")
+        except BaseException:
+            speculative.cancel()
+            raise
+
+        if prepared["sql"] != generated["sql"]:
+            speculative.cancel()
+            logger.info("Validation refined the SQL; discarding speculative result")
+            return await self._execute_sql(run, prepared["sql"])
+
+        result = await speculative
+        if isinstance(result, str) and result.startswith("Error executing query"):
+            # Also covers SQL the server refused to run read-only
+            logger.info("Speculative execution failed; executing validated SQL")
+            return await self._execute_sql(run, prepared["sql"])
+        return result
+
+    async def _stage_answer(self, run: PipelineRun) -> str:
+        """Generate the answer from a compact summary of the results, streaming tokens if requested"""
+        logger.info("Generating answer")
+        answer_params = {
+            "question": run.results["question"],
+            "sql_query": run.results["validation"]["sql"],
+            "results": self.summarize_for_answer(run.results["execute"])
+        }
+
+        answer = None
+        if run.results.get("stream_answer"):
+            async for event in self.clients["ollama"].stream_tool("Generate_Answer", {**answer_params, "stream": True}):
+                if event["type"] == "progress" and event.get("message"):
+                    run.emit("token", {"text": event["message"]})
+                elif event["type"] == "result":
+                    answer = event["content"]
+        else:
+            answer = await self.clients["ollama"].call_tool("Generate_Answer", answer_params)
+
+        if not answer:
+            raise Exception("Failed to generate answer")
+        return answer
+
+    async def _stage_insights(self, run: PipelineRun) -> Any:
+        """Get agent insights on the validated SQL (optional)"""
+        logger.info("Getting agent insights")
+        return await self.clients["agent"].call_tool("Get_Agent_Insights", {
+            "prompt": run.results["question"],
+            "sql": run.results["validation"]["sql"],
+            "agent_type": "medical_expert"
+        })
+
+    @staticmethod
+    def _assemble_response(results: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the query response from completed pipeline results"""
+        prepared = results["validation"]
+        return {
+            "answer": results["answer"],
+            "sql": prepared["sql"],
+            "confidence": prepared["confidence"],
+            "validation": prepared["validation"],
+            "results": results["execute"],
+            "agent_insights": results["insights"],
+            "cost_estimate": prepared.get("cost_estimate"),
+            "refinement_info": prepared["refinement_info"]
+        }
+
+    @staticmethod
+    def _time_left(deadline: Optional[float]) -> Optional[float]:
+        """Seconds until an event-loop-time deadline, or None without one"""
+        if deadline is None:
+            return None
+        return max(0.001, deadline - asyncio.get_running_loop().time())
+
+    async def process_natural_language_query(self, query: str, context: Optional[str] = None,
+                                             output_format: Optional[str] = None,
+                                             timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Process a natural language query using the orchestrated MCP servers
+
+        Args:
+            query: Natural language question
+            context: Optional schema context; fetched from the SQL server if omitted
+            output_format: Optional Execute_SQL_Query result format (csv by default)
+            timeout: Deadline in seconds for the whole pipeline; defaults to
+                ``pipeline.request_timeout``. The remaining time is passed on
+                to the SQL server, and everything still running is cancelled
+                when it expires.
+
+        Concurrent calls for the same normalized question, context and model
+        share a single pipeline run and all receive its result; the run keeps
+        the deadline of the call that started it.
+        """
+        timeout = timeout or self.request_timeout
+        deadline = asyncio.get_running_loop().time() + timeout
+
+        def run_pipeline():
+            return self._run_query_pipeline(query, context, output_format, deadline)
+
+        try:
+            if self.single_flight is None:
+                return await asyncio.wait_for(run_pipeline(), timeout=timeout)
+
+            key = (
+                normalize_question(query),
+                hashlib.sha256((context or "").encode()).hexdigest(),
+                self.model_name,
+                output_format
+            )
+            return await asyncio.wait_for(self.single_flight.run(key, run_pipeline), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Query exceeded its {timeout}s deadline: {query[:50]}")
+            return {"error": f"Query did not complete within its {timeout}s deadline"}
+
+    async def _run_query_pipeline(self, query: str, context: Optional[str], output_format: Optional[str],
+                                  deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Run every pipeline stage for one question and assemble the response"""
+        run = PipelineRun(self._query_stages(), inputs={
+            "question": query,
+            "context": context,
+            "output_format": output_format,
+            "deadline": deadline
+        })
+
+        try:
+            results = await run.execute()
+        except PipelineAbort as e:
+            return e.result
         except Exception as e:
             logger.error(f"Error processing query: {e}")
             return {"error": str(e)}
 
+        return self._assemble_response(results)
+
+    async def stream_natural_language_query(self, query: str, context: Optional[str] = None,
+                                            timeout: Optional[float] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """Process a natural language query, yielding progress events as it runs
+
+        Yields ``(event, data)`` pairs: ``stage`` events as each pipeline
+        stage starts and finishes, ``sql`` once validated SQL is ready,
+        ``token`` for each piece of the answer as the LLM generates it, and a
+        final ``result`` (same shape as process_natural_language_query) or
+        ``error``. The pipeline is bounded by ``timeout`` (default
+        ``pipeline.request_timeout``) the same way as
+        process_natural_language_query; when it expires, the run is cancelled
+        and an ``error`` event ends the stream.
+        """
+        timeout = timeout or self.request_timeout
+        deadline = asyncio.get_running_loop().time() + timeout
+        events: asyncio.Queue = asyncio.Queue()
+        run = PipelineRun(
+            self._query_stages(),
+            inputs={"question": query, "context": context, "stream_answer": True, "deadline": deadline},
+            listener=lambda event, data: events.put_nowait((event, data))
+        )
+        pipeline = asyncio.create_task(run.execute())
+
+        try:
+            while True:
+                next_event = asyncio.ensure_future(events.get())
+                await asyncio.wait({next_event, pipeline}, timeout=self._time_left(deadline),
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if not next_event.done():
+                    next_event.cancel()
+                    if not pipeline.done():
+                        logger.warning(f"Streaming query exceeded its {timeout}s deadline: {query[:50]}")
+                        yield "error", {"error": f"Query did not complete within its {timeout}s deadline"}
+                        return
+                    break
+                yield next_event.result()
+
+            while not events.empty():
+                yield events.get_nowait()
+
+            try:
+                yield "result", self._assemble_response(pipeline.result())
+            except PipelineAbort as e:
+                yield "error", e.result
+            except Exception as e:
+                logger.error(f"Error streaming query: {e}")
+                yield "error", {"error": str(e)}
+        finally:
+            # The consumer went away mid-stream; stop the pipeline too
+            if not pipeline.done():
+                pipeline.cancel()
+
+    async def stream_sql_results(self, query: str, context: Optional[str] = None,
+                                 timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Generate and validate SQL for a question, then stream its results as CSV chunks
+
+        Raises before the first chunk if SQL can't be produced, so callers can
+        still report a proper error status. Errors after streaming has started
+        are emitted in-band as ``# Error:`` comment lines. Whatever remains of
+        ``timeout`` (default ``pipeline.request_timeout``) covers schema
+        retrieval and SQL generation; whatever remains bounds the streamed
+        query, both on the SQL server and for the stream as a whole.
+        """
+        timeout = timeout or self.request_timeout
+        deadline = asyncio.get_running_loop().time() + timeout
+
+        async def prepare() -> Dict[str, Any]:
+            return await self.generate_validated_sql(query, context or await self.get_schema())
+
+        try:
+            prepared = await asyncio.wait_for(prepare(), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise ValueError(f"Query did not complete within its {timeout}s deadline")
+        if "error" in prepared:
+            raise ValueError(prepared["error"])
+
+        yield f"# SQL: {' '.join(prepared['sql'].split())}\n"
+
+        time_left = self._time_left(deadline)
+        async for event in self.clients["sql"].stream_tool("Stream_SQL_Query", {
+            "query": prepared["sql"],
+            "chunk_size": self.stream_chunk_size,
+            "timeout": time_left
+        }, timeout=time_left + STREAM_DEADLINE_GRACE):
+            if event["type"] == "progress":
+                if event.get("message"):
+                    yield event["message"]
+            elif event["content"] and event["content"].startswith("Error executing query"):
+                yield f"# Error: {event['content']}\n"
+            elif event["content"]:
+                yield event["content"]
+
+    async def process_batch(self, questions: List[str], context: Optional[str] = None,
+                            output_format: Optional[str] = None, include_answers: bool = False,
+                            max_concurrency: Optional[int] = None,
+                            timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Process many questions, yielding each item's result as soon as it completes
+
+        Tuned for throughput rather than per-question latency: the schema is
+        fetched once for the whole batch, SQL generation and validation fan
+        out with bounded concurrency, and questions that produce identical SQL
+        share a single execution. Every execution goes through the SQL
+        server's pooled engine for the default connection.
+
+        Args:
+            questions: Natural language questions
+            context: Optional schema context shared by every question
+            output_format: Optional Execute_SQL_Query result format (csv by default)
+            include_answers: Also generate a natural language answer per item
+            max_concurrency: Items in flight at once; defaults to, and is capped
+                at, batch.max_concurrency
+            timeout: Deadline in seconds for the whole batch; defaults to
+                batch.timeout, then ``pipeline.request_timeout``. Executions
+                get the remaining time, and items still unfinished when it
+                expires are cancelled and reported with an error.
+
+        Yields:
+            One dict per question with its ``index`` and ``question``, plus
+            ``sql``, ``confidence``, ``results``, ``refinement_info`` (and
+            ``answer`` if requested), or ``error``
+        """
+        batch_config = self.config.get("batch", {})
+        timeout = timeout or batch_config.get("timeout") or self.request_timeout
+        deadline = asyncio.get_running_loop().time() + timeout
+        # Callers may lower the configured concurrency but never raise it
+        configured_concurrency = batch_config.get("max_concurrency", 8)
+        limit = asyncio.Semaphore(max(1, min(max_concurrency or configured_concurrency, configured_concurrency)))
+        schema = context or await self.get_schema()
+
+        # Normalized SQL -> shared execution task
+        executions: Dict[str, asyncio.Task] = {}
+
+        def execute_once(sql_query: str) -> asyncio.Task:
+            key = " ".join(sql_query.split()).rstrip(";")
+            if key not in executions:
+                time_left = self._time_left(deadline)
+                execute_params = {"query": sql_query, "timeout": time_left}
+                if output_format:
+                    execute_params["output_format"] = output_format
+                executions[key] = asyncio.create_task(
+                    self.clients["sql"].call_tool("Execute_SQL_Query", execute_params, timeout=time_left)
+                )
+            return executions[key]
+
+        async def process_item(index: int, question: str) -> Dict[str, Any]:
+            item: Dict[str, Any] = {"index": index, "question": question}
+            try:
+                async with limit:
+                    prepared = await self.generate_validated_sql(question, schema)
+                if "error" in prepared:
+                    item["error"] = prepared["error"]
+                    return item
+
+                # Shielded so one cancelled item can't cancel an execution other items share
+                query_result = await asyncio.shield(execute_once(prepared["sql"]))
+                if not query_result:
+                    raise Exception("Failed to execute SQL query")
+
+                item.update({
+                    "sql": prepared["sql"],
+                    "confidence": prepared["confidence"],
+                    "results": query_result,
+                    "refinement_info": prepared["refinement_info"]
+                })
+
+                if include_answers:
+                    async with limit:
+                        item["answer"] = await self.clients["ollama"].call_tool("Generate_Answer", {
+                            "question": question,
+                            "sql_query": prepared["sql"],
+                            "results": self.summarize_for_answer(query_result)
+                        })
+            except Exception as e:
+                logger.error(f"Error processing batch item {index}: {e}")
+                item["error"] = str(e)
+            return item
+
+        tasks = [asyncio.create_task(process_item(index, question)) for index, question in enumerate(questions)]
+        reported = set()
+        try:
+            try:
+                for next_item in asyncio.as_completed(tasks, timeout=self._time_left(deadline)):
+                    item = await next_item
+                    reported.add(item["index"])
+                    yield item
+            except asyncio.TimeoutError:
+                logger.warning(f"Batch exceeded its {timeout}s deadline with {len(tasks) - len(reported)} items left")
+                for index, task in enumerate(tasks):
+                    if index in reported:
+                        continue
+                    if task.done() and not task.cancelled():
+                        yield task.result()
+                    else:
+                        task.cancel()
+                        yield {"index": index, "question": questions[index],
+                               "error": f"Batch did not complete within its {timeout}s deadline"}
+        finally:
+            # The consumer went away mid-batch; stop the remaining work
+            for task in [*tasks, *executions.values()]:
+                if not task.done():
+                    task.cancel()
+
+        logger.info(f"Batch of {len(questions)} questions ran {len(executions)} distinct queries")
+
 
 # FastAPI application
 app = FastAPI(title="OMCP API")
@@ -256,7 +1122,10 @@ orchestrator = MCPOrchestrator()
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting OMCP Orchestrator")
-    await orchestrator.start_servers()
+    # Boot servers in the background so /health can report partial readiness meanwhile
+    orchestrator.startup_task = asyncio.create_task(orchestrator.start_servers())
+    if orchestrator.reload_watch_interval:
+        orchestrator.watch_task = asyncio.create_task(orchestrator.watch_resources())
 
 
 @app.on_event("shutdown")
@@ -265,6 +1134,42 @@ async def shutdown_event():
     await orchestrator.stop_servers()
 
 
+async def verify_api_key(x_api_key: Optional[str] = Header(None)):
+    """Reject requests without a valid X-API-Key header when ``auth.require_api_key`` is set"""
+    auth_config = orchestrator.config.get("auth", {})
+    if auth_config.get("require_api_key", False) and x_api_key not in auth_config.get("api_keys", []):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or missing API key")
+
+
+def check_output_format(output_format: Optional[str], request: Request):
+    """Refuse ``arrow_file`` to remote callers, who can't open a path on this host"""
+    if output_format == "arrow_file" and (request.client is None or request.client.host not in LOCAL_HOSTS):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="output_format 'arrow_file' returns a server-local path and is only available to local callers"
+        )
+
+
+async def run_unless_disconnected(request: Request, work: Awaitable[Any]) -> Any:
+    """Await an endpoint's work, cancelling it if the HTTP client disconnects first
+
+    Cancellation propagates down to the MCP calls in flight, which tell their
+    servers to stop, so an abandoned request doesn't keep a query running.
+    """
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info("Client disconnected; cancelling its query")
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
 # A2A endpoint
 @app.post("/a2a")
 async def a2a_endpoint(request: Request):
@@ -283,8 +1188,8 @@ async def a2a_endpoint(request: Request):
 
         logger.info(f"A2A request received: {query[:50]}...")
 
-        # Process the query
-        result = await orchestrator.process_natural_language_query(query, context)
+        # Process the query, abandoning it if the caller hangs up
+        result = await run_unless_disconnected(request, orchestrator.process_natural_language_query(query, context))
 
         # Format as A2A response
         if "error" in result:
@@ -323,13 +1228,15 @@ async def a2a_endpoint(request: Request):
 
 # Query endpoint
 @router.post("/query", response_model=NaturalLanguageResponse)
-async def process_query(query: Query):
+async def process_query(query: Query, request: Request):
     """Process a natural language query about the OMOP CDM database"""
     logger.info(f"Received query: {query.question}")
 
     try:
         # Use the orchestrator to process the query
-        result = await orchestrator.process_natural_language_query(query.question, query.context)
+        result = await run_unless_disconnected(request, orchestrator.process_natural_language_query(
+            query.question, query.context, timeout=query.timeout
+        ))
 
         if "error" in result:
             raise HTTPException(
@@ -365,13 +1272,16 @@ async def process_query(query: Query):
 
 # SQL endpoint
 @router.post("/sql", response_model=SQLResult)
-async def execute_sql(query: Query):
+async def execute_sql(query: Query, request: Request):
     """Generate and execute SQL from a natural language query"""
     logger.info(f"Generating SQL for: {query.question}")
+    check_output_format(query.output_format, request)
 
     try:
         # Use the orchestrator to process the query
-        result = await orchestrator.process_natural_language_query(query.question, query.context)
+        result = await run_unless_disconnected(request, orchestrator.process_natural_language_query(
+            query.question, query.context, output_format=query.output_format, timeout=query.timeout
+        ))
 
         if "error" in result:
             raise HTTPException(
@@ -390,7 +1300,7 @@ async def execute_sql(query: Query):
         return SQLResult(
             sql=result["sql"],
             result=result["results"],
-            execution_time=0.0,  # We don't have this from the orchestrator yet
+            execution_time=execution_time_of(result["results"]),
             refinement_info=refinement_info
         )
 
@@ -407,6 +1317,88 @@ async def execute_sql(query: Query):
         )
 
 
+def format_sse(event: str, data: Any) -> str:
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+# Streaming query endpoint
+@router.post("/query/stream")
+async def stream_query(query: Query):
+    """Process a natural language query, streaming stage events and answer tokens as Server-Sent Events"""
+    logger.info(f"Received streaming query: {query.question}")
+
+    async def events():
+        async for event, data in orchestrator.stream_natural_language_query(
+            query.question, query.context, timeout=query.timeout
+        ):
+            yield format_sse(event, data)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# Streaming SQL endpoint
+@router.post("/sql/stream")
+async def stream_sql(query: Query):
+    """Generate SQL from a natural language query and stream its results as CSV"""
+    logger.info(f"Streaming SQL results for: {query.question}")
+
+    chunks = orchestrator.stream_sql_results(query.question, query.context, timeout=query.timeout)
+    try:
+        # Pull the first chunk eagerly so generation/validation errors get a real status code
+        first_chunk = await chunks.__anext__()
+    except StopAsyncIteration:
+        first_chunk = ""
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error streaming SQL: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+    async def body():
+        yield first_chunk
+        try:
+            async for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            logger.error(f"Error while streaming SQL results: {e}")
+            yield f"# Error: {str(e)}\n"
+
+    return StreamingResponse(body(), media_type="text/csv")
+
+
+# Batch query endpoint
+@router.post("/query/batch")
+async def process_query_batch(batch: BatchQuery, request: Request):
+    """Process a list of natural language queries, streaming one NDJSON line per item as it completes"""
+    logger.info(f"Received batch of {len(batch.questions)} queries")
+    check_output_format(batch.output_format, request)
+
+    max_questions = orchestrator.config.get("batch", {}).get("max_questions", 500)
+    if len(batch.questions) > max_questions:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Batch has {len(batch.questions)} questions; the limit is {max_questions}"
+        )
+
+    async def lines():
+        async for item in orchestrator.process_batch(
+            batch.questions,
+            batch.context,
+            output_format=batch.output_format,
+            include_answers=batch.include_answers,
+            max_concurrency=batch.max_concurrency,
+            timeout=batch.timeout
+        ):
+            yield json.dumps(item, default=str) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 # Validation endpoint
 @router.post("/validate", response_model=ValidationResult)
 async def validate_and_refine_sql(query: Query):
@@ -460,14 +1452,72 @@ async def validate_and_refine_sql(query: Query):
         )
 
 
+# Cache statistics endpoint
+@router.get("/cache/stats")
+async def cache_stats():
+    """Report hit/miss counters for the orchestrator and SQL server caches"""
+    stats = {"schema": orchestrator.schema_cache.stats()}
+    if orchestrator.sql_cache:
+        stats["sql"] = orchestrator.sql_cache.stats()
+    if orchestrator.single_flight:
+        stats["single_flight"] = orchestrator.single_flight.stats()
+
+    if "sql" in orchestrator.clients:
+        try:
+            stats["sql_server_schema"] = await orchestrator.clients["sql"].call_tool("Get_Schema_Cache_Stats", {})
+        except Exception as e:
+            logger.warning(f"Failed to get SQL server cache stats: {e}")
+
+    if "validation" in orchestrator.clients:
+        try:
+            stats["validation"] = await orchestrator.clients["validation"].call_tool("Get_Validation_Cache_Stats", {})
+        except Exception as e:
+            logger.warning(f"Failed to get validation cache stats: {e}")
+
+    return stats
+
+
+# Hot reload endpoint
+@app.post("/admin/reload", dependencies=[Depends(verify_api_key)])
+async def admin_reload():
+    """Reload validation rules and the OMOP schema in all MCP server replicas"""
+    try:
+        return await orchestrator.reload_resources()
+    except Exception as e:
+        logger.error(f"Error reloading resources: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "servers": list(orchestrator.clients.keys())
-    }
+    """Health check endpoint
+
+    Reports "healthy" once every configured server has a ready replica,
+    "degraded" while only some do, and responds 503 while none do.
+    """
+    readiness = orchestrator.readiness()
+    ready_count = sum(readiness.values())
+
+    if readiness and ready_count == len(readiness):
+        health_status = "healthy"
+    elif ready_count > 0:
+        health_status = "degraded"
+    else:
+        health_status = "unavailable"
+
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE if health_status == "unavailable" else status.HTTP_200_OK,
+        content={
+            "status": health_status,
+            "servers": [name for name, ready in readiness.items() if ready],
+            "ready": readiness,
+            "replicas": {name: pool.stats() for name, pool in orchestrator.clients.items()}
+        }
+    )
 
 
 # Include the router
@@ -1,30 +1,51 @@
 import asyncio
+import itertools
 import json
-import subprocess
 import logging
-from typing import Dict, Any, Optional, List, Set
+from typing import Dict, Any, Optional, List, Set, AsyncIterator
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("mcp_client")
 
+# MCP protocol revision requested in the initialize handshake
+PROTOCOL_VERSION = "2025-03-26"
+CLIENT_INFO = {"name": "omcp-orchestrator", "version": "1.0.0"}
+
 
 class MCPClient:
-    """Client for communicating with MCP servers"""
+    """Client for communicating with MCP servers over stdio JSON-RPC
+
+    The client runs the MCP ``initialize`` handshake, discovers tools with
+    ``tools/list`` and calls them with ``tools/call``. Every request carries
+    a unique ``id`` and the server echoes it back on its response, so many
+    calls can be in flight on the same server at once. A single reader task
+    dispatches each response line to the future registered for its id.
+    """
 
-    def __init__(self, server_name: str, server_process: Optional[subprocess.Popen] = None):
+    def __init__(self, server_name: str, server_process: Optional[asyncio.subprocess.Process] = None,
+                 discovery_timeout: float = 5):
         self.name = server_name
         self.process = server_process
-        self.request_queue = asyncio.Queue()
-        self.response_queue = asyncio.Queue()
+        self.discovery_timeout = discovery_timeout
         self.running = False
-        self.task = None
+        self.ready = False  # Set once the server has successfully answered a request
+        self.reader_task = None
+        self.stderr_task = None
         self.available_tools: Set[str] = set()  # Track available tools
+        self._output_schemas: Dict[str, Dict[str, Any]] = {}  # Tool name -> outputSchema from tools/list
+        self._handshake: Optional[asyncio.Task] = None
+        self._request_ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._streams: Dict[int, asyncio.Queue] = {}  # Progress queues for streaming calls
+        self._write_lock = asyncio.Lock()
 
     async def start(self):
         """Start the client and communication tasks"""
         self.running = True
-        self.task = asyncio.create_task(self._process_queue())
+        if self.process:
+            self.reader_task = asyncio.create_task(self._read_responses())
+            self.stderr_task = asyncio.create_task(self._drain_stderr())
 
         # Discover available tools
         await self._discover_tools()
@@ -32,132 +53,524 @@ class MCPClient:
     async def stop(self):
         """Stop the client and kill server process if needed"""
         self.running = False
-        if self.task:
-            self.task.cancel()
-            try:
-                await self.task
-            except asyncio.CancelledError:
-                pass
+        for task in (self._handshake, self.reader_task, self.stderr_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
 
-        if self.process:
+        self._fail_pending(ConnectionError(f"MCP server '{self.name}' stopped"))
+
+        if self.process and self.process.returncode is None:
             self.process.terminate()
             try:
-                self.process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
+                await asyncio.wait_for(self.process.wait(), timeout=5)
+            except asyncio.TimeoutError:
                 self.process.kill()
+                await self.process.wait()
+
+    @property
+    def in_flight(self) -> int:
+        """Number of requests sent to the server that are still awaiting a response"""
+        return len(self._pending)
 
-    async def call_tool(self, tool_name: str, parameters: Dict[str, Any]) -> Any:
+    @property
+    def is_alive(self) -> bool:
+        """Whether the client is running and its server process hasn't exited"""
+        return self.running and self.process is not None and self.process.returncode is None
+
+    async def call_tool(self, tool_name: str, parameters: Dict[str, Any], timeout: Optional[float] = None) -> Any:
         """Call a tool on the MCP server
 
+        If the call times out or the caller is cancelled, a
+        ``notifications/cancelled`` message for the request is sent so the
+        server can stop working on it.
+
         Args:
             tool_name: The name of the tool to call
             parameters: Parameters to pass to the tool
+            timeout: Optional seconds to wait for the result
 
         Returns:
-            Tool execution result
+            Tool execution result, the error text if the tool failed, or
+            None if the server rejected the request
+
+        Raises:
+            TimeoutError: If the server doesn't answer within ``timeout``
         """
         if tool_name not in self.available_tools:
             logger.warning(f"Tool '{tool_name}' not available in server '{self.name}'")
             return None
 
-        request = {
-            "version": "v1",
-            "tool_calls": [
-                {
-                    "name": tool_name,
-                    "parameters": parameters
-                }
-            ]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+        await self._wait_initialized(timeout)
+
+        response = await self._send_request(
+            self._tool_call(tool_name, parameters),
+            timeout=max(0.001, deadline - loop.time()) if deadline is not None else None
+        )
+        return self._tool_result(tool_name, response)
+
+    async def stream_tool(self, tool_name: str, parameters: Dict[str, Any], max_buffered: int = 256,
+                          timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Call a tool and yield its progress messages as they arrive
+
+        The request carries the call's id as ``params._meta.progressToken``; the
+        server's ``notifications/progress`` messages for that token are
+        yielded as ``{"type": "progress", ...}`` events carrying their
+        ``progress``, ``total`` and ``message`` fields, followed by one
+        ``{"type": "result", "content": ...}`` event. The shared reader never
+        waits for a consumer: if more than ``max_buffered`` messages pile up
+        undelivered, the stream fails with an OverflowError and the call is
+        cancelled on the server, so a stalled consumer can't hold up other
+        calls on this server.
+
+        Args:
+            tool_name: The name of the tool to call
+            parameters: Parameters to pass to the tool
+            max_buffered: Maximum number of undelivered messages to buffer
+            timeout: Optional limit in seconds for the whole call; when it
+                expires the call is cancelled on the server and TimeoutError
+                is raised
+        """
+        if tool_name not in self.available_tools:
+            logger.warning(f"Tool '{tool_name}' not available in server '{self.name}'")
+            return
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+        await self._wait_initialized(timeout)
+
+        request_id = next(self._request_ids)
+        request = {"id": request_id, **self._tool_call(tool_name, parameters)}
+        request["params"]["_meta"] = {"progressToken": request_id}
+
+        # Progress messages arrive on the queue; the final response (or an error) on the future
+        outcome = loop.create_future()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffered)
+        self._pending[request_id] = outcome
+        self._streams[request_id] = queue
+        finished = False
+        try:
+            await self._write_line(json.dumps(request))
+            while True:
+                if queue.empty() and not outcome.done():
+                    time_left = max(0.0, deadline - loop.time()) if deadline is not None else None
+                    next_message = asyncio.ensure_future(queue.get())
+                    await asyncio.wait({next_message, outcome}, timeout=time_left,
+                                       return_when=asyncio.FIRST_COMPLETED)
+                    if not next_message.done():
+                        next_message.cancel()
+                        if not outcome.done():
+                            raise TimeoutError(f"MCP server '{self.name}' did not finish {tool_name} within {timeout}s")
+                        continue
+                    progress = next_message.result()
+                elif not queue.empty():
+                    # Messages queued before the response are delivered first
+                    progress = queue.get_nowait()
+                else:
+                    response = outcome.result()  # Raises transport or overflow errors
+                    finished = True
+                    yield {"type": "result", "content": self._tool_result(tool_name, response)}
+                    return
+
+                yield {"type": "progress", **progress}
+        finally:
+            self._pending.pop(request_id, None)
+            self._streams.pop(request_id, None)
+            while not queue.empty():
+                queue.get_nowait()
+            if not finished:
+                # The consumer stopped reading early or time ran out; let the server stop too
+                self._send_cancel(request_id, "Stream closed before the call completed")
+
+    @staticmethod
+    def _tool_call(tool_name: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """Build a ``tools/call`` request (without its id)"""
+        return {
+            "jsonrpc": "2.0",
+            "method": "tools/call",
+            "params": {"name": tool_name, "arguments": parameters}
+        }
+
+    def _tool_result(self, tool_name: str, response: Dict[str, Any]) -> Any:
+        """Unpack a ``tools/call`` response into the value the tool returned
+
+        FastMCP sends structured content for annotated return types, wrapping
+        anything that isn't an object as ``{"result": value}`` under an
+        ``<function>Output`` schema. Without structured content the text
+        blocks are used, decoding JSON objects and arrays. Tool errors come
+        back as their error text, like the error strings tools return
+        themselves.
+        """
+        if "error" in response:
+            logger.warning(f"MCP server '{self.name}' rejected {tool_name}: {response['error'].get('message')}")
+            return None
+
+        result = response.get("result") or {}
+        texts = [block.get("text", "") for block in result.get("content") or [] if block.get("type") == "text"]
+        if result.get("isError"):
+            return "\n".join(texts)
+
+        structured = result.get("structuredContent")
+        if structured is not None:
+            schema = self._output_schemas.get(tool_name) or {}
+            wrapped = (set(schema.get("properties", {})) == {"result"}
+                       and str(schema.get("title", "")).endswith("Output"))
+            return structured.get("result") if wrapped else structured
+
+        values = []
+        for text in texts:
+            try:
+                value = json.loads(text)
+            except ValueError:
+                value = text
+            # A lone JSON scalar is more likely a string result that happens to parse
+            values.append(value if len(texts) > 1 or isinstance(value, (dict, list)) else text)
+        if not values:
+            return None
+        return values[0] if len(values) == 1 else values
+
+    async def _wait_initialized(self, timeout: Optional[float] = None):
+        """Wait for a handshake that is still running, e.g. after a missed discovery deadline"""
+        if self._handshake is not None and not self._handshake.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(self._handshake), timeout=timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"MCP server '{self.name}' did not finish initializing within {timeout}s")
+
+    async def _send_request(self, request: Dict[str, Any],
+                            timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Send a JSON-RPC request tagged with a fresh id and wait for its matching response
+
+        Tool calls abandoned before their response arrives (timeout or
+        cancellation) are cancelled on the server.
+        """
+        request_id = next(self._request_ids)
+        request = {"jsonrpc": "2.0", "id": request_id, **request}
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        answered = False
+        try:
+            await self._write_line(json.dumps(request))
+            try:
+                response = await asyncio.wait_for(future, timeout=timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"MCP server '{self.name}' did not answer within {timeout}s")
+            answered = True
+            return response
+        finally:
+            self._pending.pop(request_id, None)
+            if not answered and request.get("method") == "tools/call":
+                self._send_cancel(request_id, "Request timed out or was cancelled by the client")
+
+    def _send_cancel(self, request_id: int, reason: str):
+        """Tell the server to stop working on a request nobody is waiting for
+
+        Sent as an MCP ``notifications/cancelled`` message, on which the
+        server cancels the request's handler. Written without the
+        write lock or a drain so it also works from a cancelled task; a
+        single write call never interleaves with another request line.
+        """
+        if not self.is_alive:
+            return
+
+        message = {
+            "jsonrpc": "2.0",
+            "method": "notifications/cancelled",
+            "params": {"requestId": request_id, "reason": reason}
         }
+        try:
+            self.process.stdin.write(f"{json.dumps(message)}\n".encode())
+            logger.debug(f"Sent cancel for request {request_id} to {self.name}")
+        except Exception as e:
+            logger.debug(f"Failed to send cancel to {self.name}: {e}")
 
-        await self.request_queue.put(json.dumps(request))
-        response_text = await self.response_queue.get()
+    def _dispatch_response(self, response_text: str):
+        """Resolve the pending call whose id matches the response
 
+        Progress notifications go to their stream, log notifications to the
+        log, and requests from the server (such as ``ping``) are answered.
+        Never waits on a consumer, so one slow or abandoned stream can't stall
+        responses to every other call on this server.
+        """
         try:
             response = json.loads(response_text)
-            if "results" in response and len(response["results"]) > 0:
-                return response["results"][0]["content"]
-            return None
         except json.JSONDecodeError:
-            logger.error(f"Failed to decode JSON response: {response_text}")
-            return None
+            logger.error(f"Failed to decode JSON response from {self.name}: {response_text}")
+            return
 
-    async def _discover_tools(self):
-        """Discover available tools on the MCP server"""
-        # We'll implement a simple ping/list tools protocol
-        # Send a request with a special tool name to get available tools
-        logger.info(f"Discovering tools for {self.name}")
+        if not isinstance(response, dict):
+            logger.error(f"Unexpected message from {self.name}: {response_text}")
+            return
+
+        method = response.get("method")
+        if method == "notifications/progress":
+            params = dict(response.get("params") or {})
+            token = params.pop("progressToken", None)
+            stream = self._streams.get(token)
+            if stream is not None:
+                self._queue_progress(token, stream, params)
+            return
+        if method == "notifications/message":
+            params = response.get("params") or {}
+            logger.debug(f"[{self.name}] {params.get('level')}: {params.get('data')}")
+            return
+        if method is not None:
+            if "id" in response:
+                self._answer_server_request(response)
+            return
+
+        request_id = response.get("id")
 
+        future = self._pending.get(request_id)
+        if future is None:
+            # Late replies to calls that already gave up land here
+            logger.debug(f"Dropping response from {self.name} with unknown id {request_id!r}")
+            return
+
+        # A successful answer to one of our requests proves the server is up,
+        # even a handshake that finished after the discovery deadline
+        if "result" in response:
+            self.ready = True
+
+        if not future.done():
+            future.set_result(response)
+
+    def _answer_server_request(self, request: Dict[str, Any]):
+        """Reply to a request the server sent us; only ``ping`` is supported"""
+        if request["method"] == "ping":
+            reply = {"jsonrpc": "2.0", "id": request["id"], "result": {}}
+        else:
+            reply = {"jsonrpc": "2.0", "id": request["id"],
+                     "error": {"code": -32601, "message": f"Method not found: {request['method']}"}}
         try:
-            if not self.process:
-                logger.warning(f"No process for {self.name}, can't discover tools")
-                return
+            self.process.stdin.write(f"{json.dumps(reply)}\n".encode())
+        except Exception as e:
+            logger.debug(f"Failed to answer {request['method']} from {self.name}: {e}")
 
-            # Send a special request to list tools
-            # In a real implementation, you'd use the MCP protocol's tool discovery capability
-            discovery_request = {
-                "version": "v1",
-                "command": "discover_tools"
-            }
+    def _queue_progress(self, request_id: int, stream: asyncio.Queue, progress: Dict[str, Any]):
+        """Hand a progress message to its stream, failing the stream if its consumer is too far behind"""
+        try:
+            stream.put_nowait(progress)
+        except asyncio.QueueFull:
+            logger.warning(f"Stream {request_id} on {self.name} fell {stream.maxsize} messages behind; cancelling it")
+            self._streams.pop(request_id, None)
+            future = self._pending.get(request_id)
+            if future is not None and not future.done():
+                future.set_exception(OverflowError(
+                    f"Stream consumer fell more than {stream.maxsize} messages behind"
+                ))
+            self._send_cancel(request_id, "Stream consumer fell behind")
 
-            await self.request_queue.put(json.dumps(discovery_request))
-            response_text = await self.response_queue.get()
+    def _fail_pending(self, error: Exception):
+        """Fail every call still waiting for a response"""
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
 
-            try:
-                response = json.loads(response_text)
-                if "tools" in response:
-                    self.available_tools = set(tool["name"] for tool in response["tools"])
-                    logger.info(f"Discovered tools for {self.name}: {self.available_tools}")
-                else:
-                    # For testing, populate with some expected tools based on server name
-                    if self.name == "sql":
-                        self.available_tools = {"Execute_SQL_Query", "Test_Connection", "Get_OMOP_Schema"}
-                    elif self.name == "ollama":
-                        self.available_tools = {"Generate_SQL", "Generate_Explanation", "Generate_Answer",
-                                                "List_Available_Models"}
-                    elif self.name == "validation":
-                        self.available_tools = {"Validate_SQL_Query", "External_Validator", "Comprehensive_Validation"}
-                    elif self.name == "agent":
-                        self.available_tools = {"Get_Agent_Insights", "Get_Available_Agents", "Agent_Health_Check"}
-
-                    logger.info(f"Using default tools for {self.name}: {self.available_tools}")
-            except json.JSONDecodeError:
-                logger.error(f"Failed to decode tool discovery response: {response_text}")
-                # Set default tools for testing
-                if self.name == "sql":
-                    self.available_tools = {"Execute_SQL_Query", "Test_Connection", "Get_OMOP_Schema"}
-                elif self.name == "ollama":
-                    self.available_tools = {"Generate_SQL", "Generate_Explanation", "Generate_Answer",
-                                            "List_Available_Models"}
-                elif self.name == "validation":
-                    self.available_tools = {"Validate_SQL_Query", "External_Validator", "Comprehensive_Validation"}
-                elif self.name == "agent":
-                    self.available_tools = {"Get_Agent_Insights", "Get_Available_Agents", "Agent_Health_Check"}
+    async def _discover_tools(self):
+        """Run the MCP handshake and discover the server's tools
+
+        Doubles as the readiness probe: the client is marked ready when the
+        handshake completes within ``discovery_timeout`` seconds. Otherwise
+        the default tool set is assumed while the handshake keeps running in
+        the background; calls wait for it to finish.
+        """
+        logger.info(f"Discovering tools for {self.name}")
+        if not self.process:
+            logger.warning(f"No process for {self.name}, can't discover tools")
+            return
+
+        self._handshake = asyncio.create_task(self._initialize())
+        try:
+            await asyncio.wait_for(asyncio.shield(self._handshake), timeout=self.discovery_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Tool discovery for {self.name} timed out after {self.discovery_timeout}s")
         except Exception as e:
             logger.error(f"Error discovering tools for {self.name}: {e}")
 
-    async def _process_queue(self):
-        """Process the request queue and communicate with MCP server"""
+        if not self._handshake.done() or self._handshake.cancelled() or self._handshake.exception():
+            self.available_tools = set(DEFAULT_TOOLS.get(self.name, ()))
+            logger.info(f"Using default tools for {self.name}: {self.available_tools}")
+
+    async def _initialize(self):
+        """Send ``initialize``, acknowledge it and list the server's tools"""
+        response = await self._send_request({
+            "method": "initialize",
+            "params": {"protocolVersion": PROTOCOL_VERSION, "capabilities": {}, "clientInfo": CLIENT_INFO}
+        })
+        if "error" in response:
+            raise ConnectionError(f"MCP server '{self.name}' refused to initialize: {response['error']}")
+        await self._write_line(json.dumps({"jsonrpc": "2.0", "method": "notifications/initialized"}))
+
+        tools: List[Dict[str, Any]] = []
+        cursor = None
+        while True:
+            response = await self._send_request({"method": "tools/list", "params": {"cursor": cursor} if cursor else {}})
+            if "error" in response:
+                raise ConnectionError(f"MCP server '{self.name}' failed to list tools: {response['error']}")
+            tools.extend(response["result"].get("tools", []))
+            cursor = response["result"].get("nextCursor")
+            if not cursor:
+                break
+
+        self._output_schemas = {tool["name"]: tool["outputSchema"] for tool in tools if tool.get("outputSchema")}
+        self.available_tools = {tool["name"] for tool in tools}
+        logger.info(f"Discovered tools for {self.name}: {self.available_tools}")
+
+    async def _write_line(self, line: str):
+        """Write one request line to the server, waiting for the pipe to drain"""
         if not self.process:
-            logger.error(f"No process for {self.name}, can't process queue")
-            return
+            raise ConnectionError(f"No process for MCP server '{self.name}'")
 
+        # Serialize writers so concurrent requests never interleave on stdin
+        async with self._write_lock:
+            self.process.stdin.write(f"{line}\n".encode())
+            await self.process.stdin.drain()
+
+    async def _read_responses(self):
+        """Read messages from the MCP server and dispatch responses by id"""
         while self.running:
             try:
-                # Check if there's a request to process
-                if not self.request_queue.empty():
-                    request = await self.request_queue.get()
-
-                    # Write request to process stdin
-                    self.process.stdin.write(f"{request}\n".encode())
-                    self.process.stdin.flush()
-
-                    # Read response from process stdout
-                    response_line = self.process.stdout.readline().decode().strip()
-                    await self.response_queue.put(response_line)
-
-                # Small sleep to prevent CPU spinning
-                await asyncio.sleep(0.01)
-            except Exception as e:
-                logger.error(f"Error in process_queue for {self.name}: {e}")
-                await asyncio.sleep(1)  # Longer sleep on error
\ No newline at end of file
+                line = await self.process.stdout.readline()
+            except ValueError as e:
+                logger.error(f"Oversized response line from {self.name}: {e}")
+                continue
+
+            if not line:
+                logger.error(f"MCP server {self.name} closed its output stream")
+                self._fail_pending(ConnectionError(f"MCP server '{self.name}' exited"))
+                return
+
+            response_text = line.decode().strip()
+            if response_text:
+                self._dispatch_response(response_text)
+
+    async def _drain_stderr(self):
+        """Forward server stderr to the log so a full pipe never stalls the child"""
+        if not self.process.stderr:
+            return
+
+        while True:
+            line = await self.process.stderr.readline()
+            if not line:
+                return
+            logger.debug(f"[{self.name}] {line.decode(errors='replace').rstrip()}")
+
+
+class MCPClientPool:
+    """Pool of replica clients for one MCP server
+
+    Exposes the same ``call_tool``/``available_tools`` interface as a single
+    MCPClient and routes every call to the live replica with the fewest
+    requests in flight.
+    """
+
+    def __init__(self, server_name: str, replicas: Optional[List[MCPClient]] = None):
+        self.name = server_name
+        self.replicas: List[MCPClient] = replicas or []
+        self._next = 0  # Rotates tie-breaking so idle replicas share the load
+
+    @property
+    def available_tools(self) -> Set[str]:
+        """Tools offered by any replica in the pool"""
+        tools: Set[str] = set()
+        for replica in self.replicas:
+            tools |= replica.available_tools
+        return tools
+
+    @property
+    def ready(self) -> bool:
+        """Whether at least one live replica has completed its readiness handshake"""
+        return any(replica.ready and replica.is_alive for replica in self.replicas)
+
+    def add_replica(self, client: MCPClient):
+        """Add a started client to the pool"""
+        self.replicas.append(client)
+
+    def _pick_replica(self) -> MCPClient:
+        """Select the least-busy live replica"""
+        live = ([r for r in self.replicas if r.is_alive and r.ready]
+                or [r for r in self.replicas if r.is_alive]
+                or self.replicas)
+        if not live:
+            raise ConnectionError(f"No replicas available for MCP server '{self.name}'")
+
+        self._next = (self._next + 1) % len(live)
+        rotated = live[self._next:] + live[:self._next]
+        return min(rotated, key=lambda r: r.in_flight)
+
+    async def call_tool(self, tool_name: str, parameters: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        """Call a tool on the least-busy replica
+
+        Args:
+            tool_name: The name of the tool to call
+            parameters: Parameters to pass to the tool
+            timeout: Optional seconds to wait for the result
+
+        Returns:
+            Tool execution result
+        """
+        return await self._pick_replica().call_tool(tool_name, parameters, timeout=timeout)
+
+    async def broadcast(self, tool_name: str, parameters: Dict[str, Any],
+                        timeout: Optional[float] = None) -> List[Any]:
+        """Call a tool on every live replica, e.g. to reload shared resources
+
+        Args:
+            tool_name: The name of the tool to call
+            parameters: Parameters to pass to the tool
+            timeout: Optional seconds to wait for each replica
+
+        Returns:
+            One result per live replica, in replica order; a replica that
+            failed contributes an ``{"error": ...}`` dict
+        """
+        live = [replica for replica in self.replicas if replica.is_alive]
+        results = await asyncio.gather(
+            *(replica.call_tool(tool_name, parameters, timeout=timeout) for replica in live),
+            return_exceptions=True
+        )
+        return [{"error": str(result)} if isinstance(result, Exception) else result for result in results]
+
+    async def stream_tool(self, tool_name: str, parameters: Dict[str, Any], max_buffered: int = 256,
+                          timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a tool call's progress messages from the least-busy replica"""
+        async for event in self._pick_replica().stream_tool(tool_name, parameters, max_buffered, timeout):
+            yield event
+
+    async def stop(self):
+        """Stop every replica in the pool"""
+        await asyncio.gather(*(replica.stop() for replica in self.replicas))
+        self.replicas = []
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Report per-replica liveness and queue depth"""
+        return [
+            {
+                "replica": index,
+                "pid": replica.process.pid if replica.process else None,
+                "alive": replica.is_alive,
+                "ready": replica.ready,
+                "in_flight": replica.in_flight
+            }
+            for index, replica in enumerate(self.replicas)
+        ]
+
+
+# Tools assumed to exist when a server doesn't answer discovery
+DEFAULT_TOOLS: Dict[str, List[str]] = {
+    "sql": ["Execute_SQL_Query", "Stream_SQL_Query", "Estimate_Query_Cost", "Test_Connection",
+            "Get_OMOP_Schema", "Get_Schema_Cache_Stats", "Reload_Resources"],
+    "ollama": ["Generate_SQL", "Generate_Explanation", "Generate_Answer", "Generate_Embedding",
+               "List_Available_Models"],
+    "validation": ["Validate_SQL_Query", "Dry_Run_SQL", "External_Validator", "Comprehensive_Validation",
+                   "Get_Validation_Cache_Stats", "Reload_Resources"],
+    "agent": ["Get_Agent_Insights", "Get_Available_Agents", "Agent_Health_Check"],
+}
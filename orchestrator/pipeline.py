@@ -0,0 +1,150 @@
+import asyncio
+import logging
+from typing import Dict, Any, Callable, Awaitable, Iterable, List, Optional
+
+logger = logging.getLogger("orchestrator.pipeline")
+
+
+class PipelineAbort(Exception):
+    """Raised by a stage to end the pipeline early with a final result"""
+
+    def __init__(self, result: Dict[str, Any]):
+        super().__init__(result.get("error", "Pipeline aborted"))
+        self.result = result
+
+
+class Stage:
+    """A named pipeline step that runs once all of its dependencies have results
+
+    Args:
+        name: Stage name; its result is stored under this key
+        func: Coroutine function receiving the PipelineRun
+        deps: Names of stages (or inputs) that must complete first
+        timeout: Optional limit in seconds for this stage alone
+        optional: If True, failure or timeout yields a None result instead
+            of failing the whole pipeline
+    """
+
+    def __init__(self, name: str, func: Callable[["PipelineRun"], Awaitable[Any]], deps: Iterable[str] = (),
+                 timeout: Optional[float] = None, optional: bool = False):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.timeout = timeout
+        self.optional = optional
+
+
+class PipelineRun:
+    """Executes a DAG of stages, starting each as soon as its dependencies complete
+
+    Independent stages run concurrently, so end-to-end latency follows the
+    longest path rather than the sum of all stages. A failing required stage
+    (or a PipelineAbort) cancels everything still running. Stages can cancel
+    siblings whose results are no longer needed; a cancelled stage's result
+    is None.
+
+    Args:
+        stages: Stages to run
+        inputs: Initial results available to every stage
+        listener: Optional callback receiving ``(event, data)`` for stage
+            transitions and anything stages emit
+    """
+
+    def __init__(self, stages: List[Stage], inputs: Optional[Dict[str, Any]] = None,
+                 listener: Optional[Callable[[str, Dict[str, Any]], None]] = None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.results: Dict[str, Any] = dict(inputs or {})
+        self.listener = listener
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._cancelled: set = set()
+        self._finished: Dict[str, asyncio.Event] = {name: asyncio.Event() for name in self.stages}
+
+    def emit(self, event: str, data: Dict[str, Any]):
+        """Send an event to the listener, if any"""
+        if self.listener is not None:
+            self.listener(event, data)
+
+    def cancel(self, name: str):
+        """Cancel a running or not-yet-started stage; its result becomes None"""
+        if name in self.results:
+            return
+        self._cancelled.add(name)
+        task = self._tasks.get(name)
+        if task is not None:
+            task.cancel()
+
+    async def result_of(self, name: str) -> Any:
+        """Wait for a stage that isn't a declared dependency and return its result
+
+        Lets a stage start early on partial inputs and only block on another
+        stage's result at the point it actually needs it.
+        """
+        if name not in self.results:
+            await self._finished[name].wait()
+        return self.results[name]
+
+    def _record(self, name: str, result: Any):
+        """Store a stage result and wake anything waiting on it"""
+        self.results[name] = result
+        self._finished[name].set()
+
+    async def _run_stage(self, stage: Stage) -> Any:
+        """Run one stage with its timeout, reporting transitions to the listener"""
+        self.emit("stage", {"stage": stage.name, "status": "started"})
+        try:
+            result = await asyncio.wait_for(stage.func(self), timeout=stage.timeout)
+        except asyncio.CancelledError:
+            self.emit("stage", {"stage": stage.name, "status": "cancelled"})
+            raise
+        except PipelineAbort:
+            self.emit("stage", {"stage": stage.name, "status": "completed"})
+            raise
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                e = TimeoutError(f"Stage '{stage.name}' timed out after {stage.timeout}s")
+            self.emit("stage", {"stage": stage.name, "status": "failed", "error": str(e)})
+            if stage.optional:
+                logger.warning(f"Optional stage {stage.name} failed: {e}")
+                return None
+            raise e
+
+        self.emit("stage", {"stage": stage.name, "status": "completed"})
+        return result
+
+    async def execute(self) -> Dict[str, Any]:
+        """Run all stages and return every stage's result keyed by name
+
+        Raises:
+            PipelineAbort: If a stage ended the pipeline early
+            Exception: The error of the first required stage that failed
+        """
+        waiting = dict(self.stages)
+        running: Dict[asyncio.Task, str] = {}
+
+        try:
+            while waiting or running:
+                for name in list(waiting):
+                    if name in self._cancelled:
+                        self._record(name, None)
+                        del waiting[name]
+                    elif all(dep in self.results for dep in waiting[name].deps):
+                        task = asyncio.create_task(self._run_stage(waiting.pop(name)))
+                        self._tasks[name] = task
+                        running[task] = name
+
+                if not running:
+                    if waiting:
+                        raise RuntimeError(f"Pipeline stages with unmet dependencies: {', '.join(waiting)}")
+                    break
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = running.pop(task)
+                    self._record(name, None if task.cancelled() else task.result())
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        return self.results
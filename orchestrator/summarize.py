@@ -0,0 +1,161 @@
+import base64
+import csv
+import io
+import re
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+
+def _parse_csv_result(result_text: str) -> Tuple[List[str], List[str], List[List[str]]]:
+    """Split an Execute_SQL_Query CSV result into comment lines, header and rows"""
+    lines = result_text.splitlines()
+    comments = []
+    while lines and lines[0].startswith("#"):
+        comments.append(lines.pop(0))
+
+    rows = list(csv.reader(lines))
+    if not rows:
+        return comments, [], []
+    return comments, rows[0], rows[1:]
+
+
+def _columns_to_rows(columns: List[Dict[str, Any]]) -> Tuple[List[str], List[List[str]]]:
+    """Convert column-oriented JSON results into a header and string rows"""
+    header = [column["name"] for column in columns]
+    values = [column["values"] for column in columns]
+    rows = [["" if v is None else str(v) for v in row] for row in zip(*values)]
+    return header, rows
+
+
+def _decode_arrow(result: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """Decode an Arrow result into column dicts, or None if pyarrow is unavailable"""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return None
+
+    if result["format"] == "arrow_file":
+        table = pa.ipc.open_file(result["path"]).read_all()
+    else:
+        table = pa.ipc.open_stream(base64.b64decode(result["data"])).read_all()
+    return [{"name": name, "values": table.column(name).to_pylist()} for name in table.column_names]
+
+
+def result_to_csv(result: Any) -> Any:
+    """Render a structured Execute_SQL_Query result as CSV text
+
+    CSV strings pass through unchanged; JSON column results and Arrow
+    results (when pyarrow is installed) are converted. Arrow results that
+    can't be decoded are described by their row count.
+    """
+    if not isinstance(result, dict) or "format" not in result:
+        return result
+
+    columns = result.get("columns") if result["format"] == "json" else _decode_arrow(result)
+    if columns is None:
+        return f"# {result.get('row_count', 0)} rows in {result['format']} format (not decodable here)\n"
+
+    header, rows = _columns_to_rows(columns)
+    output = io.StringIO()
+    output.write(f"# Execution time: {result.get('execution_time', 0):.3f} seconds\n")
+    writer = csv.writer(output, lineterminator="\n")
+    writer.writerow(header)
+    writer.writerows(rows)
+    return output.getvalue()
+
+
+def execution_time_of(result: Any) -> float:
+    """Extract the execution time reported in an Execute_SQL_Query result"""
+    if isinstance(result, dict):
+        return float(result.get("execution_time", 0.0))
+    if isinstance(result, str):
+        match = re.match(r"# Execution time: ([\d.]+) seconds", result)
+        if match:
+            return float(match.group(1))
+    return 0.0
+
+
+def _to_number(value: str) -> Optional[float]:
+    """Parse a CSV cell as a number, or None if it isn't one"""
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _format_value(value: Any) -> str:
+    """Format an aggregate value compactly"""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _column_aggregates(values: List[str], top_k: int) -> Dict[str, Any]:
+    """Compute count, nulls, min, max and top-k values for one column"""
+    present = [v for v in values if v != ""]
+    aggregates: Dict[str, Any] = {"count": len(present), "nulls": len(values) - len(present)}
+    if not present:
+        return aggregates
+
+    numbers = [_to_number(v) for v in present]
+    if all(n is not None for n in numbers):
+        aggregates["min"], aggregates["max"] = min(numbers), max(numbers)
+    else:
+        aggregates["min"], aggregates["max"] = min(present), max(present)
+
+    aggregates["distinct"] = len(set(present))
+    aggregates["top"] = Counter(present).most_common(top_k)
+    return aggregates
+
+
+def summarize_result(result_text: str, max_rows: int = 100, sample_rows: int = 20, top_k: int = 5) -> str:
+    """Compact a CSV query result for inclusion in an LLM prompt
+
+    Results with at most ``max_rows`` rows are returned unchanged. Larger
+    results are replaced by per-column aggregates (count, nulls, min, max,
+    distinct and top-k values) computed over every row, followed by an
+    evenly spaced sample of ``sample_rows`` rows.
+
+    Structured (JSON or Arrow) results are converted to CSV first.
+
+    Args:
+        result_text: Result as returned by Execute_SQL_Query
+        max_rows: Largest result passed through verbatim
+        sample_rows: Number of rows to include in the sample
+        top_k: Number of most frequent values to list per column
+
+    Returns:
+        The original result, or a summary of it
+    """
+    result_text = result_to_csv(result_text)
+    if not isinstance(result_text, str) or result_text.startswith("Error"):
+        return result_text
+
+    comments, header, rows = _parse_csv_result(result_text)
+    if not header or len(rows) <= max_rows:
+        return result_text
+
+    lines = list(comments)
+    lines.append(f"# Result summary: {len(rows)} rows, {len(header)} columns "
+                 f"(aggregates over all rows, sample of {min(sample_rows, len(rows))} rows below)")
+    lines.append("# Column aggregates:")
+    for index, name in enumerate(header):
+        column = [row[index] if index < len(row) else "" for row in rows]
+        aggregates = _column_aggregates(column, top_k)
+        parts = [f"count={aggregates['count']}", f"nulls={aggregates['nulls']}"]
+        if "min" in aggregates:
+            parts.append(f"min={_format_value(aggregates['min'])}")
+            parts.append(f"max={_format_value(aggregates['max'])}")
+            parts.append(f"distinct={aggregates['distinct']}")
+            parts.append("top=" + "; ".join(f"{value} ({count})" for value, count in aggregates["top"]))
+        lines.append(f"#   {name}: " + ", ".join(parts))
+
+    # Evenly spaced sample so it covers the whole result, not just its head
+    step = max(1, len(rows) // max(1, sample_rows))
+    sample = rows[::step][:sample_rows]
+
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+    writer.writerow(header)
+    writer.writerows(sample)
+    return "\n".join(lines) + "\n" + output.getvalue()
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import sys
+
+import pytest_asyncio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from orchestrator.mcp_client import MCPClient
+
+# Minimal stdio JSON-RPC MCP server: answers the handshake, tools/list and a
+# few test tools, each request on its own thread so responses can come back
+# out of order. Tool results are wrapped the way FastMCP wraps them.
+FAKE_SERVER = r"""
+import json, os, sys, threading, time
+
+write_lock = threading.Lock()
+cancelled = []
+TOOLS = ("Echo", "Exit", "Stream", "Cancelled")
+
+def send(message):
+    with write_lock:
+        sys.stdout.write(json.dumps({"jsonrpc": "2.0", **message}) + "\n")
+        sys.stdout.flush()
+
+def reply(request, value):
+    send({"id": request["id"], "result": {
+        "content": [{"type": "text", "text": value if isinstance(value, str) else json.dumps(value)}],
+        "structuredContent": {"result": value},
+        "isError": False,
+    }})
+
+def handle(request):
+    method = request.get("method")
+    if method == "initialize":
+        send({"id": request["id"], "result": {
+            "protocolVersion": request["params"]["protocolVersion"],
+            "capabilities": {"tools": {}},
+            "serverInfo": {"name": "fake", "version": "0"},
+        }})
+        return
+    if method == "tools/list":
+        send({"id": request["id"], "result": {"tools": [{
+            "name": name,
+            "inputSchema": {"type": "object"},
+            "outputSchema": {"type": "object", "title": name.lower() + "Output",
+                             "properties": {"result": {}}, "required": ["result"]},
+        } for name in TOOLS]}})
+        return
+    if method == "notifications/cancelled":
+        cancelled.append(request["params"]["requestId"])
+        return
+    if method != "tools/call":
+        return
+
+    name = request["params"]["name"]
+    params = request["params"]["arguments"]
+    if name not in TOOLS:
+        send({"id": request["id"], "result": {
+            "content": [{"type": "text", "text": f"Unknown tool: {name}"}], "isError": True}})
+        return
+
+    if name == "Exit":
+        os._exit(0)
+
+    if name == "Cancelled":
+        reply(request, list(cancelled))
+        return
+
+    if name == "Stream":
+        token = request["params"]["_meta"]["progressToken"]
+        for index in range(params["chunks"]):
+            if params.get("delay"):
+                time.sleep(params["delay"])
+            send({"method": "notifications/progress",
+                  "params": {"progressToken": token, "progress": index, "message": f"chunk {index}"}})
+        reply(request, "done")
+        return
+
+    time.sleep(params.get("delay", 0))
+    reply(request, params["value"])
+
+for line in sys.stdin:
+    threading.Thread(target=handle, args=(json.loads(line),), daemon=True).start()
+"""
+
+
+async def start_fake_client(name: str = "fake", script: str = FAKE_SERVER,
+                            discovery_timeout: float = 5) -> MCPClient:
+    """Launch a fake server script and return a started client connected to it"""
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-c", script,
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    client = MCPClient(name, process, discovery_timeout=discovery_timeout)
+    await client.start()
+    return client
+
+
+@pytest_asyncio.fixture
+async def client_factory():
+    """Start fake-server clients on demand, stopping them all after the test"""
+    clients = []
+
+    async def start(name: str = "fake", **kwargs) -> MCPClient:
+        client = await start_fake_client(name, **kwargs)
+        clients.append(client)
+        return client
+
+    yield start
+    for client in clients:
+        await client.stop()
+
+
+@pytest_asyncio.fixture
+async def fake_client(client_factory):
+    return await client_factory()
@@ -0,0 +1,159 @@
+import asyncio
+
+import pytest
+
+from orchestrator.mcp_client import MCPClientPool
+
+
+@pytest.mark.asyncio
+async def test_discovery_marks_client_ready(fake_client):
+    assert fake_client.ready
+    assert {"Echo", "Exit"} <= fake_client.available_tools
+
+
+# Answers every request with an error log notification and never responds
+ERROR_ONLY_SERVER = r"""
+import json, sys
+for line in sys.stdin:
+    message = {"jsonrpc": "2.0", "method": "notifications/message",
+               "params": {"level": "error", "data": "Internal Server Error"}}
+    sys.stdout.write(json.dumps(message) + "\n")
+    sys.stdout.flush()
+"""
+
+
+@pytest.mark.asyncio
+async def test_error_notifications_do_not_mark_client_ready(client_factory):
+    client = await client_factory(script=ERROR_ONLY_SERVER, discovery_timeout=0.3)
+    await asyncio.sleep(0.1)  # Let any stray notifications arrive
+
+    assert not client.ready
+    assert client.is_alive
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_are_matched_by_id(fake_client):
+    # Slower calls are sent first, so responses come back in reverse order
+    calls = [fake_client.call_tool("Echo", {"value": i, "delay": 0.3 - i * 0.1}) for i in range(3)]
+    assert await asyncio.gather(*calls) == [0, 1, 2]
+    assert fake_client.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_late_response_after_timeout_is_dropped(fake_client):
+    with pytest.raises(TimeoutError):
+        await fake_client.call_tool("Echo", {"value": "late", "delay": 0.5}, timeout=0.1)
+
+    assert await fake_client.call_tool("Echo", {"value": "next"}) == "next"
+    await asyncio.sleep(0.5)  # Let the late response arrive
+    assert await fake_client.call_tool("Echo", {"value": "after"}) == "after"
+    assert fake_client.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_unknown_tool_returns_none(fake_client):
+    assert await fake_client.call_tool("Missing", {}) is None
+
+
+@pytest.mark.asyncio
+async def test_tool_error_returns_error_text(fake_client):
+    fake_client.available_tools.add("Gone")  # Listed by the client but unknown to the server
+    assert await fake_client.call_tool("Gone", {}) == "Unknown tool: Gone"
+
+
+@pytest.mark.asyncio
+async def test_server_exit_fails_pending_calls(fake_client):
+    pending = asyncio.ensure_future(fake_client.call_tool("Echo", {"value": 1, "delay": 5}))
+    exiting = asyncio.ensure_future(fake_client.call_tool("Exit", {}))
+
+    for call in (pending, exiting):
+        with pytest.raises(ConnectionError):
+            await asyncio.wait_for(call, timeout=2)
+    assert fake_client.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_delivers_progress_then_result(fake_client):
+    events = [event async for event in fake_client.stream_tool("Stream", {"chunks": 3})]
+
+    assert [event.get("message") for event in events[:-1]] == ["chunk 0", "chunk 1", "chunk 2"]
+    assert events[-1] == {"type": "result", "content": "done"}
+    assert fake_client.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_abandoned_full_stream_does_not_wedge_client(fake_client):
+    stream = fake_client.stream_tool("Stream", {"chunks": 50}, max_buffered=4)
+    await stream.__anext__()
+    await asyncio.sleep(0.2)  # The server has sent everything; the buffer is full
+    await stream.aclose()
+
+    assert await fake_client.call_tool("Echo", {"value": "still alive"}, timeout=2) == "still alive"
+    assert fake_client.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_stream_consumer_does_not_stall_other_calls(fake_client):
+    stream = fake_client.stream_tool("Stream", {"chunks": 50}, max_buffered=4)
+    await stream.__anext__()
+
+    # The reader keeps dispatching while the stream sits unread
+    assert await fake_client.call_tool("Echo", {"value": 1}, timeout=2) == 1
+
+    with pytest.raises(OverflowError):
+        async for _ in stream:
+            pass
+
+
+async def cancelled_ids(client):
+    """Request ids the fake server has received notifications/cancelled for"""
+    await asyncio.sleep(0.1)  # Notifications have no response; give the server time to read them
+    return await client.call_tool("Cancelled", {}, timeout=2)
+
+
+@pytest.mark.asyncio
+async def test_timed_out_call_is_cancelled_on_server(fake_client):
+    call = asyncio.ensure_future(fake_client.call_tool("Echo", {"value": 1, "delay": 1}, timeout=0.2))
+    await asyncio.sleep(0.05)
+    request_id = next(iter(fake_client._pending))
+
+    with pytest.raises(TimeoutError):
+        await call
+    assert await cancelled_ids(fake_client) == [request_id]
+
+
+@pytest.mark.asyncio
+async def test_abandoned_stream_is_cancelled_on_server(fake_client):
+    stream = fake_client.stream_tool("Stream", {"chunks": 5, "delay": 0.1})
+    await stream.__anext__()
+    request_id = next(iter(fake_client._streams))
+    await stream.aclose()
+
+    assert await cancelled_ids(fake_client) == [request_id]
+
+
+@pytest.mark.asyncio
+async def test_stream_timeout_cancels_call(fake_client):
+    events = []
+    with pytest.raises(TimeoutError):
+        async for event in fake_client.stream_tool("Stream", {"chunks": 20, "delay": 0.1}, timeout=0.35):
+            events.append(event)
+
+    assert 1 <= len(events) < 20
+    assert len(await cancelled_ids(fake_client)) == 1
+    assert fake_client.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_pool_routes_to_least_busy_replica(client_factory):
+    first, second = await client_factory("first"), await client_factory("second")
+    pool = MCPClientPool("fake", [first, second])
+
+    slow = asyncio.ensure_future(pool.call_tool("Echo", {"value": "slow", "delay": 0.3}))
+    await asyncio.sleep(0.05)
+    busy = first if first.in_flight else second
+
+    # The next call must avoid the replica that is still busy
+    assert pool._pick_replica() is not busy
+    assert await pool.call_tool("Echo", {"value": "fast"}) == "fast"
+    assert await slow == "slow"
@@ -0,0 +1,180 @@
+import asyncio
+
+import pytest
+
+from orchestrator.pipeline import PipelineAbort, PipelineRun, Stage
+
+
+def returning(value, delay=0.0, log=None, name=None):
+    """Stage function that sleeps, records when it ran, and returns a value"""
+    async def func(run):
+        if log is not None:
+            log.append(("start", name))
+        await asyncio.sleep(delay)
+        if log is not None:
+            log.append(("end", name))
+        return value
+    return func
+
+
+@pytest.mark.asyncio
+async def test_stages_run_after_their_dependencies():
+    async def total(run):
+        return run.results["a"] + run.results["b"] + run.results["base"]
+
+    stages = [
+        Stage("total", total, deps=("a", "b")),
+        Stage("a", returning(1, 0.02), deps=("base",)),
+        Stage("b", returning(2, 0.01)),
+    ]
+    results = await PipelineRun(stages, inputs={"base": 10}).execute()
+
+    assert results["total"] == 13
+    assert results["base"] == 10
+
+
+@pytest.mark.asyncio
+async def test_independent_stages_run_concurrently():
+    log = []
+    stages = [Stage(name, returning(name, 0.1, log, name)) for name in ("a", "b", "c")]
+
+    started = asyncio.get_running_loop().time()
+    await PipelineRun(stages).execute()
+    elapsed = asyncio.get_running_loop().time() - started
+
+    assert elapsed < 0.25
+    assert [event for event, _ in log[:3]] == ["start", "start", "start"]
+
+
+@pytest.mark.asyncio
+async def test_listener_sees_stage_transitions():
+    events = []
+    stages = [Stage("a", returning(1)), Stage("b", returning(2), deps=("a",))]
+    await PipelineRun(stages, listener=lambda event, data: events.append((event, data))).execute()
+
+    assert events == [
+        ("stage", {"stage": "a", "status": "started"}),
+        ("stage", {"stage": "a", "status": "completed"}),
+        ("stage", {"stage": "b", "status": "started"}),
+        ("stage", {"stage": "b", "status": "completed"}),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_abort_ends_pipeline_and_cancels_running_stages():
+    cancelled = asyncio.Event()
+
+    async def abort(run):
+        raise PipelineAbort({"error": "rejected"})
+
+    async def slow(run):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    stages = [Stage("abort", abort), Stage("slow", slow), Stage("after", returning(1), deps=("abort",))]
+    with pytest.raises(PipelineAbort) as excinfo:
+        await PipelineRun(stages).execute()
+
+    assert excinfo.value.result == {"error": "rejected"}
+    assert cancelled.is_set()
+
+
+@pytest.mark.asyncio
+async def test_optional_stage_failure_and_timeout_yield_none():
+    events = []
+
+    async def fail(run):
+        raise ValueError("boom")
+
+    stages = [
+        Stage("failing", fail, optional=True),
+        Stage("slow", returning(1, 1.0), timeout=0.05, optional=True),
+        Stage("after", returning("ran"), deps=("failing", "slow")),
+    ]
+    results = await PipelineRun(stages, listener=lambda event, data: events.append(data)).execute()
+
+    assert results["failing"] is None
+    assert results["slow"] is None
+    assert results["after"] == "ran"
+    failures = {data["stage"]: data["error"] for data in events if data["status"] == "failed"}
+    assert failures == {"failing": "boom", "slow": "Stage 'slow' timed out after 0.05s"}
+
+
+@pytest.mark.asyncio
+async def test_required_stage_failure_cancels_others():
+    cancelled = asyncio.Event()
+
+    async def fail(run):
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def slow(run):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(ValueError, match="boom"):
+        await PipelineRun([Stage("failing", fail), Stage("slow", slow)]).execute()
+    assert cancelled.is_set()
+
+
+@pytest.mark.asyncio
+async def test_required_stage_timeout_fails_pipeline():
+    with pytest.raises(TimeoutError, match="Stage 'slow' timed out"):
+        await PipelineRun([Stage("slow", returning(1, 1.0), timeout=0.05)]).execute()
+
+
+@pytest.mark.asyncio
+async def test_cancel_running_and_pending_stages():
+    async def canceller(run):
+        run.cancel("running")
+        run.cancel("pending")
+        return "done"
+
+    stages = [
+        Stage("running", returning(1, 10)),
+        Stage("gate", returning(None, 0.01)),
+        Stage("canceller", canceller, deps=("gate",)),
+        Stage("pending", returning(2), deps=("canceller", "running")),
+    ]
+    results = await asyncio.wait_for(PipelineRun(stages).execute(), timeout=2)
+
+    assert results["running"] is None
+    assert results["pending"] is None
+    assert results["canceller"] == "done"
+
+
+@pytest.mark.asyncio
+async def test_cancel_after_completion_keeps_result():
+    async def late_cancel(run):
+        run.cancel("early")
+        return True
+
+    stages = [Stage("early", returning("kept")), Stage("late", late_cancel, deps=("early",))]
+    results = await PipelineRun(stages).execute()
+
+    assert results["early"] == "kept"
+
+
+@pytest.mark.asyncio
+async def test_result_of_waits_for_undeclared_stage():
+    async def consumer(run):
+        before = "producer" in run.results
+        value = await run.result_of("producer")
+        return before, value
+
+    stages = [Stage("consumer", consumer), Stage("producer", returning(5, 0.05))]
+    results = await PipelineRun(stages).execute()
+
+    assert results["consumer"] == (False, 5)
+
+
+@pytest.mark.asyncio
+async def test_unmet_dependencies_raise():
+    with pytest.raises(RuntimeError, match="unmet dependencies: a"):
+        await PipelineRun([Stage("a", returning(1), deps=("missing",))]).execute()
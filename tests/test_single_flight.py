@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from orchestrator.cache import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return calls
+
+    results = await asyncio.gather(*(flight.run("key", work) for _ in range(5)))
+
+    assert results == [1] * 5
+    assert flight.stats() == {"in_flight": 0, "calls": 1, "shared": 4}
+
+
+@pytest.mark.asyncio
+async def test_errors_are_shared_and_not_kept():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(flight.run("key", fail), flight.run("key", fail), return_exceptions=True)
+    assert [str(result) for result in results] == ["boom", "boom"]
+
+    async def succeed():
+        return "ok"
+
+    assert await flight.run("key", succeed) == "ok"
+    assert flight.stats()["calls"] == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelling_one_waiter_keeps_call_for_the_others():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    first = asyncio.create_task(flight.run("key", work))
+    second = asyncio.create_task(flight.run("key", work))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert await second == "done"
+    assert first.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_last_waiter_leaving_cancels_the_call():
+    flight = SingleFlight()
+    cancelled = asyncio.Event()
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    waiters = [asyncio.create_task(flight.run("key", work)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    for waiter in waiters:
+        waiter.cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+    assert flight.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_new_caller_after_cancel_starts_a_fresh_call():
+    flight = SingleFlight()
+    started = 0
+
+    async def work():
+        nonlocal started
+        started += 1
+        try:
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            # A slow cancellation leaves the old call running for a while
+            await asyncio.sleep(0.05)
+            raise
+        return "fresh"
+
+    abandoned = asyncio.create_task(flight.run("key", work))
+    await asyncio.sleep(0.01)
+    abandoned.cancel()
+    await asyncio.gather(abandoned, return_exceptions=True)
+
+    # The abandoned call is still winding down; joining it would raise CancelledError
+    assert await flight.run("key", work) == "fresh"
+    assert started == 2
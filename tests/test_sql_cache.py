@@ -0,0 +1,39 @@
+from orchestrator.cache import InMemorySQLCache
+
+SCOPE = ("model", "schema")
+
+
+def key(question):
+    return (question, *SCOPE)
+
+
+def test_find_similar_matches_within_scope_above_threshold():
+    cache = InMemorySQLCache()
+    cache.set(key("patients by age"), {"sql": "a"}, [1.0, 0.0])
+    cache.set(("patients by age", "other", "schema"), {"sql": "other"}, [2.0, 0.1])
+
+    assert cache.find_similar([2.0, 0.1], SCOPE, 0.95) == {"sql": "a"}
+    assert cache.find_similar([0.0, 1.0], SCOPE, 0.95) is None
+
+
+def test_similarity_index_is_capped_to_recent_entries():
+    cache = InMemorySQLCache(max_similar_entries=2)
+    for index in range(3):
+        cache.set(key(f"q{index}"), {"sql": f"s{index}"}, [1.0, float(index)])
+
+    # The oldest entry is still cached, but no longer scanned for similarity
+    assert cache.get(key("q0")) == {"sql": "s0"}
+    assert cache.find_similar([1.0, 0.0], SCOPE, 0.99) is None
+    assert cache.find_similar([1.0, 2.0], SCOPE, 0.99) == {"sql": "s2"}
+    assert cache.stats()["similarity_entries"] == 2
+
+
+def test_evicted_and_replaced_entries_leave_the_similarity_index():
+    cache = InMemorySQLCache(max_entries=1)
+    cache.set(key("q0"), {"sql": "s0"}, [1.0, 0.0])
+    cache.set(key("q1"), {"sql": "s1"}, [0.0, 1.0])
+    assert cache.find_similar([1.0, 0.0], SCOPE, 0.95) is None
+
+    cache.set(key("q1"), {"sql": "s1"})  # Stored again without an embedding
+    assert cache.find_similar([0.0, 1.0], SCOPE, 0.95) is None
+    assert cache.stats()["similarity_entries"] == 0
@@ -0,0 +1,115 @@
+import asyncio
+import os
+import sys
+
+import pytest
+import pytest_asyncio
+
+pytest.importorskip("mcp")
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("duckdb_engine")
+
+import duckdb
+
+from mcp_servers.sql_server import EXPLAIN_STATEMENTS, _duckdb_plan_estimate
+from orchestrator.mcp_client import MCPClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DUCKDB = "duckdb:///:memory:"
+# Counts ten billion rows: minutes of work on every core unless interrupted
+LONG_QUERY = "SELECT count(*) FROM range(10000000000)"
+
+
+@pytest_asyncio.fixture
+async def sql_client():
+    """A client connected to a real sql_server process"""
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, "mcp_servers", "sql_server.py"), cwd=ROOT,
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    client = MCPClient("sql", process, discovery_timeout=30)
+    await client.start()
+    yield client
+    await client.stop()
+
+
+def cpu_seconds(pid: int) -> float:
+    """User plus system CPU time a process has used so far"""
+    with open(f"/proc/{pid}/stat") as stat:
+        fields = stat.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+@pytest.mark.asyncio
+async def test_execute_and_stream_query(sql_client):
+    assert sql_client.ready
+
+    result = await sql_client.call_tool("Execute_SQL_Query", {"query": "SELECT 42 AS answer",
+                                                              "connection_string": DUCKDB}, timeout=30)
+    assert result.splitlines()[1:] == ["answer", "42"]
+
+    events = [event async for event in sql_client.stream_tool(
+        "Stream_SQL_Query", {"query": "SELECT * FROM range(5)", "connection_string": DUCKDB, "chunk_size": 2},
+        timeout=30
+    )]
+    chunks = "".join(event["message"] for event in events if event["type"] == "progress")
+    assert chunks.split() == ["range", "0", "1", "2", "3", "4"]
+    assert "# Rows: 5" in events[-1]["content"]
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/stat"), reason="needs /proc to measure CPU time")
+@pytest.mark.asyncio
+async def test_timed_out_call_stops_the_database_query(sql_client):
+    with pytest.raises(TimeoutError):
+        await sql_client.call_tool("Execute_SQL_Query", {"query": LONG_QUERY, "connection_string": DUCKDB},
+                                   timeout=1)
+
+    await asyncio.sleep(0.5)  # Let the cancel notification reach the query
+    before = cpu_seconds(sql_client.process.pid)
+    await asyncio.sleep(1)
+    assert cpu_seconds(sql_client.process.pid) - before < 0.3
+
+    # The server is still serving other calls
+    result = await sql_client.call_tool("Execute_SQL_Query", {"query": "SELECT 1 AS one",
+                                                              "connection_string": DUCKDB}, timeout=10)
+    assert result.splitlines()[1:] == ["one", "1"]
+
+
+def test_duckdb_cross_join_estimate_multiplies_inputs():
+    connection = duckdb.connect()
+    connection.execute("CREATE TABLE measurement AS SELECT range AS measurement_id FROM range(1000)")
+    connection.execute("CREATE TABLE person AS SELECT range AS person_id FROM range(300)")
+    plan = connection.execute(EXPLAIN_STATEMENTS["duckdb"] + "SELECT count(*) FROM measurement m, person p")
+
+    estimate = _duckdb_plan_estimate(plan.fetchall()[0][-1])
+
+    assert estimate["estimated_rows"] == 300000
+
+
+def test_duckdb_join_without_input_estimates_is_unknown():
+    scan = {"name": "TABLE_SCAN", "children": [], "extra_info": {}}
+    plan = [{"name": "UNGROUPED_AGGREGATE", "extra_info": {}, "children": [
+        {"name": "CROSS_PRODUCT", "extra_info": {}, "children": [
+            scan, {"name": "SEQ_SCAN", "children": [], "extra_info": {"Estimated Cardinality": "300"}}
+        ]}
+    ]}]
+
+    assert _duckdb_plan_estimate(plan)["estimated_rows"] is None
+
+
+@pytest.mark.asyncio
+async def test_estimate_query_cost_covers_cross_products(sql_client):
+    estimate = await sql_client.call_tool("Estimate_Query_Cost", {
+        "query": "SELECT count(*) FROM range(1000) a, range(300) b", "connection_string": DUCKDB
+    }, timeout=30)
+
+    assert estimate["supported"]
+    assert estimate["estimated_rows"] == 300000
+
+
+@pytest.mark.asyncio
+async def test_read_only_execution_refuses_writes(sql_client):
+    for query in ("CREATE TABLE t AS SELECT 1", "SELECT 1; DROP TABLE t", "-- it's\nDELETE FROM t"):
+        result = await sql_client.call_tool("Execute_SQL_Query", {"query": query, "connection_string": DUCKDB,
+                                                                  "read_only": True}, timeout=30)
+        assert result.startswith("Error executing query: read_only queries must be a single read-only SELECT")
@@ -0,0 +1,86 @@
+import pytest
+
+from mcp_servers.ollama_server import SQLStatementDetector
+
+
+def feed_all(tokens):
+    """Feed tokens one by one, returning the detector and the index that completed it"""
+    detector = SQLStatementDetector()
+    for index, token in enumerate(tokens):
+        if detector.feed(token):
+            return detector, index
+    return detector, None
+
+
+def chars(text):
+    return list(text)
+
+
+def test_semicolon_ends_statement():
+    detector, index = feed_all(chars("SELECT 1; SELECT 2;"))
+    assert detector.complete
+    assert detector.statement == "SELECT 1;"
+    # Completion is reported once the held-back characters have arrived
+    assert index is not None and index < len("SELECT 1; SELECT 2;") - 1
+
+
+@pytest.mark.parametrize("text, statement", [
+    ("SELECT ';' AS x; DROP", "SELECT ';' AS x;"),
+    ('SELECT "a;b" FROM t; DROP', 'SELECT "a;b" FROM t;'),
+    ("SELECT 1 -- no; not yet\nFROM t; DROP", "SELECT 1 -- no; not yet\nFROM t;"),
+    ("SELECT /* ; */ 1; DROP", "SELECT /* ; */ 1;"),
+    ("SELECT f(';', (a; b)) FROM t; DROP", "SELECT f(';', (a; b)) FROM t;"),
+])
+def test_semicolons_in_quotes_comments_and_parens_are_ignored(text, statement):
+    detector, _ = feed_all(chars(text))
+    assert detector.complete
+    assert detector.statement == statement
+
+
+def test_leading_semicolon_without_sql_is_ignored():
+    detector, _ = feed_all(chars(";  SELECT 1; x"))
+    assert detector.statement == ";  SELECT 1;"
+
+
+def test_fenced_block_discards_prose_and_ends_at_closing_fence():
+    text = "Here's the query:\n```sql\nSELECT person_id\nFROM person\n```\nThat's all."
+    detector, _ = feed_all(chars(text))
+    assert detector.complete
+    assert detector.statement == "SELECT person_id\nFROM person"
+
+
+def test_semicolon_inside_fence_ends_statement():
+    detector, _ = feed_all(["```sql\n", "SELECT 1;", "\nSELECT 2;\n```"])
+    assert detector.statement == "SELECT 1;"
+
+
+@pytest.mark.parametrize("tokens, statement", [
+    (["```", "sql\nSELECT 1\n`", "``", " more"], "SELECT 1"),
+    (["``", "`sql\nSELECT 1\n``", "`", " more"], "SELECT 1"),
+    (["SELECT 1 -", "- ; comment\n", "FROM t;", " x"], "SELECT 1 -- ; comment\nFROM t;"),
+    (["SELECT 1 /", "* ; */ FROM t;", " x"], "SELECT 1 /* ; */ FROM t;"),
+])
+def test_markers_split_across_tokens(tokens, statement):
+    detector, _ = feed_all(tokens)
+    assert detector.complete
+    assert detector.statement == statement
+
+
+def test_incomplete_statement_is_not_complete_until_finish():
+    detector, index = feed_all(["SELECT person_id ", "FROM person"])
+    assert index is None
+    assert not detector.complete
+    assert detector.finish() == "SELECT person_id FROM person"
+
+
+def test_finish_scans_held_back_semicolon():
+    detector, index = feed_all(["SELECT 1;"])
+    assert index is None
+    assert detector.finish() == "SELECT 1;"
+    assert detector.complete
+
+
+def test_finish_handles_fence_without_language_line():
+    detector = SQLStatementDetector()
+    detector.feed("```")
+    assert detector.finish() == ""
@@ -0,0 +1,176 @@
+import pytest
+
+from mcp_servers.validation_server import (
+    CompiledRules, NeedleAutomaton, analyze_statements, parse_sql, sql_fingerprint, sqlglot, statement_kinds
+)
+
+RULES = {
+    "required_tables": [
+        {"when": "patient", "name": "person"},
+        {"when": "diagnosis", "name": "condition_occurrence"}
+    ],
+    "required_joins": [
+        {"table1": "condition_occurrence", "table2": "person",
+         "condition": "condition_occurrence.person_id = person.person_id"}
+    ],
+    "concept_tables": ["concept"]
+}
+
+needs_sqlglot = pytest.mark.skipif(sqlglot is None, reason="sqlglot is not installed")
+
+
+def test_automaton_finds_overlapping_and_nested_needles():
+    automaton = NeedleAutomaton(["he", "she", "his", "hers", "person", "person_id"])
+
+    assert automaton.find("ushers") == {"she", "he", "hers"}
+    assert automaton.find("select person_id from x") == {"person", "person_id"}
+    assert automaton.find("nothing here") == {"he"}
+    assert automaton.find("") == set()
+
+
+def test_automaton_follows_failure_links():
+    # "abcd" fails at "x" and must fall back to the "bcx" branch without rescanning
+    automaton = NeedleAutomaton(["abcd", "bcx", "c"])
+
+    assert automaton.find("abcx") == {"bcx", "c"}
+    assert automaton.find("abcd") == {"abcd", "c"}
+
+
+def test_automaton_ignores_empty_and_duplicate_needles():
+    automaton = NeedleAutomaton(["", "a", "a"])
+
+    assert automaton.find("banana") == {"a"}
+    assert NeedleAutomaton([]).find("anything") == set()
+
+
+def test_required_table_missing():
+    rules = CompiledRules(RULES)
+
+    is_valid, issues = rules.check("SELECT COUNT(*) FROM condition_occurrence -- patient count")
+    assert not is_valid
+    assert issues[0] == "Missing required table person when querying patient"
+
+
+def test_required_join_condition():
+    rules = CompiledRules(RULES)
+    joined = ("SELECT * FROM condition_occurrence JOIN person "
+              "ON condition_occurrence.person_id=person.person_id WHERE condition_concept_id = 1")
+    unjoined = "SELECT * FROM condition_occurrence, person WHERE condition_concept_id = 1"
+
+    assert rules.check(joined) == (True, [])
+    assert rules.check(unjoined) == (False, ["Missing proper join condition between condition_occurrence and person"])
+
+
+def test_join_condition_matches_across_whitespace():
+    rules = CompiledRules(RULES)
+    sql = ("SELECT * FROM condition_occurrence JOIN person ON condition_occurrence.person_id\n"
+           "    =   person.person_id WHERE condition_concept_id = 1")
+
+    assert rules.check(sql) == (True, [])
+
+
+def test_concept_and_temporal_warnings():
+    rules = CompiledRules(RULES)
+
+    is_valid, issues = rules.check("SELECT concept_name, valid_start_date FROM concept")
+    assert is_valid
+    assert issues == ["Warning: Querying concept without concept_id filter",
+                      "Warning: Temporal query without date range filter"]
+
+    assert rules.check("SELECT concept_name FROM concept WHERE concept_id = 1 AND valid_start_date > '2020-01-01'") \
+        == (True, [])
+
+
+def test_errors_are_reported_in_rule_order():
+    rules = CompiledRules(RULES)
+
+    _, issues = rules.check("SELECT 1 -- diagnosis for each patient")
+    assert issues == ["Missing required table person when querying patient",
+                      "Missing required table condition_occurrence when querying diagnosis"]
+
+
+def test_version_depends_only_on_rule_content():
+    reordered = {key: RULES[key] for key in reversed(list(RULES))}
+    changed = {**RULES, "concept_tables": []}
+
+    assert CompiledRules(RULES).version == CompiledRules(reordered, ("rules.json", 1, 2)).version
+    assert CompiledRules(RULES).version != CompiledRules(changed).version
+
+
+def check_ast(rules, sql):
+    statements, error = parse_sql(sql)
+    assert error is None
+    return rules.check_ast(sql, analyze_statements(statements))
+
+
+@needs_sqlglot
+def test_ast_join_matches_aliases_and_operand_order():
+    rules = CompiledRules(RULES)
+    sql = ("SELECT COUNT(*) FROM person p JOIN condition_occurrence co "
+           "ON p.person_id = co.person_id WHERE co.condition_concept_id = 1")
+
+    assert check_ast(rules, sql) == (True, [])
+    # The text heuristic can't see through the aliases
+    assert not rules.check(sql)[0]
+
+
+@needs_sqlglot
+def test_ast_reports_missing_join_predicate():
+    rules = CompiledRules(RULES)
+    sql = "SELECT * FROM person p, condition_occurrence co WHERE co.condition_concept_id = 1"
+
+    assert check_ast(rules, sql) == (False, ["Missing proper join condition between condition_occurrence and person"])
+
+
+@needs_sqlglot
+def test_ast_ignores_string_literals_and_accepts_key_columns():
+    rules = CompiledRules(RULES)
+
+    # "patient" inside a literal is data, not intent
+    assert check_ast(rules, "SELECT * FROM concept WHERE concept_name = 'patient' AND concept_id = 1") == (True, [])
+    # person_id stands in for the person table
+    assert check_ast(rules, "SELECT COUNT(DISTINCT person_id) FROM observation -- per patient") == (True, [])
+
+
+@needs_sqlglot
+def test_ast_temporal_warning_uses_parsed_range_filter():
+    rules = CompiledRules(RULES)
+
+    assert check_ast(rules, "SELECT observation_date FROM observation") == \
+        (True, ["Warning: Temporal query without date range filter"])
+    assert check_ast(rules, "SELECT observation_date FROM observation WHERE observation_date >= '2020-01-01'") == \
+        (True, [])
+
+
+def test_fingerprint_ignores_literal_values_and_formatting():
+    assert sql_fingerprint("SELECT * FROM person WHERE year_of_birth > 1950 AND gender = 'M'") == \
+        sql_fingerprint("select *\nfrom person where year_of_birth > 1980 and gender = 'it''s'")
+
+
+@pytest.mark.parametrize("first, second", [
+    # An apostrophe in a comment must not open a string that hides the rest of the query
+    ("SELECT 1 -- it's\n; SELECT 'x'", "SELECT 1 -- it's\n; DELETE FROM person WHERE a = 'x'"),
+    ("SELECT 1 /* it's */, 'a'", "SELECT 1 /* it's */; DROP TABLE person"),
+    ('SELECT "o\'brien" FROM t WHERE x = \'a\'', 'SELECT "o\'brien" FROM t; DELETE FROM t WHERE x = \'a\''),
+    ("SELECT * FROM person", "DELETE FROM person"),
+])
+def test_different_statements_never_share_a_fingerprint(first, second):
+    assert sql_fingerprint(first) != sql_fingerprint(second)
+    assert statement_kinds(first) != statement_kinds(second)
+
+
+def test_statement_kinds_skip_comments_and_literals():
+    assert statement_kinds("-- it's; DROP\nSELECT ';DELETE' ; /* ; */ (SELECT 1)") == ("select", "select")
+    assert statement_kinds("SELECT 1; DELETE FROM person;") == ("select", "delete")
+
+
+@needs_sqlglot
+def test_ast_masks_string_literals_after_comment_apostrophe():
+    rules = CompiledRules(RULES)
+    sql = "-- the patient's rows\nSELECT year_of_birth FROM observation WHERE note = 'diagnosis'"
+    statements, _ = parse_sql(sql)
+
+    is_valid, issues = rules.check_ast(sql, analyze_statements(statements))
+
+    assert not is_valid
+    assert len(issues) == 1